@@ -0,0 +1,98 @@
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+
+from archive import to_date
+
+class QueryRejected(Exception):
+    # Запрос не допущен или прерван по таймауту; текст показывается пользователю как есть
+    pass
+
+class AdmissionControl:
+    # Классы запросов: write — записи и чтения с основной базы, read — обычные чтения,
+    # heavy — чтения за длинный период, maintenance — миграции и архивация (0 — без ограничения).
+    # У каждого класса свой таймаут выполнения. Тяжелые чтения ограничены на компанию и в сумме:
+    # сверх лимита ждут не дольше queue_seconds, затем получают отказ. Все чтения вместе не берут
+    # соединения, оставленные в пуле под записи (DB_POOL_WRITE_RESERVE), так что записи не стоят
+    # в очереди за аналитикой
+    def __init__(self, timeouts, heavy_per_company=2, heavy_total=4, queue_seconds=3.0,
+                 heavy_range_days=92, max_range_days=0):
+        self.timeouts = timeouts
+        self.heavy_per_company = heavy_per_company
+        self.queue_seconds = queue_seconds
+        self.heavy_range_days = heavy_range_days
+        self.max_range_days = max_range_days
+        self._total = threading.BoundedSemaphore(heavy_total)
+        self._companies = {}
+        self._counters = Counter()
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def from_env(cls, pool_size):
+        defaults = {'write': 15000, 'read': 15000, 'heavy': 60000, 'maintenance': 0}
+        timeouts = {query_class: int(os.getenv(f'DB_STATEMENT_TIMEOUT_{query_class.upper()}_MS', default))
+                    for query_class, default in defaults.items()}
+        return cls(timeouts,
+                   heavy_per_company=int(os.getenv('HEAVY_READS_PER_COMPANY', 2)),
+                   heavy_total=int(os.getenv('HEAVY_READS_TOTAL', max(pool_size // 2, 1))),
+                   queue_seconds=float(os.getenv('HEAVY_READ_QUEUE_SECONDS', 3)),
+                   heavy_range_days=int(os.getenv('HEAVY_RANGE_DAYS', 92)),
+                   max_range_days=int(os.getenv('MAX_RANGE_DAYS', 0)))
+    
+    def classify(self, start_date=None, end_date=None):
+        # Чтение без начала периода идет по всей истории компании
+        start_date = to_date(start_date)
+        if start_date is None:
+            return 'heavy', None
+        days = ((to_date(end_date) or datetime.now().date()) - start_date).days + 1
+        return ('heavy' if days > self.heavy_range_days else 'read'), days
+    
+    @contextmanager
+    def admit(self, query_class, company_id=None, days=None):
+        if query_class != 'heavy':
+            self._count(query_class, 'admitted')
+            yield
+            return
+        if self.max_range_days and days is None:
+            # Чтение без начала периода шире любого допустимого
+            self._count(query_class, 'rejected_range')
+            raise QueryRejected(f"Укажите начало периода: допустимо не больше {self.max_range_days} дн.")
+        if self.max_range_days and days > self.max_range_days:
+            self._count(query_class, 'rejected_range')
+            raise QueryRejected(f"Период {days} дн. слишком длинный: допустимо не больше {self.max_range_days} дн. "
+                                f"Выберите период короче")
+        
+        with self._lock:
+            company_slots = self._companies.setdefault(company_id, threading.BoundedSemaphore(self.heavy_per_company))
+        deadline = time.monotonic() + self.queue_seconds
+        if not company_slots.acquire(timeout=self.queue_seconds):
+            self._count(query_class, 'rejected_company')
+            raise QueryRejected("У компании уже выполняются тяжелые запросы. Дождитесь их или выберите период короче")
+        try:
+            if not self._total.acquire(timeout=max(deadline - time.monotonic(), 0)):
+                self._count(query_class, 'rejected_busy')
+                raise QueryRejected("Сервер занят тяжелыми запросами. Попробуйте позже или выберите период короче")
+            try:
+                waited = self.queue_seconds - (deadline - time.monotonic())
+                self._count(query_class, 'queued' if waited > 0.05 else 'admitted')
+                yield
+            finally:
+                self._total.release()
+        finally:
+            company_slots.release()
+    
+    def timed_out(self, query_class):
+        self._count(query_class, 'timeout')
+        return QueryRejected(f"Запрос не уложился в {self.timeouts[query_class] / 1000:g} с и был остановлен. "
+                             f"Выберите период короче")
+    
+    def stats(self):
+        with self._lock:
+            return {f'{query_class}.{decision}': count for (query_class, decision), count in sorted(self._counters.items())}
+    
+    def _count(self, query_class, decision):
+        with self._lock:
+            self._counters[(query_class, decision)] += 1
@@ -0,0 +1,56 @@
+import json
+import os
+import queue
+import threading
+import urllib.request
+from datetime import datetime
+
+class AlertSink:
+    # Новые нехватки уходят на локальный вебхук (POST JSON) и/или дописываются в файл JSON Lines.
+    # Отправка идет в фоновом потоке уже после фиксации транзакции: медленный получатель не держит запись
+    def __init__(self, webhook_url=None, file_path=None, timeout=5):
+        self.webhook_url = webhook_url
+        self.file_path = file_path
+        self.timeout = timeout
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='alert-sink', daemon=True)
+        self._thread.start()
+    
+    @classmethod
+    def from_env(cls):
+        webhook_url = os.getenv('ALERT_WEBHOOK_URL')
+        file_path = os.getenv('ALERT_FILE')
+        if not webhook_url and not file_path:
+            return None
+        return cls(webhook_url, file_path, float(os.getenv('ALERT_WEBHOOK_TIMEOUT', 5)))
+    
+    def send(self, alerts):
+        self._queue.put((datetime.now().isoformat(timespec='seconds'), alerts))
+    
+    def stop(self, timeout=None):
+        self._queue.put(None)
+        self._thread.join(timeout)
+    
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            sent_at, alerts = item
+            events = [dict(alert, event='low_stock', sent_at=sent_at) for alert in alerts]
+            if self.file_path:
+                try:
+                    with open(self.file_path, 'a', encoding='utf-8') as f:
+                        for event in events:
+                            f.write(json.dumps(event, ensure_ascii=False) + '\n')
+                except OSError:
+                    pass
+            if self.webhook_url:
+                request = urllib.request.Request(self.webhook_url, method='POST',
+                                                 data=json.dumps({'alerts': events}, ensure_ascii=False).encode('utf-8'),
+                                                 headers={'Content-Type': 'application/json'})
+                try:
+                    urllib.request.urlopen(request, timeout=self.timeout).close()
+                except OSError:
+                    # Недоступный получатель не останавливает поток: сигнал остается в базе и на боковой панели
+                    pass
@@ -0,0 +1,125 @@
+import importlib.util
+import os
+import uuid
+from datetime import datetime, date
+from decimal import Decimal
+
+import pandas as pd
+
+# Архивируемые наборы данных -> колонка даты, по которой режется архив
+ARCHIVE_DATASETS = {
+    'stock_movements': 'movement_date',
+    'production_operations': 'production_date',
+    'production_materials': 'production_date',
+    'expenses': 'expense_date',
+}
+
+ROW_GROUP_SIZE = 50000
+
+def to_date(value):
+    if value is None or value == '':
+        return None
+    if isinstance(value, str):
+        return datetime.strptime(value[:10], '%Y-%m-%d').date()
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    return pd.Timestamp(value).date()
+
+class ColdArchive:
+    # Файлы лежат как <root>/<набор>/company_id=<id>/month=<YYYY-MM>/part-<uuid>.parquet
+    def __init__(self, root_dir, compression='zstd'):
+        self.root_dir = root_dir
+        self.compression = compression
+    
+    @classmethod
+    def from_env(cls):
+        # pyarrow импортируется только при записи и чтении архива, не при старте приложения
+        root_dir = os.getenv('ARCHIVE_DIR')
+        if not root_dir or importlib.util.find_spec('pyarrow') is None:
+            return None
+        return cls(root_dir, os.getenv('ARCHIVE_COMPRESSION', 'zstd'))
+    
+    def _company_dir(self, dataset, company_id):
+        return os.path.join(self.root_dir, dataset, f'company_id={company_id}')
+    
+    def months(self, dataset, company_id):
+        company_dir = self._company_dir(dataset, company_id)
+        if not os.path.isdir(company_dir):
+            return []
+        return sorted(name[len('month='):] for name in os.listdir(company_dir) if name.startswith('month='))
+    
+    def write(self, dataset, company_id, df):
+        if df.empty:
+            return []
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        date_column = ARCHIVE_DATASETS[dataset]
+        df = df.copy()
+        df[date_column] = pd.to_datetime(df[date_column]).dt.date
+        # Decimal из psycopg2 приводим к float, чтобы схема файлов не зависела от данных
+        for column in df.columns:
+            non_null = df[column].dropna()
+            if df[column].dtype == object and not non_null.empty and isinstance(non_null.iloc[0], Decimal):
+                df[column] = df[column].astype(float)
+        
+        written = []
+        months = pd.to_datetime(df[date_column]).dt.strftime('%Y-%m')
+        try:
+            for month, part in df.groupby(months):
+                month_dir = os.path.join(self._company_dir(dataset, company_id), f'month={month}')
+                os.makedirs(month_dir, exist_ok=True)
+                path = os.path.join(month_dir, f'part-{uuid.uuid4().hex}.parquet')
+                table = pa.Table.from_pandas(part.sort_values(date_column), preserve_index=False)
+                pq.write_table(table, path + '.tmp', compression=self.compression, row_group_size=ROW_GROUP_SIZE)
+                os.replace(path + '.tmp', path)
+                written.append(path)
+        except Exception:
+            self.remove(written)
+            raise
+        return written
+    
+    def remove(self, paths):
+        for path in paths:
+            for candidate in (path, path + '.tmp'):
+                if os.path.exists(candidate):
+                    os.remove(candidate)
+    
+    def read(self, dataset, company_id, start_date=None, end_date=None, columns=None):
+        date_column = ARCHIVE_DATASETS[dataset]
+        start, end = to_date(start_date), to_date(end_date)
+        
+        # Отсечение по каталогам месяцев
+        files = []
+        for month in self.months(dataset, company_id):
+            if start and month < start.strftime('%Y-%m'):
+                continue
+            if end and month > end.strftime('%Y-%m'):
+                continue
+            month_dir = os.path.join(self._company_dir(dataset, company_id), f'month={month}')
+            files.extend(os.path.join(month_dir, name) for name in sorted(os.listdir(month_dir))
+                         if name.endswith('.parquet'))
+        if not files:
+            return None
+        
+        import pyarrow as pa
+        import pyarrow.dataset as ds
+        import pyarrow.parquet as pq
+        schema = pa.unify_schemas([pq.read_schema(path) for path in files])
+        dataset_files = ds.dataset(files, schema=schema, format='parquet')
+        if columns is not None:
+            columns = [column for column in columns if column in schema.names]
+        
+        # Фильтр по дате отсекает группы строк по статистике min/max
+        row_filter = None
+        if start:
+            row_filter = ds.field(date_column) >= start
+        if end:
+            end_filter = ds.field(date_column) <= end
+            row_filter = end_filter if row_filter is None else row_filter & end_filter
+        return dataset_files.to_table(columns=columns, filter=row_filter).to_pandas()
+
+if __name__ == '__main__':
+    from database import ProductionDB
+    print(ProductionDB().archive_old_data())
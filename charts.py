@@ -0,0 +1,84 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+# Сколько пикселей приходится на точку: больше точек браузер все равно не покажет.
+# Ширину передает страница — она знает, где и какого размера рисует график
+CHART_PX_PER_POINT = float(os.getenv('CHART_PX_PER_POINT', 2))
+
+def target_points(width_px):
+    return max(int(width_px / CHART_PX_PER_POINT), 3)
+
+def lttb(x, y, n_out):
+    # Largest-Triangle-Three-Buckets: из каждой корзины берется точка, образующая наибольший
+    # треугольник с выбранной точкой предыдущей корзины и средним следующей. Форма линии сохраняется
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    selected = np.empty(n_out, dtype=int)
+    selected[0], selected[-1] = 0, n - 1
+    previous = 0
+    for i in range(n_out - 2):
+        start, end = edges[i], edges[i + 1]
+        next_end = edges[i + 2] if i + 2 < len(edges) else n
+        next_x, next_y = x[end:next_end].mean(), y[end:next_end].mean()
+        area = np.abs((x[previous] - next_x) * (y[start:end] - y[previous])
+                      - (x[previous] - x[start:end]) * (next_y - y[previous]))
+        previous = start + int(np.argmax(area))
+        selected[i + 1] = previous
+    return selected
+
+def minmax(x, y, n_out):
+    # Минимум и максимум каждой корзины: пики не теряются, точек не больше n_out
+    n = len(x)
+    if n_out >= n or n_out < 2:
+        return np.arange(n)
+    edges = np.linspace(0, n, n_out // 2 + 1).astype(int)
+    starts = edges[:-1][edges[:-1] < edges[1:]]
+    low = np.minimum.reduceat(y, starts)
+    high = np.maximum.reduceat(y, starts)
+    bucket = np.repeat(np.arange(len(starts)), np.diff(np.append(starts, n)))
+    first_low = pd.Series(np.arange(n)).where(y == low[bucket]).groupby(bucket).min()
+    first_high = pd.Series(np.arange(n)).where(y == high[bucket]).groupby(bucket).min()
+    return np.unique(np.concatenate([first_low.to_numpy(), first_high.to_numpy()]).astype(int))
+
+def split_budget(lengths, n_out):
+    # Общий бюджет точек делится между рядами поровну. Короткий ряд берет сколько есть,
+    # остаток уходит длинным; каждому ряду достается хотя бы одна точка
+    lengths = np.asarray(lengths, dtype=int)
+    budget = np.zeros(len(lengths), dtype=int)
+    remaining = np.arange(len(lengths))
+    left = n_out
+    while len(remaining):
+        share = max(left // len(remaining), 1)
+        short = lengths[remaining] <= share
+        if not short.any():
+            budget[remaining] = share
+            break
+        budget[remaining[short]] = lengths[remaining[short]]
+        left -= lengths[remaining[short]].sum()
+        remaining = remaining[~short]
+    return budget
+
+def downsample(df, x, y, n_out, group=None, method='lttb'):
+    # Прореживание ряда (или всех рядов группы вместе) до заданного числа точек на весь график
+    if df.empty or len(df) <= n_out:
+        return df
+    select = lttb if method == 'lttb' else minmax
+    groups = [df] if group is None else [part for _, part in df.groupby(group, sort=False)]
+    parts = []
+    for part, budget in zip(groups, split_budget([len(part) for part in groups], n_out)):
+        part = part.sort_values(x)
+        if budget >= len(part):
+            parts.append(part)
+            continue
+        if budget < 3:
+            # Слишком мало точек для выбора по форме: берем равномерно с концами ряда
+            parts.append(part.iloc[np.unique(np.linspace(0, len(part) - 1, budget).round().astype(int))])
+            continue
+        x_values = pd.to_datetime(part[x]).to_numpy(dtype='datetime64[s]').astype(float) \
+            if not np.issubdtype(part[x].dtype, np.number) else part[x].to_numpy(dtype=float)
+        parts.append(part.iloc[select(x_values, part[y].to_numpy(dtype=float), budget)])
+    return pd.concat(parts, ignore_index=True)
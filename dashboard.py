@@ -0,0 +1,105 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+def build_overview(db, company_id):
+    # Все данные страницы «Обзор» одним снимком: показатели, низкие остатки и прогноз.
+    # Последние движения страница дочитывает сама через живую таблицу
+    today = datetime.now().date()
+    month_ago = today - timedelta(days=30)
+    
+    products_df = db.get_products(company_id)
+    expenses_month = db.get_expenses(company_id, month_ago.strftime('%Y-%m-%d'), today.strftime('%Y-%m-%d'))
+    production_month = db.get_production_operations(company_id, month_ago.strftime('%Y-%m-%d'), today.strftime('%Y-%m-%d'))
+    
+    return {
+        'products': products_df,
+        'total_value': float((products_df['current_stock'] * products_df['avg_cost']).sum()) if not products_df.empty else 0.0,
+        'expenses_month': float(expenses_month['amount'].sum()) if not expenses_month.empty else 0.0,
+        'production_count': len(production_month),
+        'low_stock': db.get_open_alerts(company_id),
+        'forecast': db.get_stock_forecast(company_id) if not products_df.empty else None,
+        'built_at': datetime.now(),
+        'built_monotonic': time.monotonic()
+    }
+
+class DashboardRefresher:
+    # Фоновый поток держит снимки «Обзора» теплыми для компаний, которые недавно открывали дашборд.
+    # Снимок пересобирается раз в interval_seconds и сразу после записи в данные компании
+    def __init__(self, db, interval_seconds=60, active_seconds=900):
+        self.db = db
+        self.interval_seconds = interval_seconds
+        self.active_seconds = active_seconds
+        self._snapshots = {}
+        self._last_read = {}
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name='dashboard-refresher', daemon=True)
+        self._thread.start()
+    
+    @classmethod
+    def from_env(cls, db):
+        interval = float(os.getenv('DASHBOARD_REFRESH_SECONDS', 60))
+        if interval <= 0:
+            return None
+        return cls(db, interval, float(os.getenv('DASHBOARD_ACTIVE_SECONDS', 900)))
+    
+    def get(self, company_id):
+        with self._lock:
+            self._last_read[company_id] = time.monotonic()
+            # Пока запись не отражена в снимке, страница читает живые данные и видит свои изменения
+            if company_id in self._dirty:
+                return None
+            return self._snapshots.get(company_id)
+    
+    def refresh(self, company_id):
+        with self._lock:
+            self._dirty.discard(company_id)
+        snapshot = build_overview(self.db, company_id)
+        with self._lock:
+            # Запись, пришедшая во время сборки, снова пометит компанию — снимок пересоберется
+            self._snapshots[company_id] = snapshot
+        return snapshot
+    
+    def mark_dirty(self, *company_ids):
+        with self._lock:
+            active = [company_id for company_id in company_ids if company_id in self._last_read]
+            self._dirty.update(active)
+        if active:
+            self._wakeup.set()
+    
+    def stop(self, timeout=None):
+        self._stopped = True
+        self._wakeup.set()
+        self._thread.join(timeout)
+    
+    def _run(self):
+        next_cycle = time.monotonic() + self.interval_seconds
+        while not self._stopped:
+            self._wakeup.wait(max(next_cycle - time.monotonic(), 0))
+            self._wakeup.clear()
+            if self._stopped:
+                return
+            
+            now = time.monotonic()
+            with self._lock:
+                for company_id, read_at in list(self._last_read.items()):
+                    if now - read_at > self.active_seconds:
+                        self._last_read.pop(company_id)
+                        self._snapshots.pop(company_id, None)
+                        self._dirty.discard(company_id)
+                if now >= next_cycle:
+                    due = set(self._last_read)
+                    next_cycle = now + self.interval_seconds
+                else:
+                    due = set(self._dirty)
+            
+            for company_id in due:
+                try:
+                    self.refresh(company_id)
+                except Exception:
+                    # Старый снимок остается, следующая попытка — по расписанию или после записи
+                    pass
@@ -1,19 +1,351 @@
-import psycopg2
 import pandas as pd
-from datetime import datetime
+from datetime import datetime, timedelta
+from contextlib import contextmanager
+from collections import Counter
+from concurrent.futures import Future
 import bcrypt
+import io
+import itertools
 import os
+import threading
+import time
+from archive import ColdArchive, ARCHIVE_DATASETS, to_date
+from write_queue import GroupCommitQueue
+from recipes import CostRollup, RecipeCycleError
+from planning import material_requirements
+from forecast import ConsumptionForecaster
+from inventory import count_differences
+from dashboard import DashboardRefresher, build_overview
+from reports import ReportJobs
+from fleet import FleetRollup
+from alerts import AlertSink
+from storage import open_backend, execute_prepared, execute_values
+from admission import AdmissionControl
+
+# Таблицы с секционированием по месяцам: таблица -> колонка-ключ секционирования
+PARTITIONED_TABLES = {
+    'stock_movements': 'movement_date',
+    'production_operations': 'production_date',
+    'production_materials': 'production_date',
+}
+
+PARTITIONED_DDL = {
+    'stock_movements': '''
+        CREATE TABLE stock_movements (
+            id SERIAL,
+            company_id INTEGER REFERENCES companies(id) ON DELETE CASCADE,
+            product_id INTEGER REFERENCES products(id),
+            movement_type VARCHAR(10) NOT NULL,
+            quantity DECIMAL(10,2) NOT NULL,
+            price_per_unit DECIMAL(10,2),
+            total_cost DECIMAL(10,2),
+            employee_id INTEGER REFERENCES employees(id),
+            notes TEXT,
+            is_adjustment BOOLEAN DEFAULT FALSE,
+            movement_date DATE NOT NULL,
+            created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (id, movement_date)
+        ) PARTITION BY RANGE (movement_date)
+    ''',
+    'production_operations': '''
+        CREATE TABLE production_operations (
+            id SERIAL,
+            company_id INTEGER REFERENCES companies(id) ON DELETE CASCADE,
+            operation_name VARCHAR(255),
+            employee_id INTEGER REFERENCES employees(id),
+            output_product_id INTEGER REFERENCES products(id),
+            output_quantity DECIMAL(10,2),
+            output_cost DECIMAL(10,2),
+            labor_hours DECIMAL(10,2) DEFAULT 0,
+            labor_cost DECIMAL(12,2),
+            production_date DATE NOT NULL,
+            notes TEXT,
+            created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (id, production_date)
+        ) PARTITION BY RANGE (production_date)
+    ''',
+    'production_materials': '''
+        CREATE TABLE production_materials (
+            id SERIAL,
+            production_id INTEGER,
+            product_id INTEGER REFERENCES products(id),
+            quantity_used DECIMAL(10,2),
+            cost DECIMAL(10,2),
+            production_date DATE NOT NULL,
+            PRIMARY KEY (id, production_date),
+            FOREIGN KEY (production_id, production_date)
+                REFERENCES production_operations(id, production_date) ON DELETE CASCADE
+        ) PARTITION BY RANGE (production_date)
+    ''',
+}
+
+# Перенос данных из старых (несекционированных) таблиц
+PARTITION_MIGRATION_SQL = {
+    'stock_movements': '''
+        INSERT INTO stock_movements (id, company_id, product_id, movement_type, quantity, price_per_unit,
+            total_cost, employee_id, notes, is_adjustment, movement_date, created_date)
+        SELECT id, company_id, product_id, movement_type, quantity, price_per_unit, total_cost, employee_id,
+            notes, is_adjustment, COALESCE(movement_date, created_date::date, CURRENT_DATE), created_date
+        FROM stock_movements_legacy
+    ''',
+    'production_operations': '''
+        INSERT INTO production_operations (id, company_id, operation_name, employee_id, output_product_id,
+            output_quantity, output_cost, labor_hours, labor_cost, production_date, notes, created_date)
+        SELECT id, company_id, operation_name, employee_id, output_product_id, output_quantity, output_cost,
+            labor_hours, labor_cost, COALESCE(production_date, created_date::date, CURRENT_DATE), notes, created_date
+        FROM production_operations_legacy
+    ''',
+    'production_materials': '''
+        INSERT INTO production_materials (id, production_id, product_id, quantity_used, cost, production_date)
+        SELECT pm.id, pm.production_id, pm.product_id, pm.quantity_used, pm.cost,
+            COALESCE(pm.production_date, po.production_date, CURRENT_DATE)
+        FROM production_materials_legacy pm
+        LEFT JOIN production_operations po ON po.id = pm.production_id
+    ''',
+}
+
+MOVEMENTS_QUERY = '''
+    SELECT sm.*, p.name as product_name, u.short_name as unit_name, e.name as employee_name
+    FROM stock_movements sm
+    LEFT JOIN products p ON sm.product_id = p.id
+    LEFT JOIN units u ON p.unit_id = u.id
+    LEFT JOIN employees e ON sm.employee_id = e.id
+    WHERE sm.company_id = %s
+'''
+
+# Синхронизация каталога: колонки файла -> промежуточная таблица -> один upsert по внешнему коду.
+# Повторы кода в файле схлопываются (побеждает последняя строка), неизменившиеся строки не перезаписываются.
+# Счетчики считаются до upsert тем же сравнением, что и его условие обновления
+CATALOG_PRODUCTS_RESOLVED = '''
+    WITH latest AS (
+        SELECT * FROM staging_products
+        WHERE line IN (SELECT MAX(line) FROM staging_products
+                       WHERE external_code IS NOT NULL AND name IS NOT NULL GROUP BY external_code)
+    ), resolved AS (
+        SELECT l.external_code, l.name, l.description, COALESCE(l.min_stock, 0) AS min_stock,
+            COALESCE(l.selling_price, 0) AS selling_price,
+            (SELECT MIN(c.id) FROM categories c WHERE lower(c.name) = lower(l.category)) AS category_id,
+            COALESCE((SELECT MIN(u.id) FROM units u WHERE lower(u.name) = lower(l.unit)),
+                     (SELECT MIN(u.id) FROM units u WHERE lower(u.short_name) = lower(l.unit))) AS unit_id
+        FROM latest l
+    )
+'''
+
+CATALOG_EMPLOYEES_LATEST = '''
+    WITH latest AS (
+        SELECT external_code, name, position, COALESCE(hourly_rate, 0) AS hourly_rate FROM staging_employees
+        WHERE line IN (SELECT MAX(line) FROM staging_employees
+                       WHERE external_code IS NOT NULL AND name IS NOT NULL GROUP BY external_code)
+    )
+'''
+
+CATALOG_SYNC = {
+    'products': {
+        'columns': ['external_code', 'name', 'category', 'unit', 'description', 'min_stock', 'selling_price'],
+        'staging': '''
+            CREATE TEMP TABLE staging_products (
+                line INTEGER, external_code VARCHAR(100), name VARCHAR(255), category VARCHAR(100),
+                unit VARCHAR(50), description TEXT, min_stock DECIMAL(10,2), selling_price DECIMAL(10,2)
+            ) ON COMMIT DROP
+        ''',
+        'counts': CATALOG_PRODUCTS_RESOLVED + '''
+            SELECT (SELECT COUNT(*) FROM staging_products),
+                (SELECT COUNT(*) FROM staging_products WHERE external_code IS NOT NULL AND name IS NOT NULL),
+                (SELECT COUNT(*) FROM latest),
+                COUNT(*), COUNT(*) - COUNT(p.id),
+                COUNT(p.id) FILTER (WHERE (p.name, p.category_id, p.unit_id, p.description, p.min_stock, p.selling_price)
+                    IS DISTINCT FROM (r.name, r.category_id, r.unit_id, r.description, r.min_stock, r.selling_price))
+            FROM resolved r
+            LEFT JOIN products p ON p.company_id = %(company_id)s AND p.external_code = r.external_code
+            WHERE r.category_id IS NOT NULL AND r.unit_id IS NOT NULL
+        ''',
+        'upsert': CATALOG_PRODUCTS_RESOLVED + '''
+            INSERT INTO products (company_id, external_code, name, category_id, unit_id, description,
+                min_stock, selling_price)
+            SELECT %(company_id)s, external_code, name, category_id, unit_id, description, min_stock, selling_price
+            FROM resolved WHERE category_id IS NOT NULL AND unit_id IS NOT NULL
+            ON CONFLICT (company_id, external_code) WHERE external_code IS NOT NULL DO UPDATE SET
+                name = EXCLUDED.name, category_id = EXCLUDED.category_id, unit_id = EXCLUDED.unit_id,
+                description = EXCLUDED.description, min_stock = EXCLUDED.min_stock,
+                selling_price = EXCLUDED.selling_price
+            WHERE (products.name, products.category_id, products.unit_id, products.description,
+                   products.min_stock, products.selling_price)
+                IS DISTINCT FROM (EXCLUDED.name, EXCLUDED.category_id, EXCLUDED.unit_id, EXCLUDED.description,
+                                  EXCLUDED.min_stock, EXCLUDED.selling_price)
+        ''',
+    },
+    'employees': {
+        'columns': ['external_code', 'name', 'position', 'hourly_rate'],
+        'staging': '''
+            CREATE TEMP TABLE staging_employees (
+                line INTEGER, external_code VARCHAR(100), name VARCHAR(255), position VARCHAR(100),
+                hourly_rate DECIMAL(10,2)
+            ) ON COMMIT DROP
+        ''',
+        'counts': CATALOG_EMPLOYEES_LATEST + '''
+            SELECT (SELECT COUNT(*) FROM staging_employees),
+                (SELECT COUNT(*) FROM staging_employees WHERE external_code IS NOT NULL AND name IS NOT NULL),
+                (SELECT COUNT(*) FROM latest),
+                COUNT(*), COUNT(*) - COUNT(e.id),
+                COUNT(e.id) FILTER (WHERE (e.name, e.position, e.hourly_rate)
+                    IS DISTINCT FROM (l.name, l.position, l.hourly_rate))
+            FROM latest l
+            LEFT JOIN employees e ON e.company_id = %(company_id)s AND e.external_code = l.external_code
+        ''',
+        'upsert': CATALOG_EMPLOYEES_LATEST + '''
+            INSERT INTO employees (company_id, external_code, name, position, hourly_rate)
+            SELECT %(company_id)s, external_code, name, position, hourly_rate FROM latest WHERE true
+            ON CONFLICT (company_id, external_code) WHERE external_code IS NOT NULL DO UPDATE SET
+                name = EXCLUDED.name, position = EXCLUDED.position, hourly_rate = EXCLUDED.hourly_rate
+            WHERE (employees.name, employees.position, employees.hourly_rate)
+                IS DISTINCT FROM (EXCLUDED.name, EXCLUDED.position, EXCLUDED.hourly_rate)
+        ''',
+    },
+}
+
+PRODUCTION_QUERY = '''
+    SELECT 
+        po.id, 
+        po.company_id, 
+        po.operation_name, 
+        po.employee_id, 
+        po.output_product_id, 
+        po.output_quantity, 
+        po.output_cost, 
+        po.labor_hours,
+        po.production_date,
+        po.notes, 
+        po.created_date,
+        p.name as output_product_name, 
+        u.short_name as output_unit, 
+        e.name as employee_name
+    FROM production_operations po
+    LEFT JOIN products p ON po.output_product_id = p.id
+    LEFT JOIN units u ON p.unit_id = u.id
+    LEFT JOIN employees e ON po.employee_id = e.id
+    WHERE po.company_id = %s
+'''
+
+def month_start(value):
+    return datetime(value.year, value.month, 1).date()
+
+def add_months(value, months):
+    month_index = value.year * 12 + value.month - 1 + months
+    return datetime(month_index // 12, month_index % 12 + 1, 1).date()
 
 class ProductionDB:
-    def __init__(self, db_url=None):
+    def __init__(self, db_url=None, partition_by_month=None, partition_months_ahead=None, replica_urls=None):
         self.db_url = db_url or os.getenv('DATABASE_URL')
+        if replica_urls is None:
+            replica_urls = os.getenv('DATABASE_REPLICA_URLS', '').split(',')
+        elif isinstance(replica_urls, str):
+            replica_urls = [replica_urls]
+        self.replica_urls = [url.strip() for url in replica_urls if url and url.strip()]
+        self.pool_size = int(os.getenv('DB_POOL_MAX', 10))
+        # Таймауты по классам запросов и лимиты тяжелых чтений на компанию
+        self.admission = AdmissionControl.from_env(self.pool_size)
+        # Хранилище по схеме DATABASE_URL: Postgres или встроенная SQLite (sqlite:///файл.db)
+        # DB_POOL_WRITE_RESERVE соединений основной базы не выдаются чтениям
+        self.backend = open_backend(self.db_url, int(os.getenv('DB_POOL_MIN', 1)), self.pool_size,
+                                    self.admission.timeouts['write'],
+                                    int(os.getenv('DB_POOL_WRITE_RESERVE', max(self.pool_size // 5, 1))))
+        if not self.backend.supports('replicas'):
+            self.replica_urls = []
+        self._replica_cycle = itertools.cycle(self.replica_urls)
+        self._replica_lock = threading.Lock()
+        self.read_your_writes_seconds = float(os.getenv('REPLICA_READ_YOUR_WRITES_SECONDS', 5))
+        self._last_write = {}
+        self._cost_rollups = {}
+        self._cost_rollups_lock = threading.Lock()
+        if partition_by_month is None:
+            partition_by_month = os.getenv('DB_PARTITION_BY_MONTH', '').lower() in ('1', 'true', 'yes')
+        self.partition_by_month = partition_by_month and self.backend.supports('partitioning')
+        self.partition_months_ahead = int(partition_months_ahead or os.getenv('DB_PARTITION_MONTHS_AHEAD', 3))
+        self._partitions_until = None
+        self.archive = ColdArchive.from_env()
+        self.archive_retention_days = int(os.getenv('ARCHIVE_RETENTION_DAYS', 365))
         self.init_database()
+        self.forecaster = ConsumptionForecaster.from_env(self)
+        self.write_queue = GroupCommitQueue.from_env(self)
+        self.dashboard = DashboardRefresher.from_env(self)
+        self.reports = ReportJobs.from_env(self)
+        self.fleet = FleetRollup.from_env(self)
+        self.alert_sink = AlertSink.from_env()
+    
+    # Соединения берутся из пула; close() у полученного соединения возвращает его в пул.
+    # Класс запроса задает таймаут выполнения на время, пока соединение выдано
+    def get_connection(self, query_class='write'):
+        return self.backend.connect(self.admission.timeouts[query_class], read=query_class in ('read', 'heavy'))
+    
+    # Чтения уходят на реплики по кругу; сразу после записи компания читает с основной базы,
+    # чтобы видеть свои изменения, пока реплика догоняет
+    def get_read_connection(self, company_id=None, query_class='read'):
+        if not self.replica_urls or self._recently_written(company_id):
+            return self.get_connection(query_class)
+        with self._replica_lock:
+            replica_url = next(self._replica_cycle)
+        try:
+            return self.backend.connect_replica(replica_url, self.admission.timeouts[query_class])
+        except self.backend.connection_error:
+            return self.get_connection(query_class)
+    
+    # Чтение за период: длинный период идет классом heavy через лимиты компании, превышение
+    # таймаута превращается в QueryRejected с просьбой сузить период. Записи сюда не попадают
+    @contextmanager
+    def _range_read(self, company_id, start_date=None, end_date=None):
+        query_class, days = self.admission.classify(start_date, end_date)
+        with self._admitted_read(company_id, query_class, days) as conn:
+            yield conn
+    
+    @contextmanager
+    def _admitted_read(self, company_id, query_class, days=None):
+        with self.admission.admit(query_class, company_id, days):
+            conn = self.get_read_connection(company_id, query_class)
+            try:
+                yield conn
+            except Exception as e:
+                if self.backend.is_timeout(e):
+                    raise self.admission.timed_out(query_class) from e
+                raise
+            finally:
+                conn.close()
+    
+    def get_admission_stats(self):
+        return self.admission.stats()
+    
+    # Горячие запросы готовятся один раз на соединение и дальше выполняются по имени
+    def _read_prepared(self, conn, name, query, params, coerce_float=True):
+        cursor = execute_prepared(conn.cursor(), name, query, params)
+        columns = [desc[0] for desc in cursor.description]
+        return pd.DataFrame.from_records(cursor.fetchall(), columns=columns, coerce_float=coerce_float)
     
-    def get_connection(self):
-        return psycopg2.connect(self.db_url)
+    def _range_query(self, name, query, date_column, params, start_date, end_date, order_by):
+        # У каждого сочетания границ периода свой подготовленный запрос
+        params = list(params)
+        if start_date:
+            query += f' AND {date_column} >= %s'
+            params.append(start_date)
+        if end_date:
+            query += f' AND {date_column} <= %s'
+            params.append(end_date)
+        query += f' ORDER BY {order_by}'
+        return f'{name}_{int(bool(start_date))}{int(bool(end_date))}', query, params
+    
+    def _recently_written(self, company_id):
+        written_at = self._last_write.get(company_id)
+        return written_at is not None and time.monotonic() - written_at < self.read_your_writes_seconds
+    
+    def _mark_write(self, *company_ids):
+        now = time.monotonic()
+        for company_id in company_ids:
+            self._last_write[company_id] = now
+        self.forecaster.mark_dirty(*company_ids)
+        if self.dashboard is not None:
+            self.dashboard.mark_dirty(*company_ids)
+        self.fleet.mark_dirty(*company_ids)
     
     def init_database(self):
-        conn = self.get_connection()
+        conn = self.get_connection('maintenance')
         cursor = conn.cursor()
         
         # Таблица компаний
@@ -35,6 +367,8 @@ class ProductionDB:
                 created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         ''')
+        # Оператор видит сводку по всем компаниям; права выдаются вручную: UPDATE users SET is_operator = TRUE
+        cursor.execute('ALTER TABLE users ADD COLUMN IF NOT EXISTS is_operator BOOLEAN DEFAULT FALSE')
         
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS units (
@@ -112,6 +446,12 @@ class ProductionDB:
                 created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         ''')
+        # Корректировки инвентаризации не расход: прогноз их не учитывает. Движения, проведенные
+        # до появления признака, опознаются один раз по стандартной пометке инвентаризации
+        cursor.execute('SELECT * FROM stock_movements LIMIT 0')
+        if 'is_adjustment' not in [desc[0] for desc in cursor.description]:
+            cursor.execute('ALTER TABLE stock_movements ADD COLUMN IF NOT EXISTS is_adjustment BOOLEAN DEFAULT FALSE')
+            cursor.execute("UPDATE stock_movements SET is_adjustment = TRUE WHERE notes = 'Инвентаризация'")
         
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS production_operations (
@@ -127,6 +467,12 @@ class ProductionDB:
                 created_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP
             )
         ''')
+        cursor.execute('ALTER TABLE production_operations ADD COLUMN IF NOT EXISTS labor_hours DECIMAL(10,2) DEFAULT 0')
+        # Стоимость труда фиксируется при проведении по ставке на тот момент
+        cursor.execute('SELECT * FROM production_operations LIMIT 0')
+        labor_cost_added = 'labor_cost' not in [desc[0] for desc in cursor.description]
+        if labor_cost_added:
+            cursor.execute('ALTER TABLE production_operations ADD COLUMN IF NOT EXISTS labor_cost DECIMAL(12,2)')
         
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS production_materials (
@@ -137,6 +483,21 @@ class ProductionDB:
                 cost DECIMAL(10,2)
             )
         ''')
+        # Дата операции дублируется в материалах, чтобы секционировать их вместе с операциями
+        cursor.execute('ALTER TABLE production_materials ADD COLUMN IF NOT EXISTS production_date DATE')
+        
+        # Рецептуры: сколько компонента уходит на единицу продукта
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS recipe_items (
+                id SERIAL PRIMARY KEY,
+                company_id INTEGER REFERENCES companies(id) ON DELETE CASCADE,
+                product_id INTEGER REFERENCES products(id) ON DELETE CASCADE,
+                component_id INTEGER REFERENCES products(id),
+                quantity DECIMAL(12,4) NOT NULL,
+                UNIQUE (product_id, component_id)
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_recipe_items_company ON recipe_items (company_id)')
         
         cursor.execute('''
             CREATE TABLE IF NOT EXISTS expenses (
@@ -150,9 +511,270 @@ class ProductionDB:
             )
         ''')
         
+        if self.partition_by_month:
+            self._migrate_to_partitioned(cursor)
+        
+        # Операции, проведенные до появления labor_cost, оцениваются по текущей ставке один раз —
+        # при добавлении колонки
+        if labor_cost_added:
+            cursor.execute('''
+                UPDATE production_operations SET labor_cost = COALESCE(labor_hours, 0) * COALESCE(
+                    (SELECT e.hourly_rate FROM employees e WHERE e.id = production_operations.employee_id), 0)
+                WHERE labor_cost IS NULL
+            ''')
+        
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_stock_movements_company_date ON stock_movements (company_id, movement_date)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_production_operations_company_date ON production_operations (company_id, production_date)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_production_materials_production ON production_materials (production_id)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_stock_movements_company_id ON stock_movements (company_id, id)')
+        # Сводка оператора берет месяц по всем компаниям сразу
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_production_operations_date ON production_operations (production_date)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_expenses_date ON expenses (expense_date)')
+        
+        # Отметка изменения товара для дочитывания изменений: ставится триггером при любой записи
+        if self.backend.supports('plpgsql'):
+            self._create_products_touch_trigger(cursor)
+        else:
+            self._create_products_touch_trigger_sqlite(cursor)
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_products_company_updated ON products (company_id, updated_date)')
+        
+        # Внешний код (ERP) — ключ синхронизации каталога
+        cursor.execute('ALTER TABLE products ADD COLUMN IF NOT EXISTS external_code VARCHAR(100)')
+        cursor.execute('ALTER TABLE employees ADD COLUMN IF NOT EXISTS external_code VARCHAR(100)')
+        cursor.execute('''
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_products_external_code ON products (company_id, external_code)
+            WHERE external_code IS NOT NULL
+        ''')
+        cursor.execute('''
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_employees_external_code ON employees (company_id, external_code)
+            WHERE external_code IS NOT NULL
+        ''')
+        
+        # Дневной агрегат выработки и трудозатрат, обновляется вместе с операциями
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS labor_daily (
+                company_id INTEGER REFERENCES companies(id) ON DELETE CASCADE,
+                day DATE NOT NULL,
+                employee_id INTEGER,
+                output_product_id INTEGER,
+                output_quantity DECIMAL(14,2),
+                labor_hours DECIMAL(12,2),
+                labor_cost DECIMAL(14,2),
+                output_cost DECIMAL(14,2),
+                operations INTEGER
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_labor_daily_company_day ON labor_daily (company_id, day)')
+        # Агрегат строится для каждой компании, у которой есть операции, но нет строк агрегата, —
+        # по дням и под теми же блокировками, что и при проведении
+        cursor.execute('''
+            SELECT c.id FROM companies c
+            WHERE EXISTS (SELECT 1 FROM production_operations po WHERE po.company_id = c.id)
+                AND NOT EXISTS (SELECT 1 FROM labor_daily ld WHERE ld.company_id = c.id)
+        ''')
+        for (company_id,) in cursor.fetchall():
+            cursor.execute('''
+                SELECT DISTINCT production_date FROM production_operations
+                WHERE company_id = %s AND production_date IS NOT NULL
+            ''', (company_id,))
+            self._refresh_labor_daily(cursor, company_id, [row[0] for row in cursor.fetchall()])
+        
+        # Сигналы о нехватке: открытый сигнал — товар сейчас на минимуме или ниже. Сигналы ведутся
+        # вместе с записью остатков; частичные индексы держат выборки пропорциональными числу нехваток
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS stock_alerts (
+                id SERIAL PRIMARY KEY,
+                company_id INTEGER REFERENCES companies(id) ON DELETE CASCADE,
+                product_id INTEGER REFERENCES products(id) ON DELETE CASCADE,
+                opening_stock DECIMAL(10,2),
+                min_stock DECIMAL(10,2),
+                opened_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                closed_date TIMESTAMP
+            )
+        ''')
+        cursor.execute('''
+            CREATE UNIQUE INDEX IF NOT EXISTS idx_stock_alerts_open ON stock_alerts (product_id)
+            WHERE closed_date IS NULL
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_stock_alerts_company_open ON stock_alerts (company_id, id)
+            WHERE closed_date IS NULL
+        ''')
+        cursor.execute('''
+            CREATE INDEX IF NOT EXISTS idx_products_low_stock ON products (company_id, id)
+            WHERE current_stock <= min_stock
+        ''')
+        # Сверка со всеми товарами: данные, записанные до появления сигналов, или правки в обход приложения
+        self._sync_stock_alerts(cursor)
+        
         conn.commit()
         conn.close()
     
+    # ALTER и CREATE TRIGGER блокируют products целиком, поэтому выполняются, только если триггера
+    # еще нет; тело функции обновляется без блокировки таблицы
+    def _create_products_touch_trigger(self, cursor):
+        cursor.execute('''
+            CREATE OR REPLACE FUNCTION touch_products_updated_date() RETURNS trigger AS $$
+            BEGIN
+                NEW.updated_date := clock_timestamp();
+                RETURN NEW;
+            END;
+            $$ LANGUAGE plpgsql
+        ''')
+        cursor.execute('''
+            SELECT 1 FROM pg_trigger
+            WHERE tgrelid = 'products'::regclass AND tgname = 'products_touch_updated_date'
+        ''')
+        if cursor.fetchone() is not None:
+            return
+        cursor.execute('ALTER TABLE products ADD COLUMN IF NOT EXISTS updated_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP')
+        cursor.execute('''
+            CREATE TRIGGER products_touch_updated_date BEFORE INSERT OR UPDATE ON products
+            FOR EACH ROW EXECUTE FUNCTION touch_products_updated_date()
+        ''')
+    
+    def _create_products_touch_trigger_sqlite(self, cursor):
+        # SQLite не дает добавить колонку с непостоянным значением по умолчанию, отметку ставят триггеры
+        cursor.execute('ALTER TABLE products ADD COLUMN IF NOT EXISTS updated_date TIMESTAMP')
+        for event, condition in (('INSERT', ''), ('UPDATE', 'WHEN NEW.updated_date IS OLD.updated_date')):
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS products_touch_updated_date_{event.lower()} AFTER {event} ON products
+                FOR EACH ROW {condition}
+                BEGIN
+                    UPDATE products SET updated_date = strftime('%Y-%m-%d %H:%M:%f', 'now') WHERE id = NEW.id;
+                END
+            ''')
+    
+    # ===== СЕКЦИОНИРОВАНИЕ =====
+    def _migrate_to_partitioned(self, cursor):
+        cursor.execute('''
+            SELECT c.relname FROM pg_class c
+            WHERE c.relname = ANY(%s) AND c.relkind = 'r' AND c.relnamespace = 'public'::regnamespace
+        ''', (list(PARTITIONED_TABLES),))
+        plain_tables = {row[0] for row in cursor.fetchall()}
+        
+        if plain_tables:
+            # Операции и материалы связаны внешним ключом, поэтому переносятся вместе
+            if plain_tables & {'production_operations', 'production_materials'}:
+                plain_tables |= {'production_operations', 'production_materials'}
+            tables = [t for t in PARTITIONED_TABLES if t in plain_tables]
+            
+            for table in tables:
+                cursor.execute(f'ALTER TABLE {table} RENAME TO {table}_legacy')
+            for table in tables:
+                cursor.execute(PARTITIONED_DDL[table])
+            
+            # Секции создаются от самой ранней даты в старых данных
+            first_dates = []
+            for table in tables:
+                column = PARTITIONED_TABLES[table]
+                cursor.execute(f'SELECT MIN({column}) FROM {table}_legacy')
+                first_date = cursor.fetchone()[0]
+                if first_date:
+                    first_dates.append(first_date)
+            self._create_partitions(cursor, min(first_dates) if first_dates else None)
+            
+            for table in tables:
+                cursor.execute(PARTITION_MIGRATION_SQL[table])
+                cursor.execute(f'''
+                    SELECT setval(pg_get_serial_sequence('{table}', 'id'), COALESCE(MAX(id), 0) + 1, false)
+                    FROM {table}
+                ''')
+            for table in reversed(tables):
+                cursor.execute(f'DROP TABLE {table}_legacy CASCADE')
+        else:
+            self._create_partitions(cursor)
+    
+    def _create_partitions(self, cursor, first_date=None, last_date=None):
+        today = datetime.now().date()
+        start = month_start(first_date or add_months(today, -1))
+        until = add_months(month_start(today), self.partition_months_ahead + 1)
+        if last_date is not None:
+            until = max(until, add_months(month_start(last_date), 1))
+        
+        # Несколько процессов приложения могут одновременно начать новый месяц: проверка секции
+        # по умолчанию и создание секции идут под общей блокировкой до конца транзакции
+        cursor.execute("SELECT pg_advisory_xact_lock(hashtext('production_partitions'))")
+        for table, column in PARTITIONED_TABLES.items():
+            cursor.execute(f'CREATE TABLE IF NOT EXISTS {table}_default PARTITION OF {table} DEFAULT')
+            month = start
+            while month < until:
+                next_month = add_months(month, 1)
+                partition = f"{table}_p{month.strftime('%Y%m')}"
+                cursor.execute("SELECT to_regclass(%s)", (partition,))
+                if cursor.fetchone()[0] is None:
+                    # Если строки за этот месяц уже попали в секцию по умолчанию, секцию не создаем:
+                    # данные остаются доступны, теряется только отсечение секций для этого месяца
+                    cursor.execute(f'SELECT EXISTS (SELECT 1 FROM {table}_default WHERE {column} >= %s AND {column} < %s)',
+                                 (month, next_month))
+                    if not cursor.fetchone()[0]:
+                        cursor.execute(f'CREATE TABLE IF NOT EXISTS {partition} PARTITION OF {table} '
+                                     'FOR VALUES FROM (%s) TO (%s)', (month, next_month))
+                month = next_month
+        self._partitions_until = until
+    
+    # Запись без даты ложится в сегодняшнюю секцию. Месяцы до _partitions_until уже созданы этим
+    # процессом, и повторный вызов возвращается без обращения к базе
+    def ensure_partitions(self, for_date=None):
+        if not self.partition_by_month:
+            return
+        for_date = to_date(for_date) or datetime.now().date()
+        if self._partitions_until is not None and for_date < self._partitions_until:
+            return
+        conn = self.get_connection('maintenance')
+        cursor = conn.cursor()
+        self._create_partitions(cursor, last_date=for_date)
+        conn.commit()
+        conn.close()
+    
+    # Старые месяцы сначала уходят в архив (archive_old_data), и только опустевшие секции
+    # отсоединяются и удаляются: данные остаются доступны отчетам через архив
+    def detach_partitions_older_than(self, cutoff_date):
+        if not self.partition_by_month:
+            return {"success": False, "message": "Секционирование по месяцам не включено"}
+        if self.archive is None:
+            return {"success": False, "message": "Архив не настроен: укажите ARCHIVE_DIR и установите pyarrow"}
+        cutoff_date = to_date(cutoff_date)
+        result = self.archive_old_data(before_date=cutoff_date)
+        if not result["success"]:
+            return result
+        
+        conn = self.get_connection('maintenance')
+        cursor = conn.cursor()
+        detached = []
+        skipped = []
+        try:
+            # Материалы отсоединяются раньше операций, на которые они ссылаются
+            for table in ('stock_movements', 'production_materials', 'production_operations'):
+                cursor.execute('''
+                    SELECT c.relname FROM pg_inherits i
+                    JOIN pg_class c ON c.oid = i.inhrelid
+                    WHERE i.inhparent = %s::regclass
+                ''', (table,))
+                for (partition,) in cursor.fetchall():
+                    suffix = partition[len(table) + 2:]
+                    if not partition.startswith(f'{table}_p') or not suffix.isdigit():
+                        continue
+                    month = datetime.strptime(suffix, '%Y%m').date()
+                    if add_months(month, 1) > cutoff_date:
+                        continue
+                    # Строки, записанные задним числом после архивации, не теряются: такая секция остается
+                    cursor.execute(f'LOCK TABLE {partition} IN ACCESS EXCLUSIVE MODE')
+                    cursor.execute(f'SELECT EXISTS (SELECT 1 FROM {partition})')
+                    if cursor.fetchone()[0]:
+                        skipped.append(partition)
+                        continue
+                    cursor.execute(f'ALTER TABLE {table} DETACH PARTITION {partition}')
+                    cursor.execute(f'DROP TABLE {partition}')
+                    detached.append(partition)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        return {"success": True, "archived": result["archived"], "detached": detached, "skipped": skipped}
+    
     # ===== АВТОРИЗАЦИЯ =====
     def register_user(self, company_name, login, password):
         conn = self.get_connection()
@@ -165,8 +787,9 @@ class ProductionDB:
                          (company_id, login, password_hash))
             conn.commit()
             conn.close()
+            self.fleet.mark_dirty(company_id)
             return {"success": True, "company_id": company_id}
-        except psycopg2.errors.UniqueViolation:
+        except self.backend.unique_violation:
             conn.close()
             return {"success": False, "message": "Логин уже занят"}
         except Exception as e:
@@ -176,14 +799,14 @@ class ProductionDB:
     def login_user(self, login, password):
         conn = self.get_connection()
         cursor = conn.cursor()
-        cursor.execute('SELECT id, company_id, password_hash FROM users WHERE login = %s', (login,))
+        cursor.execute('SELECT id, company_id, password_hash, is_operator FROM users WHERE login = %s', (login,))
         result = cursor.fetchone()
         conn.close()
         if result is None:
             return {"success": False, "message": "Неверный логин или пароль"}
-        user_id, company_id, password_hash = result
+        user_id, company_id, password_hash, is_operator = result
         if bcrypt.checkpw(password.encode('utf-8'), password_hash.encode('utf-8')):
-            return {"success": True, "user_id": user_id, "company_id": company_id}
+            return {"success": True, "user_id": user_id, "company_id": company_id, "is_operator": bool(is_operator)}
         else:
             return {"success": False, "message": "Неверный логин или пароль"}
     
@@ -197,13 +820,13 @@ class ProductionDB:
     
     # ===== СПРАВОЧНИКИ =====
     def get_units(self):
-        conn = self.get_connection()
+        conn = self.get_read_connection()
         df = pd.read_sql_query("SELECT * FROM units ORDER BY name", conn)
         conn.close()
         return df
     
     def get_categories(self):
-        conn = self.get_connection()
+        conn = self.get_read_connection()
         df = pd.read_sql_query("SELECT * FROM categories ORDER BY name", conn)
         conn.close()
         return df
@@ -220,12 +843,16 @@ class ProductionDB:
               product_data.get('current_stock', 0), product_data.get('avg_cost', 0),
               product_data.get('selling_price', 0)))
         product_id = cursor.fetchone()[0]
+        alerts = self._sync_stock_alerts(cursor, [product_id])
         conn.commit()
         conn.close()
+        self._mark_write(company_id)
+        self._invalidate_cost_rollup(company_id)
+        self._notify_alerts(alerts)
         return product_id
     
     def get_products(self, company_id):
-        conn = self.get_connection()
+        conn = self.get_read_connection(company_id)
         query = '''
             SELECT p.*, c.name as category_name, u.short_name as unit_name
             FROM products p
@@ -233,7 +860,22 @@ class ProductionDB:
             LEFT JOIN units u ON p.unit_id = u.id
             WHERE p.company_id = %s ORDER BY p.name
         '''
-        df = pd.read_sql_query(query, conn, params=(company_id,))
+        df = self._read_prepared(conn, 'products_by_company', query, (company_id,))
+        conn.close()
+        return df
+    
+    def get_products_changed_since(self, company_id, since=None):
+        if since is None:
+            return self.get_products(company_id)
+        conn = self.get_read_connection(company_id)
+        query = '''
+            SELECT p.*, c.name as category_name, u.short_name as unit_name
+            FROM products p
+            LEFT JOIN categories c ON p.category_id = c.id
+            LEFT JOIN units u ON p.unit_id = u.id
+            WHERE p.company_id = %s AND p.updated_date > %s ORDER BY p.updated_date
+        '''
+        df = pd.read_sql_query(query, conn, params=(company_id, since))
         conn.close()
         return df
     
@@ -246,20 +888,37 @@ class ProductionDB:
             LEFT JOIN units u ON p.unit_id = u.id
             WHERE p.id = %s
         '''
-        df = pd.read_sql_query(query, conn, params=(product_id,))
+        df = self._read_prepared(conn, 'product_by_id', query, (int(product_id),))
         conn.close()
         return df.iloc[0] if not df.empty else None
     
     def update_product_stock(self, product_id, new_stock, new_avg_cost=None):
         conn = self.get_connection()
         cursor = conn.cursor()
+        try:
+            company_ids = self._write_product_stock(cursor, product_id, new_stock, new_avg_cost)
+            alerts = self._sync_stock_alerts(cursor, [product_id])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            conn.close()
+            raise
+        conn.close()
+        self._mark_write(*company_ids)
         if new_avg_cost is not None:
-            cursor.execute('UPDATE products SET current_stock = %s, avg_cost = %s WHERE id = %s',
-                         (new_stock, new_avg_cost, product_id))
+            self._avg_cost_changed({product_id: new_avg_cost})
+        self._notify_alerts(alerts)
+    
+    def _write_product_stock(self, cursor, product_id, new_stock, new_avg_cost=None):
+        if new_avg_cost is not None:
+            execute_prepared(cursor, 'update_product_stock_cost',
+                             'UPDATE products SET current_stock = %s, avg_cost = %s WHERE id = %s RETURNING company_id',
+                             (new_stock, new_avg_cost, int(product_id)))
         else:
-            cursor.execute('UPDATE products SET current_stock = %s WHERE id = %s', (new_stock, product_id))
-        conn.commit()
-        conn.close()
+            execute_prepared(cursor, 'update_product_stock',
+                             'UPDATE products SET current_stock = %s WHERE id = %s RETURNING company_id',
+                             (new_stock, int(product_id)))
+        return [row[0] for row in cursor.fetchall()]
     
     # ===== СОТРУДНИКИ =====
     def add_employee(self, company_id, employee_data):
@@ -272,206 +931,777 @@ class ProductionDB:
         emp_id = cursor.fetchone()[0]
         conn.commit()
         conn.close()
+        self._mark_write(company_id)
         return emp_id
     
     def get_employees(self, company_id):
-        conn = self.get_connection()
-        df = pd.read_sql_query("SELECT * FROM employees WHERE company_id = %s ORDER BY name",
-                              conn, params=(company_id,))
+        conn = self.get_read_connection(company_id)
+        df = self._read_prepared(conn, 'employees_by_company', "SELECT * FROM employees WHERE company_id = %s ORDER BY name",
+                                 (company_id,))
         conn.close()
         return df
     
-    # ===== ДВИЖЕНИЕ ТОВАРОВ =====
-    def add_stock_movement(self, company_id, movement_data):
+    # ===== СИНХРОНИЗАЦИЯ КАТАЛОГА =====
+    def sync_catalog(self, company_id, products_df=None, employees_df=None):
+        catalogs = {'products': products_df, 'employees': employees_df}
+        for kind, df in catalogs.items():
+            if df is not None:
+                missing = [column for column in CATALOG_SYNC[kind]['columns'][:2] if column not in df.columns]
+                if missing:
+                    return {"success": False, "message": f"Нет колонок: {', '.join(missing)}"}
+        
         conn = self.get_connection()
         cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO stock_movements (company_id, product_id, movement_type, quantity, price_per_unit,
-                total_cost, employee_id, notes, movement_date)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING id
-        ''', (company_id, movement_data['product_id'], movement_data['movement_type'],
-              movement_data['quantity'], movement_data.get('price_per_unit', 0),
-              movement_data.get('total_cost', 0), movement_data.get('employee_id'),
-              movement_data.get('notes', ''), movement_data.get('movement_date', datetime.now().date())))
-        movement_id = cursor.fetchone()[0]
-        conn.commit()
+        result = {"success": True}
+        try:
+            for kind, df in catalogs.items():
+                if df is None:
+                    continue
+                columns = ['line'] + CATALOG_SYNC[kind]['columns']
+                staged = df.reindex(columns=columns)
+                staged['line'] = range(len(staged))
+                # В SQLite временная таблица переживает транзакцию на соединении из пула
+                cursor.execute(f'DROP TABLE IF EXISTS staging_{kind}')
+                cursor.execute(CATALOG_SYNC[kind]['staging'])
+                if self.backend.supports('copy'):
+                    # Файл уходит в промежуточную таблицу через COPY, без построчных INSERT
+                    buffer = io.StringIO()
+                    staged.to_csv(buffer, index=False, header=False)
+                    buffer.seek(0)
+                    cursor.copy_expert(f"COPY staging_{kind} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv)", buffer)
+                else:
+                    cursor.executemany(f"INSERT INTO staging_{kind} ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})",
+                                       staged.astype(object).where(staged.notna(), None).itertuples(index=False, name=None))
+                cursor.execute(CATALOG_SYNC[kind]['counts'], {'company_id': company_id})
+                total, valid, distinct, accepted, inserted, updated = cursor.fetchone()
+                cursor.execute(CATALOG_SYNC[kind]['upsert'], {'company_id': company_id})
+                # Отклонены строки без кода или названия и товары с неизвестной категорией или единицей
+                result[kind] = {"inserted": inserted, "updated": updated, "unchanged": accepted - inserted - updated,
+                                "rejected": total - valid + distinct - accepted, "duplicates": valid - distinct}
+            alerts = []
+            if products_df is not None and (result['products']['inserted'] or result['products']['updated']):
+                # Новые товары и измененные минимумы могут открыть или закрыть сигналы
+                cursor.execute('SELECT id FROM products WHERE company_id = %s', (company_id,))
+                alerts = self._sync_stock_alerts(cursor, [row[0] for row in cursor.fetchall()])
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            conn.close()
+            return {"success": False, "message": str(e)}
         conn.close()
         
-        product = self.get_product_by_id(movement_data['product_id'])
-        current_stock = product['current_stock']
-        if movement_data['movement_type'] == 'in':
-            new_stock = current_stock + movement_data['quantity']
-            if movement_data.get('price_per_unit', 0) > 0:
-                old_value = current_stock * product['avg_cost']
-                new_value = movement_data['quantity'] * movement_data['price_per_unit']
-                new_avg_cost = (old_value + new_value) / new_stock if new_stock > 0 else 0
-                self.update_product_stock(movement_data['product_id'], new_stock, new_avg_cost)
+        if any(counts["inserted"] or counts["updated"] for kind, counts in result.items() if kind != "success"):
+            self._mark_write(company_id)
+            self._invalidate_cost_rollup(company_id)
+        self._notify_alerts(alerts)
+        return result
+    
+    # ===== ДВИЖЕНИЕ ТОВАРОВ =====
+    def add_stock_movement(self, company_id, movement_data):
+        self.ensure_partitions(movement_data.get('movement_date'))
+        product_id = int(movement_data['product_id'])
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            # Движение, новый остаток и сигнал о нехватке фиксируются одной транзакцией
+            execute_prepared(cursor, 'lock_product_stock',
+                             'SELECT current_stock, avg_cost FROM products WHERE id = %s AND company_id = %s FOR UPDATE',
+                             (product_id, company_id))
+            row = cursor.fetchone()
+            if row is None:
+                raise ValueError(f"Товар #{product_id} не найден")
+            current_stock, avg_cost = [float(value or 0) for value in row]
+            execute_prepared(cursor, 'insert_stock_movement', '''
+                INSERT INTO stock_movements (company_id, product_id, movement_type, quantity, price_per_unit,
+                    total_cost, employee_id, notes, movement_date)
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s) RETURNING id
+            ''', (company_id, product_id, movement_data['movement_type'],
+                  movement_data['quantity'], movement_data.get('price_per_unit', 0),
+                  movement_data.get('total_cost', 0), movement_data.get('employee_id'),
+                  movement_data.get('notes', ''), movement_data.get('movement_date', datetime.now().date())))
+            movement_id = cursor.fetchone()[0]
+            
+            quantity = float(movement_data['quantity'])
+            price = float(movement_data.get('price_per_unit', 0) or 0)
+            new_avg_cost = None
+            if movement_data['movement_type'] == 'in':
+                new_stock = current_stock + quantity
+                if price > 0:
+                    new_avg_cost = (current_stock * avg_cost + quantity * price) / new_stock if new_stock > 0 else 0
             else:
-                self.update_product_stock(movement_data['product_id'], new_stock)
-        else:
-            new_stock = current_stock - movement_data['quantity']
-            self.update_product_stock(movement_data['product_id'], new_stock)
+                new_stock = current_stock - quantity
+            self._write_product_stock(cursor, product_id, new_stock, new_avg_cost)
+            alerts = self._sync_stock_alerts(cursor, [product_id])
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            conn.close()
+            raise
+        conn.close()
+        self._mark_write(company_id)
+        if new_avg_cost is not None:
+            self._avg_cost_changed({product_id: new_avg_cost})
+        self._notify_alerts(alerts)
         return movement_id
     
+    def submit_stock_movement(self, company_id, movement_data):
+        if self.write_queue is not None:
+            return self.write_queue.submit_movement(company_id, movement_data)
+        return self._completed(self.add_stock_movement, company_id, movement_data)
+    
+    def _completed(self, method, *args):
+        future = Future()
+        try:
+            future.set_result(method(*args))
+        except Exception as e:
+            future.set_exception(e)
+        return future
+    
     def get_stock_movements(self, company_id, start_date=None, end_date=None):
-        conn = self.get_connection()
+        name, query, params = self._range_query('stock_movements', MOVEMENTS_QUERY, 'sm.movement_date', [company_id],
+                                                start_date, end_date, 'sm.movement_date DESC')
+        with self._range_read(company_id, start_date, end_date) as conn:
+            df = self._read_prepared(conn, name, query, tuple(params))
+        return self._with_archive('stock_movements', df, company_id, start_date, end_date)
+    
+    # Новые движения после last_id; архив не читается — туда попадают только старые записи
+    def get_stock_movements_since(self, company_id, last_id=0, start_date=None):
+        conn = self.get_read_connection(company_id)
+        query = MOVEMENTS_QUERY + ' AND sm.id > %s'
+        params = [company_id, int(last_id or 0)]
+        if start_date:
+            query += ' AND sm.movement_date >= %s'
+            params.append(start_date)
+        query += ' ORDER BY sm.id'
+        df = pd.read_sql_query(query, conn, params=tuple(params))
+        conn.close()
+        return df
+    
+    # Суммы движений по дням и типам для графиков; строки движений в приложение не передаются
+    def get_movement_series(self, company_id, start_date=None, end_date=None, product_id=None):
         query = '''
-            SELECT sm.*, p.name as product_name, u.short_name as unit_name, e.name as employee_name
-            FROM stock_movements sm
-            LEFT JOIN products p ON sm.product_id = p.id
-            LEFT JOIN units u ON p.unit_id = u.id
-            LEFT JOIN employees e ON sm.employee_id = e.id
-            WHERE sm.company_id = %s
+            SELECT movement_date, movement_type, SUM(quantity) AS quantity, COUNT(*) AS movements
+            FROM stock_movements WHERE company_id = %s
         '''
         params = [company_id]
+        if product_id is not None:
+            query += ' AND product_id = %s'
+            params.append(int(product_id))
         if start_date:
-            query += ' AND sm.movement_date >= %s'
+            query += ' AND movement_date >= %s'
             params.append(start_date)
         if end_date:
-            query += ' AND sm.movement_date <= %s'
+            query += ' AND movement_date <= %s'
             params.append(end_date)
-        query += ' ORDER BY sm.movement_date DESC'
-        df = pd.read_sql_query(query, conn, params=tuple(params))
+        query += ' GROUP BY movement_date, movement_type ORDER BY movement_date'
+        with self._range_read(company_id, start_date, end_date) as conn:
+            df = pd.read_sql_query(query, conn, params=tuple(params))
+        df['quantity'] = pd.to_numeric(df['quantity'])
+        
+        if self.archive is not None:
+            archived = self.archive.read('stock_movements', company_id, start_date, end_date,
+                                         columns=['movement_date', 'movement_type', 'quantity', 'product_id'])
+            if archived is not None and not archived.empty:
+                if product_id is not None:
+                    archived = archived[archived['product_id'] == int(product_id)]
+                archived = archived.groupby(['movement_date', 'movement_type'], as_index=False).agg(
+                    quantity=('quantity', 'sum'), movements=('quantity', 'size'))
+                df = pd.concat([df, archived], ignore_index=True).groupby(
+                    ['movement_date', 'movement_type'], as_index=False)[['quantity', 'movements']].sum()
+        return df.sort_values('movement_date', ignore_index=True)
+    
+    # ===== ИНВЕНТАРИЗАЦИЯ =====
+    def preview_inventory_count(self, company_id, counts_df):
+        return count_differences(self.get_products(company_id), counts_df)
+    
+    # Все корректировки одной транзакцией: остатки блокируются, расхождения считаются по заблокированным
+    # значениям, движения вставляются пачкой, остатки обновляются одним UPDATE
+    def reconcile_inventory(self, company_id, counts_df, employee_id=None, count_date=None, notes='Инвентаризация'):
+        count_date = count_date or datetime.now().date()
+        self.ensure_partitions(count_date)
+        product_ids = sorted({int(product_id) for product_id in pd.to_numeric(counts_df['product_id'], errors='coerce').dropna()})
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        try:
+            cursor.execute('''
+                SELECT id, current_stock, avg_cost FROM products
+                WHERE company_id = %s AND id = ANY(%s) ORDER BY id FOR UPDATE
+            ''', (company_id, product_ids))
+            stock_df = pd.DataFrame(cursor.fetchall(), columns=['id', 'current_stock', 'avg_cost'])
+            differences, unknown = count_differences(stock_df, counts_df)
+            adjustments = differences[differences['difference'] != 0]
+            
+            if not adjustments.empty:
+                execute_values(cursor, '''
+                    INSERT INTO stock_movements (company_id, product_id, movement_type, quantity, price_per_unit,
+                        total_cost, employee_id, notes, is_adjustment, movement_date)
+                    VALUES %s
+                ''', list(zip([company_id] * len(adjustments), adjustments['product_id'].tolist(),
+                              adjustments['movement_type'].tolist(), adjustments['quantity'].tolist(),
+                              adjustments['avg_cost'].tolist(), adjustments['total_cost'].tolist(),
+                              [employee_id] * len(adjustments), [notes] * len(adjustments),
+                              [True] * len(adjustments), [count_date] * len(adjustments))), page_size=5000)
+                # Излишки приходуют по средней себестоимости, поэтому она не меняется
+                execute_values(cursor, '''
+                    UPDATE products p SET current_stock = v.current_stock
+                    FROM (VALUES %s) AS v(id, current_stock)
+                    WHERE p.id = v.id
+                ''', list(zip(adjustments['product_id'].tolist(), adjustments['counted_quantity'].tolist())),
+                    template='(%s, %s::numeric)', page_size=len(adjustments))
+            alerts = self._sync_stock_alerts(cursor, adjustments['product_id'].tolist())
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            conn.close()
+            raise
         conn.close()
-        return df
+        if not adjustments.empty:
+            self._mark_write(company_id)
+        self._notify_alerts(alerts)
+        
+        return {"success": True, "counted": len(differences), "adjusted": len(adjustments),
+                "surplus": int((adjustments['difference'] > 0).sum()), "shortage": int((adjustments['difference'] < 0).sum()),
+                "surplus_value": float(adjustments.loc[adjustments['difference'] > 0, 'total_cost'].sum()),
+                "shortage_value": float(adjustments.loc[adjustments['difference'] < 0, 'total_cost'].sum()),
+                "unknown": unknown}
     
     # ===== ПРОИЗВОДСТВО =====
     def add_production_operation(self, company_id, production_data, materials_used):
+        production_date = production_data.get('production_date', datetime.now().date())
+        self.ensure_partitions(production_date)
         conn = self.get_connection()
         cursor = conn.cursor()
-        cursor.execute('''
-            INSERT INTO production_operations (company_id, operation_name, employee_id, output_product_id,
-                output_quantity, output_cost, production_date, notes)
-            VALUES (%s, %s, %s, %s, %s, %s, %s, %s) RETURNING id
-        ''', (company_id, production_data['operation_name'], production_data.get('employee_id'),
-              production_data['output_product_id'], production_data['output_quantity'],
-              production_data['output_cost'], production_data.get('production_date', datetime.now().date()),
-              production_data.get('notes', '')))
-        production_id = cursor.fetchone()[0]
-        
-        for material in materials_used:
+        try:
             cursor.execute('''
-                INSERT INTO production_materials (production_id, product_id, quantity_used, cost)
-                VALUES (%s, %s, %s, %s)
-            ''', (production_id, material['product_id'], material['quantity_used'], material['cost']))
-            product = self.get_product_by_id(material['product_id'])
-            new_stock = product['current_stock'] - material['quantity_used']
-            self.update_product_stock(material['product_id'], new_stock)
-        
-        output_product = self.get_product_by_id(production_data['output_product_id'])
-        new_output_stock = output_product['current_stock'] + production_data['output_quantity']
-        cost_per_unit = production_data['output_cost'] / production_data['output_quantity']
-        old_value = output_product['current_stock'] * output_product['avg_cost']
-        new_value = production_data['output_quantity'] * cost_per_unit
-        new_avg_cost = (old_value + new_value) / new_output_stock if new_output_stock > 0 else cost_per_unit
-        self.update_product_stock(production_data['output_product_id'], new_output_stock, new_avg_cost)
-        
-        conn.commit()
-        conn.close()
+                INSERT INTO production_operations (company_id, operation_name, employee_id, output_product_id,
+                    output_quantity, output_cost, labor_hours, labor_cost, production_date, notes)
+                VALUES (%(company_id)s, %(operation_name)s, %(employee_id)s, %(output_product_id)s,
+                    %(output_quantity)s, %(output_cost)s, %(labor_hours)s,
+                    %(labor_hours)s * COALESCE((SELECT hourly_rate FROM employees WHERE id = %(employee_id)s), 0),
+                    %(production_date)s, %(notes)s)
+                RETURNING id
+            ''', {'company_id': company_id, 'operation_name': production_data['operation_name'],
+                  'employee_id': production_data.get('employee_id'),
+                  'output_product_id': production_data['output_product_id'],
+                  'output_quantity': production_data['output_quantity'], 'output_cost': production_data['output_cost'],
+                  'labor_hours': production_data.get('labor_hours') or 0, 'production_date': production_date,
+                  'notes': production_data.get('notes', '')})
+            production_id = cursor.fetchone()[0]
+            
+            if materials_used:
+                execute_values(cursor, '''
+                    INSERT INTO production_materials (production_id, product_id, quantity_used, cost, production_date)
+                    VALUES %s
+                ''', [(production_id, material['product_id'], material['quantity_used'], material['cost'],
+                       production_date) for material in materials_used])
+                # Списываем все материалы одним UPDATE
+                cursor.execute('''
+                    UPDATE products p SET current_stock = p.current_stock - m.quantity
+                    FROM (
+                        SELECT product_id, SUM(quantity_used) AS quantity
+                        FROM production_materials
+                        WHERE production_id = %s
+                        GROUP BY product_id
+                    ) m
+                    WHERE p.id = m.product_id
+                ''', (production_id,))
+            
+            # Приходуем продукцию с пересчетом средней себестоимости
+            cursor.execute('''
+                UPDATE products SET
+                    avg_cost = CASE WHEN current_stock + %(quantity)s > 0
+                        THEN (current_stock * avg_cost + %(cost)s) / (current_stock + %(quantity)s)
+                        ELSE %(cost)s / %(quantity)s END,
+                    current_stock = current_stock + %(quantity)s
+                WHERE id = %(product_id)s
+                RETURNING avg_cost
+            ''', {'quantity': production_data['output_quantity'], 'cost': production_data['output_cost'],
+                  'product_id': production_data['output_product_id']})
+            output_avg_cost = cursor.fetchone()[0]
+            self._refresh_labor_daily(cursor, company_id, [production_date])
+            alerts = self._sync_stock_alerts(cursor, [material['product_id'] for material in materials_used or []]
+                                             + [production_data['output_product_id']])
+            
+            conn.commit()
+            conn.close()
+        except Exception:
+            conn.rollback()
+            conn.close()
+            raise
+        self._mark_write(company_id)
+        self._avg_cost_changed({production_data['output_product_id']: output_avg_cost})
+        self._notify_alerts(alerts)
         return production_id
     
     def get_production_operations(self, company_id, start_date=None, end_date=None):
+        name, query, params = self._range_query('production_operations', PRODUCTION_QUERY, 'po.production_date',
+                                                [company_id], start_date, end_date, 'po.production_date DESC')
+        with self._range_read(company_id, start_date, end_date) as conn:
+            df = self._read_prepared(conn, name, query, tuple(params), coerce_float=False)
+        return self._with_archive('production_operations', df, company_id, start_date, end_date)
+    
+    def delete_production_operation(self, company_id, production_id):
+        result = self.delete_production_operations(company_id, [production_id])
+        if result["success"] and result["operations_deleted"] == 0:
+            return {"success": False, "message": "Операция не найдена"}
+        return result
+    
+    # Удаляются только операции компании company_id; чужие id пропускаются как несуществующие
+    def delete_production_operations(self, company_id, production_ids):
+        production_ids = [int(pid) for pid in production_ids]
+        if not production_ids:
+            return {"success": True, "operations_deleted": 0, "materials_returned": 0, "output_removed": 0}
+        
         conn = self.get_connection()
         cursor = conn.cursor()
+        try:
+            # Блокируем операции, чтобы параллельное удаление не вернуло материалы дважды
+            cursor.execute('''
+                SELECT id, production_date FROM production_operations
+                WHERE company_id = %s AND id = ANY(%s) FOR UPDATE
+            ''', (company_id, production_ids))
+            operations = cursor.fetchall()
+            production_ids = [row[0] for row in operations]
+            if not production_ids:
+                conn.rollback()
+                return {"success": True, "operations_deleted": 0, "materials_returned": 0, "output_removed": 0}
+            
+            # Возвращаем материалы на склад одним UPDATE по всем операциям
+            cursor.execute("""
+                SELECT pm.product_id, SUM(pm.quantity_used), COUNT(*)
+                FROM production_materials pm
+                JOIN production_operations po ON po.id = pm.production_id
+                WHERE po.company_id = %s AND pm.production_id = ANY(%s)
+                GROUP BY pm.product_id
+            """, (company_id, production_ids))
+            materials = cursor.fetchall()
+            materials_returned = sum(row[2] for row in materials)
+            if materials:
+                execute_values(cursor, """
+                    UPDATE products p SET current_stock = p.current_stock + v.quantity
+                    FROM (VALUES %s) AS v(id, company_id, quantity)
+                    WHERE p.id = v.id AND p.company_id = v.company_id
+                """, [(row[0], company_id, row[1]) for row in materials], template='(%s, %s, %s::numeric)',
+                    page_size=len(materials))
+            
+            # Списываем готовую продукцию, не уходя в минус
+            cursor.execute("""
+                SELECT p.id, o.quantity, LEAST(p.current_stock, o.quantity)
+                FROM products p
+                JOIN (
+                    SELECT output_product_id, SUM(output_quantity) AS quantity
+                    FROM production_operations
+                    WHERE company_id = %s AND id = ANY(%s)
+                    GROUP BY output_product_id
+                ) o ON p.id = o.output_product_id
+                WHERE p.company_id = %s
+                FOR UPDATE OF p
+            """, (company_id, production_ids, company_id))
+            outputs = cursor.fetchall()
+            output_removed = sum(max(row[2], 0) for row in outputs)
+            if outputs:
+                execute_values(cursor, """
+                    UPDATE products p SET current_stock = GREATEST(0, p.current_stock - v.quantity)
+                    FROM (VALUES %s) AS v(id, company_id, quantity)
+                    WHERE p.id = v.id AND p.company_id = v.company_id
+                """, [(row[0], company_id, row[1]) for row in outputs], template='(%s, %s, %s::numeric)',
+                    page_size=len(outputs))
+            
+            # Удаляем записи
+            cursor.execute('''
+                DELETE FROM production_materials WHERE production_id IN (
+                    SELECT id FROM production_operations WHERE company_id = %s AND id = ANY(%s))
+            ''', (company_id, production_ids))
+            cursor.execute("DELETE FROM production_operations WHERE company_id = %s AND id = ANY(%s)",
+                           (company_id, production_ids))
+            operations_deleted = cursor.rowcount
+            
+            self._refresh_labor_daily(cursor, company_id, {row[1] for row in operations})
+            alerts = self._sync_stock_alerts(cursor, [row[0] for row in materials + outputs])
+            
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            return {"success": False, "message": str(e)}
+        finally:
+            conn.close()
+        self._mark_write(company_id)
+        # Удаление уменьшает уже учтенный расход, поэтому прогноз пересчитывается целиком
+        self.forecaster.invalidate(company_id)
+        self._notify_alerts(alerts)
         
+        return {
+            "success": True,
+            "operations_deleted": operations_deleted,
+            "materials_returned": materials_returned,
+            "output_removed": output_removed
+        }
+    
+    # ===== РЕЦЕПТУРЫ =====
+    def get_cost_rollup(self, company_id):
+        with self._cost_rollups_lock:
+            rollup = self._cost_rollups.get(company_id)
+        if rollup is not None:
+            return rollup
+        
+        conn = self.get_read_connection(company_id)
+        cursor = conn.cursor()
+        cursor.execute('SELECT id, avg_cost FROM products WHERE company_id = %s', (company_id,))
+        avg_costs = cursor.fetchall()
+        cursor.execute('SELECT product_id, component_id, quantity FROM recipe_items WHERE company_id = %s',
+                     (company_id,))
+        recipe_items = cursor.fetchall()
+        conn.close()
+        
+        rollup = CostRollup(avg_costs, recipe_items)
+        with self._cost_rollups_lock:
+            self._cost_rollups[company_id] = rollup
+        return rollup
+    
+    def _avg_cost_changed(self, avg_costs):
+        with self._cost_rollups_lock:
+            rollups = list(self._cost_rollups.values())
+        for product_id, avg_cost in avg_costs.items():
+            for rollup in rollups:
+                if int(product_id) in rollup.avg_cost:
+                    rollup.update_avg_cost(int(product_id), avg_cost)
+    
+    def _invalidate_cost_rollup(self, company_id):
+        with self._cost_rollups_lock:
+            self._cost_rollups.pop(company_id, None)
+    
+    def get_recipe(self, company_id, product_id):
+        conn = self.get_connection()
         query = '''
-            SELECT 
-                po.id, 
-                po.company_id, 
-                po.operation_name, 
-                po.employee_id, 
-                po.output_product_id, 
-                po.output_quantity, 
-                po.output_cost, 
-                po.production_date,
-                po.notes, 
-                po.created_date,
-                p.name as output_product_name, 
-                u.short_name as output_unit, 
-                e.name as employee_name
-            FROM production_operations po
-            LEFT JOIN products p ON po.output_product_id = p.id
+            SELECT ri.component_id, p.name as component_name, u.short_name as unit_name,
+                ri.quantity, p.avg_cost, p.current_stock
+            FROM recipe_items ri
+            JOIN products p ON ri.component_id = p.id
             LEFT JOIN units u ON p.unit_id = u.id
-            LEFT JOIN employees e ON po.employee_id = e.id
-            WHERE po.company_id = %s
+            WHERE ri.product_id = %s AND ri.company_id = %s AND p.company_id = %s ORDER BY p.name
         '''
-        params = [company_id]
-        if start_date:
-            query += ' AND po.production_date >= %s'
-            params.append(start_date)
-        if end_date:
-            query += ' AND po.production_date <= %s'
-            params.append(end_date)
-        query += ' ORDER BY po.production_date DESC'
-        
-        cursor.execute(query, tuple(params))
-        columns = [desc[0] for desc in cursor.description]
-        rows = cursor.fetchall()
-        df = pd.DataFrame(rows, columns=columns)
+        df = pd.read_sql_query(query, conn, params=(product_id, company_id, company_id))
         conn.close()
         return df
     
-    def delete_production_operation(self, production_id):
+    def set_recipe(self, company_id, product_id, components):
+        items = {}
+        for component in components:
+            if float(component['quantity']) <= 0:
+                continue
+            component_id = int(component['component_id'])
+            items[component_id] = items.get(component_id, 0) + float(component['quantity'])
+        if int(product_id) in items:
+            return {"success": False, "message": "Продукт не может входить в собственную рецептуру"}
+        
         conn = self.get_connection()
         cursor = conn.cursor()
-        
-        # Получаем данные операции
-        cursor.execute("""
-            SELECT id, company_id, operation_name, employee_id, output_product_id, 
-                   output_quantity, output_cost, production_date, notes
-            FROM production_operations 
-            WHERE id = %s
-        """, (production_id,))
-        operation = cursor.fetchone()
-        
-        if not operation:
+        try:
+            # Изделие и все компоненты должны принадлежать компании
+            product_ids = sorted(set(items) | {int(product_id)})
+            cursor.execute('SELECT id FROM products WHERE company_id = %s AND id = ANY(%s)', (company_id, product_ids))
+            missing = set(product_ids) - {row[0] for row in cursor.fetchall()}
+            if missing:
+                conn.rollback()
+                conn.close()
+                return {"success": False, "message": f"Товары не найдены: {', '.join(f'#{pid}' for pid in sorted(missing))}"}
+            cursor.execute('DELETE FROM recipe_items WHERE product_id = %s AND company_id = %s',
+                         (product_id, company_id))
+            if items:
+                execute_values(cursor, '''
+                    INSERT INTO recipe_items (company_id, product_id, component_id, quantity) VALUES %s
+                ''', [(company_id, int(product_id), component_id, quantity) for component_id, quantity in items.items()])
+            
+            # Проверяем, что новая рецептура не замкнула цикл через полуфабрикаты
+            cursor.execute('SELECT product_id, component_id, quantity FROM recipe_items WHERE company_id = %s',
+                         (company_id,))
+            CostRollup([], cursor.fetchall()).unit_cost(int(product_id))
+            conn.commit()
             conn.close()
-            return {"success": False, "message": "Операция не найдена"}
+        except RecipeCycleError as e:
+            conn.rollback()
+            conn.close()
+            return {"success": False, "message": str(e)}
+        except Exception:
+            conn.rollback()
+            conn.close()
+            raise
+        self._invalidate_cost_rollup(company_id)
+        self._mark_write(company_id)
+        return {"success": True, "components": len(items)}
+    
+    def get_recipe_costs(self, company_id):
+        rollup = self.get_cost_rollup(company_id)
+        costs = rollup.all_costs()
+        products_df = self.get_products(company_id)
+        products_df = products_df[products_df['id'].map(rollup.has_recipe)].copy()
+        products_df['rollup_cost'] = products_df['id'].map(costs)
+        return products_df[['id', 'name', 'category_name', 'unit_name', 'avg_cost', 'rollup_cost']]
+    
+    def produce_from_recipe(self, company_id, product_id, quantity, employee_id=None, production_date=None,
+                            operation_name=None, additional_costs=0, notes='', labor_hours=0):
+        product_id = int(product_id)
+        rollup = self.get_cost_rollup(company_id)
+        components = rollup.explode(product_id, float(quantity))
+        if not components:
+            return {"success": False, "message": "Для продукта не задана рецептура"}
         
-        # Распаковываем данные
-        op_id, company_id, op_name, employee_id, output_product_id, output_quantity, output_cost, prod_date, notes = operation
-        
-        # Получаем материалы
-        cursor.execute("""
-            SELECT id, production_id, product_id, quantity_used, cost
-            FROM production_materials 
-            WHERE production_id = %s
-        """, (production_id,))
-        materials = cursor.fetchall()
-        
-        # Возвращаем материалы на склад
-        for material in materials:
-            mat_id, prod_id, product_id, quantity_used, cost = material
-            cursor.execute("SELECT current_stock FROM products WHERE id = %s", (product_id,))
-            result = cursor.fetchone()
-            if result:
-                current_stock = result[0]
-                new_stock = current_stock + quantity_used
-                cursor.execute("UPDATE products SET current_stock = %s WHERE id = %s", (new_stock, product_id))
-        
-        # Списываем готовую продукцию
-        cursor.execute("SELECT current_stock FROM products WHERE id = %s", (output_product_id,))
-        result = cursor.fetchone()
-        if result:
-            current_output = result[0]
-            new_output = max(0, current_output - output_quantity)
-            cursor.execute("UPDATE products SET current_stock = %s WHERE id = %s", (new_output, output_product_id))
-            actual_removed = min(current_output, output_quantity)
-        else:
-            actual_removed = 0
+        # Фактические остатки и себестоимость компонентов читаем одним запросом с основной базы
+        conn = self.get_connection()
+        cursor = conn.cursor()
+        cursor.execute('SELECT id, name, current_stock, avg_cost FROM products WHERE company_id = %s AND id = ANY(%s)',
+                     (company_id, [product_id] + [component_id for component_id, _ in components]))
+        stock = {row[0]: row[1:] for row in cursor.fetchall()}
+        conn.close()
         
-        # Удаляем записи
-        cursor.execute("DELETE FROM production_materials WHERE production_id = %s", (production_id,))
-        cursor.execute("DELETE FROM production_operations WHERE id = %s", (production_id,))
+        # Удаленный или чужой компонент (рецептура из кеша устарела) — ошибка, а не KeyError
+        missing = [f'#{pid}' for pid in [product_id] + [component_id for component_id, _ in components]
+                   if pid not in stock]
+        if missing:
+            self._invalidate_cost_rollup(company_id)
+            return {"success": False, "message": f"Товары не найдены: {', '.join(missing)}"}
+        product_name = stock[product_id][0]
         
-        conn.commit()
-        conn.close()
+        shortages = [f"{stock[component_id][0]} (нужно {needed:.2f}, есть {float(stock[component_id][1]):.2f})"
+                     for component_id, needed in components if float(stock[component_id][1]) < needed]
+        if shortages:
+            return {"success": False, "message": "Недостаточно материалов: " + ", ".join(shortages)}
         
-        return {
-            "success": True, 
-            "materials_returned": len(materials), 
-            "output_removed": actual_removed
+        materials_used = [{'product_id': component_id, 'quantity_used': needed,
+                           'cost': needed * float(stock[component_id][2])} for component_id, needed in components]
+        materials_cost = sum(material['cost'] for material in materials_used)
+        production_data = {
+            'operation_name': operation_name or f"Производство: {product_name}", 'employee_id': employee_id,
+            'output_product_id': product_id, 'output_quantity': float(quantity),
+            'output_cost': materials_cost + additional_costs, 'labor_hours': labor_hours, 'notes': notes
         }
+        if production_date:
+            production_data['production_date'] = production_date
+        production_id = self.add_production_operation(company_id, production_data, materials_used)
+        return {"success": True, "production_id": production_id, "materials": len(materials_used),
+                "output_cost": materials_cost + additional_costs}
+    
+    # ===== ПЛАНИРОВАНИЕ =====
+    def get_material_requirements(self, company_id, plan):
+        plan_df = pd.DataFrame(plan, columns=['product_id', 'quantity'])
+        plan_df = plan_df[plan_df['quantity'] > 0]
+        products_df = self.get_products(company_id)
+        conn = self.get_read_connection(company_id)
+        recipe_df = pd.read_sql_query('SELECT product_id, component_id, quantity FROM recipe_items WHERE company_id = %s',
+                                      conn, params=(company_id,))
+        conn.close()
+        return material_requirements(products_df, recipe_df, plan_df)
+    
+    # ===== ОБЗОР =====
+    # Снимок из фонового обновления; без него (первый заход или обновление выключено) — живые запросы
+    def get_overview(self, company_id):
+        if self.dashboard is None:
+            return build_overview(self, company_id)
+        snapshot = self.dashboard.get(company_id)
+        if snapshot is None:
+            snapshot = self.dashboard.refresh(company_id)
+        return snapshot
+    
+    # ===== ОПЕРАТОР =====
+    # Показатели всех компаний (или перечисленных) одним сгруппированным запросом, без цикла по компаниям
+    def get_fleet_kpis(self, company_ids=None):
+        today = datetime.now().date()
+        params = {'start_date': today - timedelta(days=30), 'end_date': today}
+        scope = 'true'
+        if company_ids is not None:
+            scope = 'company_id = ANY(%(company_ids)s)'
+            params['company_ids'] = [int(company_id) for company_id in company_ids]
+        query = f'''
+            SELECT c.id AS company_id, c.name AS company_name,
+                COALESCE(p.products, 0) AS products, COALESCE(p.stock_value, 0) AS stock_value,
+                COALESCE(p.low_stock, 0) AS low_stock, COALESCE(x.expenses_month, 0) AS expenses_month,
+                COALESCE(o.production_count, 0) AS production_count, COALESCE(o.output_cost, 0) AS output_cost
+            FROM companies c
+            LEFT JOIN (
+                SELECT company_id, COUNT(*) AS products, SUM(current_stock * avg_cost) AS stock_value,
+                    COUNT(*) FILTER (WHERE current_stock <= min_stock) AS low_stock
+                FROM products
+                WHERE {scope}
+                GROUP BY company_id
+            ) p ON p.company_id = c.id
+            LEFT JOIN (
+                SELECT company_id, SUM(amount) AS expenses_month
+                FROM expenses
+                WHERE expense_date BETWEEN %(start_date)s AND %(end_date)s AND {scope}
+                GROUP BY company_id
+            ) x ON x.company_id = c.id
+            LEFT JOIN (
+                SELECT company_id, COUNT(*) AS production_count, SUM(output_cost) AS output_cost
+                FROM production_operations
+                WHERE production_date BETWEEN %(start_date)s AND %(end_date)s AND {scope}
+                GROUP BY company_id
+            ) o ON o.company_id = c.id
+            WHERE {scope.replace('company_id', 'c.id', 1)}
+            ORDER BY c.id
+        '''
+        # Сводка по всем компаниям идет через общий лимит тяжелых чтений, как отчет одной компании
+        with self._admitted_read(None, 'heavy', 30) as conn:
+            return pd.read_sql_query(query, conn, params=params)
+    
+    # Кеш сводки: полная сборка по расписанию, между ними — только компании с новыми записями
+    def get_fleet_overview(self, force=False):
+        return self.fleet.get(force)
+    
+    # ===== СИГНАЛЫ О НЕХВАТКЕ =====
+    # Вызывается в транзакции, изменившей остатки или минимумы: сверяет сигналы только для этих
+    # товаров (без списка — для всех) и возвращает новые нехватки для отправки после фиксации
+    def _sync_stock_alerts(self, cursor, product_ids=None):
+        params = ()
+        scope = 'true'
+        if product_ids is not None:
+            product_ids = sorted({int(product_id) for product_id in product_ids})
+            if not product_ids:
+                return []
+            scope = '{} = ANY(%s)'
+            params = (product_ids,)
+        cursor.execute(f'''
+            UPDATE stock_alerts SET closed_date = CURRENT_TIMESTAMP
+            WHERE closed_date IS NULL AND {scope.format('product_id')} AND NOT EXISTS (
+                SELECT 1 FROM products p
+                WHERE p.id = stock_alerts.product_id AND p.current_stock <= p.min_stock
+            )
+        ''', params)
+        cursor.execute(f'''
+            INSERT INTO stock_alerts (company_id, product_id, opening_stock, min_stock)
+            SELECT company_id, id, current_stock, min_stock FROM products
+            WHERE {scope.format('id')} AND current_stock <= min_stock
+            ON CONFLICT (product_id) WHERE closed_date IS NULL DO NOTHING
+            RETURNING id, company_id, product_id, opening_stock, min_stock
+        ''', params)
+        opened = cursor.fetchall()
+        if not opened or product_ids is None:
+            return []
+        cursor.execute('SELECT id, name FROM products WHERE id = ANY(%s)', ([row[2] for row in opened],))
+        names = dict(cursor.fetchall())
+        return [{'alert_id': alert_id, 'company_id': company_id, 'product_id': product_id,
+                 'product_name': names.get(product_id), 'current_stock': float(stock), 'min_stock': float(min_stock)}
+                for alert_id, company_id, product_id, stock, min_stock in opened]
+    
+    def _notify_alerts(self, alerts):
+        if alerts and self.alert_sink is not None:
+            self.alert_sink.send(alerts)
+    
+    # Открытые сигналы компании: выборка по частичному индексу, без просмотра каталога
+    def get_open_alerts(self, company_id, after_id=0):
+        conn = self.get_read_connection(company_id)
+        df = pd.read_sql_query('''
+            SELECT a.id, a.product_id, p.name as product_name, p.current_stock, p.min_stock,
+                u.short_name as unit_name, a.opening_stock, a.opened_date
+            FROM stock_alerts a
+            JOIN products p ON p.id = a.product_id
+            LEFT JOIN units u ON p.unit_id = u.id
+            WHERE a.company_id = %s AND a.closed_date IS NULL AND a.id > %s
+            ORDER BY a.id DESC
+        ''', conn, params=(company_id, int(after_id or 0)))
+        conn.close()
+        return df
+    
+    # ===== ПРОГНОЗ ОСТАТКОВ =====
+    def get_stock_forecast(self, company_id):
+        return self.forecaster.forecast(company_id)
+    
+    # Расход после settled_ids (движения, материалы). Строки с id не старше MAX(id) - overlap считаются
+    # окончательными и возвращаются в settled_df, более новые — в tail_df: их перечитывают при каждом
+    # дочитывании, чтобы не потерять транзакцию, получившую меньший id, но зафиксированную позже
+    def _fetch_consumption(self, company_id, since, settled_ids=(0, 0), overlap=1000):
+        conn = self.get_read_connection(company_id)
+        cursor = conn.cursor()
+        queries = ('''
+            SELECT product_id, movement_date, SUM(quantity), id > %(settled)s
+            FROM stock_movements
+            WHERE company_id = %(company_id)s AND movement_type = 'out' AND NOT is_adjustment
+                AND movement_date >= %(since)s AND id > %(after)s
+            GROUP BY product_id, movement_date, id > %(settled)s
+        ''', '''
+            SELECT pm.product_id, po.production_date, SUM(pm.quantity_used), pm.id > %(settled)s
+            FROM production_materials pm
+            JOIN production_operations po ON po.id = pm.production_id
+            WHERE po.company_id = %(company_id)s AND po.production_date >= %(since)s AND pm.id > %(after)s
+            GROUP BY pm.product_id, po.production_date, pm.id > %(settled)s
+        ''')
+        rows = []
+        new_settled = []
+        for table, query, after in zip(('stock_movements', 'production_materials'), queries, settled_ids):
+            cursor.execute(f'SELECT COALESCE(MAX(id), 0) FROM {table}')
+            settled = max(cursor.fetchone()[0] - overlap, after)
+            cursor.execute(query, {'company_id': company_id, 'since': since, 'after': after, 'settled': settled})
+            rows.extend(cursor.fetchall())
+            new_settled.append(settled)
+        conn.close()
+        
+        consumption_df = pd.DataFrame(rows, columns=['product_id', 'day', 'quantity', 'tail'])
+        consumption_df['quantity'] = consumption_df['quantity'].astype(float)
+        consumption_df['tail'] = consumption_df['tail'].astype(bool)
+        settled_df = consumption_df.loc[~consumption_df['tail'], ['product_id', 'day', 'quantity']]
+        tail_df = consumption_df.loc[consumption_df['tail'], ['product_id', 'day', 'quantity']]
+        return settled_df, tail_df, tuple(new_settled)
+    
+    # ===== ТРУДОЗАТРАТЫ =====
+    # Пересчет дней целиком: параллельные проводки за тот же день ждут друг друга на блокировке
+    # (компания, день), иначе вторая не увидит строк первой и посчитает ее операцию повторно.
+    # В SQLite записи и так идут по одной (BEGIN IMMEDIATE)
+    def _refresh_labor_daily(self, cursor, company_id, days):
+        days = sorted({str(day) for day in days if day})
+        if self.backend.supports('advisory_locks'):
+            for day in days:
+                cursor.execute("SELECT pg_advisory_xact_lock(%s, %s::date - DATE '2000-01-01')", (company_id, day))
+        cursor.execute('DELETE FROM labor_daily WHERE company_id = %s AND day = ANY(%s::date[])', (company_id, days))
+        cursor.execute('''
+            INSERT INTO labor_daily (company_id, day, employee_id, output_product_id, output_quantity,
+                labor_hours, labor_cost, output_cost, operations)
+            SELECT po.company_id, po.production_date, po.employee_id, po.output_product_id, SUM(po.output_quantity),
+                SUM(COALESCE(po.labor_hours, 0)), SUM(COALESCE(po.labor_cost, 0)), SUM(po.output_cost), COUNT(*)
+            FROM production_operations po
+            WHERE po.company_id = %s AND po.production_date = ANY(%s::date[])
+            GROUP BY po.company_id, po.production_date, po.employee_id, po.output_product_id
+        ''', (company_id, days))
+    
+    def get_labor_report(self, company_id, start_date=None, end_date=None, period='month'):
+        if period not in ('day', 'week', 'month', 'quarter', 'year'):
+            raise ValueError(f"Неизвестный период: {period}")
+        conditions = ['ld.company_id = %(company_id)s']
+        params = {'company_id': company_id, 'period': period}
+        if start_date:
+            conditions.append('ld.day >= %(start_date)s')
+            params['start_date'] = start_date
+        if end_date:
+            conditions.append('ld.day <= %(end_date)s')
+            params['end_date'] = end_date
+        
+        # Выработка считается раздельно по единицам измерения, чтобы не складывать штуки с килограммами
+        query = f'''
+            WITH periods AS (
+                SELECT ld.employee_id, e.name as employee_name, u.short_name as unit_name,
+                    date_trunc(%(period)s, ld.day)::date as period,
+                    SUM(ld.output_quantity) as output_quantity, SUM(ld.labor_hours) as labor_hours,
+                    SUM(ld.labor_cost) as labor_cost, SUM(ld.output_cost) as output_cost,
+                    SUM(ld.operations) as operations
+                FROM labor_daily ld
+                LEFT JOIN employees e ON ld.employee_id = e.id
+                LEFT JOIN products p ON ld.output_product_id = p.id
+                LEFT JOIN units u ON p.unit_id = u.id
+                WHERE {' AND '.join(conditions)}
+                GROUP BY ld.employee_id, e.name, u.short_name, date_trunc(%(period)s, ld.day)
+            )
+            SELECT *,
+                output_quantity / NULLIF(labor_hours, 0) as output_per_hour,
+                labor_cost / NULLIF(output_quantity, 0) as labor_cost_per_unit,
+                (labor_cost + output_cost) / NULLIF(output_quantity, 0) as cost_per_unit,
+                labor_cost / NULLIF(labor_cost + output_cost, 0) as labor_cost_share,
+                output_quantity / NULLIF(SUM(output_quantity) OVER (PARTITION BY period, unit_name), 0) as output_share,
+                output_quantity - LAG(output_quantity) OVER employee_trend as output_change,
+                AVG(output_quantity) OVER (employee_trend ROWS BETWEEN 2 PRECEDING AND CURRENT ROW) as output_trend
+            FROM periods
+            WINDOW employee_trend AS (PARTITION BY employee_id, unit_name ORDER BY period)
+            ORDER BY period, employee_name
+        '''
+        with self._range_read(company_id, start_date, end_date) as conn:
+            return pd.read_sql_query(query, conn, params=params)
     
     # ===== РАСХОДЫ =====
     def add_expense(self, company_id, expense_data):
@@ -485,19 +1715,102 @@ class ProductionDB:
         expense_id = cursor.fetchone()[0]
         conn.commit()
         conn.close()
+        self._mark_write(company_id)
         return expense_id
     
+    def submit_expense(self, company_id, expense_data):
+        if self.write_queue is not None:
+            return self.write_queue.submit_expense(company_id, expense_data)
+        return self._completed(self.add_expense, company_id, expense_data)
+    
     def get_expenses(self, company_id, start_date=None, end_date=None):
-        conn = self.get_connection()
-        query = "SELECT * FROM expenses WHERE company_id = %s"
-        params = [company_id]
-        if start_date:
-            query += " AND expense_date >= %s"
-            params.append(start_date)
-        if end_date:
-            query += " AND expense_date <= %s"
-            params.append(end_date)
-        query += " ORDER BY expense_date DESC"
-        df = pd.read_sql_query(query, conn, params=tuple(params))
-        conn.close()
-        return df
+        name, query, params = self._range_query('expenses', "SELECT * FROM expenses WHERE company_id = %s",
+                                                'expense_date', [company_id], start_date, end_date, 'expense_date DESC')
+        with self._range_read(company_id, start_date, end_date) as conn:
+            df = self._read_prepared(conn, name, query, tuple(params))
+        return self._with_archive('expenses', df, company_id, start_date, end_date)
+    
+    # ===== АРХИВ =====
+    def _with_archive(self, dataset, df, company_id, start_date=None, end_date=None):
+        if self.archive is None:
+            return df
+        archived = self.archive.read(dataset, company_id, start_date, end_date, columns=list(df.columns))
+        if archived is None or archived.empty:
+            return df
+        date_column = ARCHIVE_DATASETS[dataset]
+        archived = archived.reindex(columns=df.columns)
+        # В архиве числа хранятся как float, живые Decimal приводим к тому же типу
+        for column in archived.select_dtypes('number').columns:
+            df[column] = pd.to_numeric(df[column])
+        df = pd.concat([df, archived], ignore_index=True)
+        return df.sort_values(date_column, ascending=False, ignore_index=True)
+    
+    def archive_old_data(self, company_id=None, before_date=None):
+        if self.archive is None:
+            return {"success": False, "message": "Архив не настроен: укажите ARCHIVE_DIR и установите pyarrow"}
+        before_date = to_date(before_date) or datetime.now().date() - timedelta(days=self.archive_retention_days)
+        
+        if company_id is None:
+            conn = self.get_connection()
+            cursor = conn.cursor()
+            cursor.execute('SELECT id FROM companies ORDER BY id')
+            company_ids = [row[0] for row in cursor.fetchall()]
+            conn.close()
+        else:
+            company_ids = [company_id]
+        
+        archived = Counter()
+        for cid in company_ids:
+            result = self._archive_company(cid, before_date)
+            if not result["success"]:
+                return result
+            archived.update(result["archived"])
+        return {"success": True, "before_date": before_date, "archived": dict(archived)}
+    
+    def _archive_company(self, company_id, before_date):
+        conn = self.get_connection('maintenance')
+        cursor = conn.cursor()
+        written = []
+        try:
+            # Строки блокируются до удаления, чтобы в архив и в живые таблицы не попало одно и то же
+            frames = {
+                'stock_movements': pd.read_sql_query(
+                    MOVEMENTS_QUERY + ' AND sm.movement_date < %s FOR UPDATE OF sm',
+                    conn, params=(company_id, before_date)),
+                'production_operations': pd.read_sql_query(
+                    PRODUCTION_QUERY + ' AND po.production_date < %s FOR UPDATE OF po',
+                    conn, params=(company_id, before_date)),
+                'production_materials': pd.read_sql_query('''
+                    SELECT pm.id, pm.production_id, pm.product_id, p.name as product_name,
+                        pm.quantity_used, pm.cost, po.production_date
+                    FROM production_materials pm
+                    JOIN production_operations po ON po.id = pm.production_id
+                    LEFT JOIN products p ON pm.product_id = p.id
+                    WHERE po.company_id = %s AND po.production_date < %s
+                ''', conn, params=(company_id, before_date)),
+                'expenses': pd.read_sql_query(
+                    'SELECT * FROM expenses WHERE company_id = %s AND expense_date < %s FOR UPDATE',
+                    conn, params=(company_id, before_date)),
+            }
+            
+            for dataset, df in frames.items():
+                written.extend(self.archive.write(dataset, company_id, df))
+            
+            cursor.execute('DELETE FROM stock_movements WHERE id = ANY(%s)',
+                         (frames['stock_movements']['id'].astype(int).tolist(),))
+            production_ids = frames['production_operations']['id'].astype(int).tolist()
+            cursor.execute('DELETE FROM production_materials WHERE production_id = ANY(%s)', (production_ids,))
+            cursor.execute('DELETE FROM production_operations WHERE id = ANY(%s)', (production_ids,))
+            cursor.execute('DELETE FROM expenses WHERE id = ANY(%s)',
+                         (frames['expenses']['id'].astype(int).tolist(),))
+            conn.commit()
+            conn.close()
+            self._mark_write(company_id)
+            self.forecaster.invalidate(company_id)
+        except Exception as e:
+            conn.rollback()
+            conn.close()
+            self.archive.remove(written)
+            return {"success": False, "message": str(e)}
+        
+        return {"success": True, "archived": {dataset: len(df) for dataset, df in frames.items()}}
@@ -0,0 +1,145 @@
+import re
+import threading
+
+import psycopg2
+import psycopg2.errors
+import psycopg2.extensions
+import psycopg2.pool
+
+# Текст каждого подготовленного запроса по имени: одно имя — один текст во всех соединениях
+_STATEMENTS = {}
+_STATEMENTS_LOCK = threading.Lock()
+
+class PreparingConnection(psycopg2.extensions.connection):
+    # Соединение помнит, какие запросы на нем уже подготовлены. Новое соединение (в том числе
+    # после обрыва) начинает с пустого набора и готовит запросы заново при первом вызове
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.prepared = set()
+
+def _to_positional(query):
+    counter = iter(range(1, query.count('%s') + 1))
+    return re.sub(r'%s', lambda _: f'${next(counter)}', query).replace('%%', '%')
+
+def execute_prepared(cursor, name, query, params=()):
+    conn = cursor.connection
+    if not isinstance(conn, PreparingConnection):
+        cursor.execute(query, params)
+        return cursor
+    with _STATEMENTS_LOCK:
+        registered = _STATEMENTS.setdefault(name, query)
+    if registered != query:
+        raise ValueError(f"Запрос {name} уже подготовлен с другим текстом")
+    
+    execute_sql = f"EXECUTE {name} ({', '.join(['%s'] * len(params))})" if params else f'EXECUTE {name}'
+    idle = conn.info.transaction_status == psycopg2.extensions.TRANSACTION_STATUS_IDLE
+    try:
+        if name not in conn.prepared:
+            cursor.execute(f'PREPARE {name} AS {_to_positional(query)}')
+            conn.prepared.add(name)
+        cursor.execute(execute_sql, params)
+    except (psycopg2.errors.InvalidSqlStatementName, psycopg2.errors.FeatureNotSupported) as e:
+        # Сервер забыл запрос (DISCARD ALL, переключение пулером) или изменилась схема таблиц
+        # («cached plan must not change result type»): готовим заново. Повтор возможен,
+        # только если ошибка не оборвала уже начатую транзакцию
+        if isinstance(e, psycopg2.errors.InvalidSqlStatementName):
+            conn.prepared.clear()
+        if not idle:
+            raise
+        conn.rollback()
+        if name in conn.prepared:
+            cursor.execute(f'DEALLOCATE {name}')
+        cursor.execute(f'PREPARE {name} AS {_to_positional(query)}')
+        conn.prepared.add(name)
+        cursor.execute(execute_sql, params)
+    return cursor
+
+class PooledConnection:
+    # Обертка соединения из пула: close() возвращает соединение в пул, а не закрывает его,
+    # так что код вида conn = get_connection() ... conn.close() работает без изменений
+    def __init__(self, pool, conn, statement_timeout_ms=None, read=False):
+        self._pool = pool
+        self._conn = conn
+        self._statement_timeout_ms = statement_timeout_ms
+        self._read = read
+    
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+    
+    def close(self):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            self._pool.putconn(conn, reset_timeout=self._statement_timeout_ms is not None, read=self._read)
+    
+    def __del__(self):
+        # Соединение, брошенное после исключения, все равно вернется в пул
+        if self.__dict__.get('_conn') is not None:
+            self.close()
+
+class ConnectionPool:
+    def __init__(self, dsn, min_connections=1, max_connections=10, timeout=30, statement_timeout_ms=None,
+                 write_reserve=0):
+        self.timeout = timeout
+        # Таймаут по умолчанию задается при подключении и переживает RESET; отдельный класс запросов
+        # меняет его на время выдачи соединения (getconn(statement_timeout_ms=...))
+        options = f'-c statement_timeout={int(statement_timeout_ms)}' if statement_timeout_ms else None
+        self.statement_timeout_ms = statement_timeout_ms
+        self._pool = psycopg2.pool.ThreadedConnectionPool(min_connections, max_connections, dsn, options=options,
+                                                          connection_factory=PreparingConnection)
+        # ThreadedConnectionPool при исчерпании сразу бросает ошибку; семафор заставляет подождать
+        self._slots = threading.BoundedSemaphore(max_connections)
+        # Чтения (read=True) сначала берут место из своей доли пула: последние write_reserve
+        # соединений достаются только записям, сколько бы чтений ни ждало
+        self._read_slots = threading.BoundedSemaphore(max(max_connections - write_reserve, 1))
+    
+    def getconn(self, statement_timeout_ms=None, read=False):
+        if read and not self._read_slots.acquire(timeout=self.timeout):
+            raise psycopg2.pool.PoolError("Нет свободных соединений для чтения")
+        if not self._slots.acquire(timeout=self.timeout):
+            if read:
+                self._read_slots.release()
+            raise psycopg2.pool.PoolError("Нет свободных соединений с базой")
+        if statement_timeout_ms == self.statement_timeout_ms:
+            statement_timeout_ms = None
+        conn = None
+        try:
+            conn = self._pool.getconn()
+            if conn.closed:
+                self._pool.putconn(conn, close=True)
+                conn = self._pool.getconn()
+            if statement_timeout_ms is not None:
+                # Уровень сессии, а не SET LOCAL: транзакция остается свободной, и повтор
+                # подготовленного запроса в execute_prepared по-прежнему возможен
+                with conn.cursor() as cursor:
+                    cursor.execute('SET statement_timeout = %s', (int(statement_timeout_ms),))
+                conn.commit()
+        except Exception:
+            if conn is not None and statement_timeout_ms is not None:
+                self._pool.putconn(conn, close=True)
+            self._slots.release()
+            if read:
+                self._read_slots.release()
+            raise
+        return PooledConnection(self, conn, statement_timeout_ms, read)
+    
+    def putconn(self, conn, reset_timeout=False, read=False):
+        try:
+            if not conn.closed and conn.info.transaction_status != psycopg2.extensions.TRANSACTION_STATUS_IDLE:
+                conn.rollback()
+            if reset_timeout and not conn.closed:
+                with conn.cursor() as cursor:
+                    cursor.execute('RESET statement_timeout')
+                conn.commit()
+        except psycopg2.Error:
+            # Соединение с чужим таймаутом в пул не возвращается
+            if reset_timeout:
+                conn.close()
+        try:
+            self._pool.putconn(conn, close=bool(conn.closed))
+        finally:
+            self._slots.release()
+            if read:
+                self._read_slots.release()
+    
+    def closeall(self):
+        self._pool.closeall()
@@ -0,0 +1,54 @@
+import os
+import threading
+import time
+from datetime import datetime
+
+import pandas as pd
+
+class FleetRollup:
+    # Показатели всех компаний для оператора. Полная сборка — один сгруппированный запрос раз в
+    # full_refresh_seconds; между ними пересчитываются только компании, в которые была запись
+    def __init__(self, db, full_refresh_seconds=900):
+        self.db = db
+        self.full_refresh_seconds = full_refresh_seconds
+        self._companies = None
+        self._built_at = None
+        self._built_monotonic = None
+        self._refreshed = set()
+        self._dirty = set()
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+    
+    @classmethod
+    def from_env(cls, db):
+        return cls(db, float(os.getenv('FLEET_FULL_REFRESH_SECONDS', 900)))
+    
+    def mark_dirty(self, *company_ids):
+        with self._lock:
+            self._dirty.update(company_ids)
+    
+    def get(self, force=False):
+        # Одновременно сборку ведет один запрос, остальные ждут его результат
+        with self._refresh_lock:
+            with self._lock:
+                full = force or self._companies is None or \
+                    time.monotonic() - self._built_monotonic > self.full_refresh_seconds
+                dirty, self._dirty = self._dirty, set()
+            try:
+                if full:
+                    companies_df = self.db.get_fleet_kpis()
+                    self._built_at, self._built_monotonic = datetime.now(), time.monotonic()
+                    self._refreshed = set()
+                elif dirty:
+                    changed = self.db.get_fleet_kpis(sorted(dirty))
+                    rest = self._companies[~self._companies['company_id'].isin(changed['company_id'])]
+                    companies_df = pd.concat([rest, changed]).sort_values('company_id', ignore_index=True)
+                    self._refreshed |= dirty
+                else:
+                    companies_df = self._companies
+            except Exception:
+                # Компании остаются помеченными до следующей удачной сборки
+                self.mark_dirty(*dirty)
+                raise
+            self._companies = companies_df
+            return {'companies': companies_df, 'built_at': self._built_at, 'refreshed': len(self._refreshed)}
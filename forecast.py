@@ -0,0 +1,109 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+# Окна расчета среднего расхода (дни) и их веса в итоговой скорости
+FORECAST_WINDOWS = (7, 30, 90)
+FORECAST_WEIGHTS = (0.5, 0.3, 0.2)
+
+def forecast_depletion(daily_df, products_df, today, lead_time_days, cover_days):
+    # Все товары за один проход: матрица товар x день, суммы по окнам через накопленные суммы
+    horizon = max(FORECAST_WINDOWS)
+    days = pd.date_range(today - timedelta(days=horizon - 1), today)
+    product_ids = products_df['id'].to_numpy()
+    
+    matrix = np.zeros((len(product_ids), len(days)))
+    if not daily_df.empty:
+        row = pd.Index(product_ids).get_indexer(daily_df['product_id'])
+        column = days.get_indexer(pd.to_datetime(daily_df['day']))
+        known = (row >= 0) & (column >= 0)
+        np.add.at(matrix, (row[known], column[known]), daily_df['quantity'].to_numpy(dtype=float)[known])
+    
+    totals = np.cumsum(matrix[:, ::-1], axis=1)
+    rate = np.zeros(len(product_ids))
+    for window, weight in zip(FORECAST_WINDOWS, FORECAST_WEIGHTS):
+        rate += weight * totals[:, window - 1] / window
+    
+    stock = products_df['current_stock'].to_numpy(dtype=float)
+    min_stock = products_df['min_stock'].to_numpy(dtype=float)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        days_left = np.where(rate > 0, np.maximum(stock, 0) / rate, np.inf)
+    
+    result = products_df[['id', 'name', 'unit_name', 'current_stock', 'min_stock']].copy()
+    for window in FORECAST_WINDOWS:
+        result[f'rate_{window}d'] = totals[:, window - 1] / window
+    result['daily_rate'] = rate
+    result['days_to_stockout'] = days_left
+    result['stockout_date'] = [today + timedelta(days=int(d)) if np.isfinite(d) else None for d in days_left]
+    result['reorder_quantity'] = np.where(rate > 0, np.maximum(rate * (lead_time_days + cover_days) + min_stock - stock, 0), 0)
+    return result.sort_values('days_to_stockout', ignore_index=True)
+
+class ConsumptionForecaster:
+    # Дневной расход кэшируется по компаниям. После записей дочитываются только строки
+    # с id больше окончательных; последние id_overlap id перечитываются каждый раз, полный
+    # пересчет — раз в full_refresh_seconds
+    def __init__(self, db, lead_time_days=7, cover_days=14, full_refresh_seconds=3600, id_overlap=1000):
+        self.db = db
+        self.lead_time_days = lead_time_days
+        self.cover_days = cover_days
+        self.full_refresh_seconds = full_refresh_seconds
+        self.id_overlap = id_overlap
+        self._cache = {}
+        self._versions = {}
+        self._lock = threading.Lock()
+    
+    @classmethod
+    def from_env(cls, db):
+        return cls(db, int(os.getenv('FORECAST_LEAD_TIME_DAYS', 7)), int(os.getenv('FORECAST_COVER_DAYS', 14)),
+                   int(os.getenv('FORECAST_FULL_REFRESH_SECONDS', 3600)), int(os.getenv('FORECAST_ID_OVERLAP', 1000)))
+    
+    def mark_dirty(self, *company_ids):
+        with self._lock:
+            for company_id in company_ids:
+                self._versions[company_id] = self._versions.get(company_id, 0) + 1
+                if company_id in self._cache:
+                    self._cache[company_id]['result'] = None
+    
+    def invalidate(self, *company_ids):
+        with self._lock:
+            for company_id in company_ids:
+                self._versions[company_id] = self._versions.get(company_id, 0) + 1
+                self._cache.pop(company_id, None)
+    
+    def forecast(self, company_id):
+        today = datetime.now().date()
+        with self._lock:
+            state = self._cache.get(company_id)
+            version = self._versions.get(company_id, 0)
+        if state is not None and state['result'] is not None and state['today'] == today:
+            return state['result']
+        
+        since = today - timedelta(days=max(FORECAST_WINDOWS) - 1)
+        if state is None or time.monotonic() - state['loaded_at'] > self.full_refresh_seconds:
+            settled_df, tail_df, settled_ids = self.db._fetch_consumption(company_id, since, overlap=self.id_overlap)
+            state = {'loaded_at': time.monotonic()}
+        else:
+            delta_df, tail_df, settled_ids = self.db._fetch_consumption(company_id, since, state['settled_ids'],
+                                                                        self.id_overlap)
+            settled_df = self._daily(pd.concat([state['settled'], delta_df], ignore_index=True), since)
+        # Хвост заменяется целиком при каждом чтении, поэтому строки в нем не дублируются
+        daily_df = self._daily(pd.concat([settled_df, tail_df], ignore_index=True), since)
+        
+        products_df = self.db.get_products(company_id)
+        result = forecast_depletion(daily_df, products_df, today, self.lead_time_days, self.cover_days)
+        with self._lock:
+            # Если за время расчета пришли новые записи, результат сразу помечается устаревшим
+            fresh = self._versions.get(company_id, 0) == version
+            state.update({'settled': settled_df, 'settled_ids': settled_ids, 'result': result if fresh else None,
+                          'today': today})
+            self._cache[company_id] = state
+        return result
+    
+    @staticmethod
+    def _daily(consumption_df, since):
+        consumption_df = consumption_df[pd.to_datetime(consumption_df['day']) >= pd.Timestamp(since)]
+        return consumption_df.groupby(['product_id', 'day'], as_index=False)['quantity'].sum()
@@ -0,0 +1,33 @@
+import numpy as np
+import pandas as pd
+
+def count_differences(stock_df, counts_df):
+    # Расхождения инвентаризации одним векторным шагом. Товары, которых нет в пересчете, не трогаются;
+    # несколько строк одного товара (пересчет по местам хранения) складываются
+    counts = counts_df[['product_id', 'counted_quantity']].copy()
+    counts['product_id'] = pd.to_numeric(counts['product_id'], errors='coerce')
+    counts['counted_quantity'] = pd.to_numeric(counts['counted_quantity'], errors='coerce')
+    if counts.isna().any().any():
+        raise ValueError("В пересчете есть пустые или нечисловые значения")
+    if (counts['counted_quantity'] < 0).any():
+        raise ValueError("Фактическое количество не может быть отрицательным")
+    counts['product_id'] = counts['product_id'].astype(int)
+    counts = counts.groupby('product_id', as_index=False)['counted_quantity'].sum()
+    
+    stock = stock_df[['id', 'current_stock', 'avg_cost']].rename(columns={'id': 'product_id'})
+    stock['product_id'] = stock['product_id'].astype(int)
+    merged = counts.merge(stock, on='product_id', how='left', indicator=True)
+    unknown = merged.loc[merged['_merge'] == 'left_only', 'product_id'].astype(int).tolist()
+    merged = merged[merged['_merge'] == 'both'].drop(columns='_merge')
+    
+    current = merged['current_stock'].to_numpy(dtype=float)
+    counted = merged['counted_quantity'].to_numpy(dtype=float).round(2)
+    difference = (counted - current).round(2)
+    merged['counted_quantity'] = counted
+    merged['difference'] = difference
+    merged['movement_type'] = np.where(difference > 0, 'in', 'out')
+    merged['quantity'] = np.abs(difference)
+    merged['avg_cost'] = merged['avg_cost'].to_numpy(dtype=float)
+    merged['total_cost'] = (merged['quantity'] * merged['avg_cost']).round(2)
+    merged['product_id'] = merged['product_id'].astype(int)
+    return merged.reset_index(drop=True), unknown
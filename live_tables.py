@@ -0,0 +1,46 @@
+import time
+
+import pandas as pd
+
+class LiveTable:
+    # DataFrame, который живет в сессии и дочитывает только изменения после водяного знака.
+    # Строки сливаются по ключу, поэтому запрос с перекрытием (overlap) безопасен: он подбирает
+    # записи, зафиксированные позже соседних, не создавая дублей. Удаления дельтой не видны —
+    # их подхватывает полная перезагрузка раз в full_refresh_seconds
+    def __init__(self, load_all, load_since, watermark_column, sort_by, ascending=True, key='id',
+                 overlap=None, keep=None, full_refresh_seconds=300):
+        self.load_all = load_all
+        self.load_since = load_since
+        self.watermark_column = watermark_column
+        self.sort_by = sort_by
+        self.ascending = ascending
+        self.key = key
+        self.overlap = overlap
+        self.keep = keep
+        self.full_refresh_seconds = full_refresh_seconds
+        self.df = None
+        self.watermark = None
+        self.loaded_at = None
+    
+    def get(self):
+        if self.df is None or time.monotonic() - self.loaded_at > self.full_refresh_seconds:
+            self.df = self._prepare(self.load_all())
+            self.loaded_at = time.monotonic()
+        else:
+            since = self.watermark
+            if since is not None and self.overlap is not None:
+                since = since - self.overlap
+            delta = self.load_since(since)
+            if not delta.empty:
+                existing = self.df[~self.df[self.key].isin(delta[self.key])]
+                self.df = self._prepare(pd.concat([existing, delta], ignore_index=True))
+        
+        if not self.df.empty:
+            latest = self.df[self.watermark_column].max()
+            self.watermark = latest if self.watermark is None else max(self.watermark, latest)
+        return self.df
+    
+    def _prepare(self, df):
+        if self.keep is not None and not df.empty:
+            df = df[self.keep(df)]
+        return df.sort_values(self.sort_by, ascending=self.ascending, ignore_index=True)
@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+
+from recipes import RecipeCycleError
+
+def material_requirements(products_df, recipe_df, plan_df):
+    # Потребность в материалах по плану выпуска. Весь каталог обрабатывается векторно:
+    # рецептуры — это список ребер (изделие, компонент, количество), разузлование идет
+    # по низкоуровневым кодам, чтобы каждое изделие нетто-рассчитывалось один раз
+    ids = products_df['id'].to_numpy()
+    n = len(ids)
+    index = pd.Index(ids)
+    stock = products_df['current_stock'].to_numpy(dtype=float)
+    min_stock = products_df['min_stock'].to_numpy(dtype=float)
+    
+    parent = index.get_indexer(recipe_df['product_id'])
+    component = index.get_indexer(recipe_df['component_id'])
+    quantity = recipe_df['quantity'].to_numpy(dtype=float)
+    known = (parent >= 0) & (component >= 0)
+    parent, component, quantity = parent[known], component[known], quantity[known]
+    
+    # Низкоуровневый код: максимальная глубина, на которой изделие встречается в рецептурах
+    level = np.zeros(n, dtype=int)
+    for _ in range(n + 1):
+        new_level = level.copy()
+        np.maximum.at(new_level, component, level[parent] + 1)
+        if np.array_equal(new_level, level):
+            break
+        level = new_level
+    else:
+        raise RecipeCycleError("Рецептуры содержат цикл")
+    
+    has_recipe = np.zeros(n, dtype=bool)
+    has_recipe[parent] = True
+    
+    plan_index = index.get_indexer(plan_df['product_id'])
+    if (plan_index < 0).any():
+        raise ValueError("В плане есть продукты, которых нет в каталоге")
+    production = np.zeros(n)
+    np.add.at(production, plan_index, plan_df['quantity'].to_numpy(dtype=float))
+    
+    gross = np.zeros(n)
+    net = np.zeros(n)
+    edge_level = level[parent]
+    for current in range(level.max() + 1 if n else 0):
+        items = level == current
+        if current > 0:
+            # Нетто-потребность учитывает остаток сверх страхового запаса
+            net[items] = np.where(gross[items] > 0,
+                                  np.maximum(gross[items] + min_stock[items] - stock[items], 0), 0)
+            production[items & has_recipe] += net[items & has_recipe]
+        edges = edge_level == current
+        gross += np.bincount(component[edges], weights=production[parent[edges]] * quantity[edges], minlength=n)
+    
+    result = products_df[['id', 'name', 'unit_name', 'category_name', 'current_stock', 'min_stock']].copy()
+    result['level'] = level
+    result['gross_requirement'] = gross
+    result['net_requirement'] = net
+    result['to_produce'] = np.where(has_recipe, production, 0)
+    result['is_purchased'] = ~has_recipe
+    result['shortage'] = (net > 0) & ~has_recipe
+    result = result[(gross > 0) | (production > 0)]
+    return result.sort_values(['shortage', 'net_requirement'], ascending=False, ignore_index=True)
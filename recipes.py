@@ -0,0 +1,70 @@
+import threading
+from collections import defaultdict
+
+class RecipeCycleError(ValueError):
+    pass
+
+class CostRollup:
+    # Себестоимость по рецептурам: многоуровневое разузлование с запоминанием результатов.
+    # При изменении avg_cost компонента сбрасываются только зависящие от него изделия.
+    # Расчет и сброс идут под одной блокировкой: сброс не может потеряться за записью старого значения
+    def __init__(self, avg_costs, recipe_items):
+        self.avg_cost = {int(product_id): float(cost or 0) for product_id, cost in avg_costs}
+        self.components = defaultdict(list)
+        self.parents = defaultdict(set)
+        for product_id, component_id, quantity in recipe_items:
+            self.components[int(product_id)].append((int(component_id), float(quantity)))
+            self.parents[int(component_id)].add(int(product_id))
+        self._memo = {}
+        self._lock = threading.Lock()
+    
+    def has_recipe(self, product_id):
+        return bool(self.components.get(product_id))
+    
+    def unit_cost(self, product_id):
+        with self._lock:
+            return self._unit_cost(product_id, set())
+    
+    def _unit_cost(self, product_id, visiting):
+        if product_id in self._memo:
+            return self._memo[product_id]
+        components = self.components.get(product_id)
+        if not components:
+            return self.avg_cost.get(product_id, 0.0)
+        
+        if product_id in visiting:
+            raise RecipeCycleError(f"Рецептура содержит цикл (продукт #{product_id})")
+        visiting.add(product_id)
+        cost = sum(quantity * self._unit_cost(component_id, visiting) for component_id, quantity in components)
+        visiting.discard(product_id)
+        self._memo[product_id] = cost
+        return cost
+    
+    def all_costs(self):
+        with self._lock:
+            return {product_id: self._unit_cost(product_id, set()) for product_id in self.avg_cost}
+    
+    def update_avg_cost(self, product_id, avg_cost):
+        with self._lock:
+            self.avg_cost[product_id] = float(avg_cost or 0)
+            self._invalidate(product_id)
+    
+    def invalidate(self, product_id):
+        with self._lock:
+            self._invalidate(product_id)
+    
+    def _invalidate(self, product_id):
+        stack = [product_id]
+        seen = set()
+        while stack:
+            current = stack.pop()
+            if current in seen:
+                continue
+            seen.add(current)
+            self._memo.pop(current, None)
+            stack.extend(self.parents.get(current, ()))
+    
+    def explode(self, product_id, quantity):
+        # Один уровень: полуфабрикаты списываются со склада как готовые компоненты
+        return [(component_id, component_qty * quantity)
+                for component_id, component_qty in self.components.get(product_id, [])]
@@ -0,0 +1,330 @@
+import importlib.util
+import multiprocessing
+import os
+import random
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from archive import ColdArchive
+from storage import connect
+
+REPORT_KINDS = {
+    'stock_valuation': 'Оценка запасов',
+    'production_costs': 'Себестоимость производства',
+    'expenses': 'Сводка расходов',
+    'margins': 'Рентабельность продукции',
+}
+# Отчеты по текущим остаткам и ценам: месяц к ним не применяется, в заголовке — дата построения
+CURRENT_STATE_KINDS = {'stock_valuation', 'margins'}
+
+STREAM_BATCH_SIZE = 2000
+PDF_TABLE_ROWS = 500
+PDF_FONT_PATH = os.getenv('REPORT_PDF_FONT', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf')
+
+# openpyxl и reportlab загружаются только при построении отчета: при старте достаточно знать, что они есть
+def available_formats():
+    formats = []
+    if importlib.util.find_spec('openpyxl') is not None:
+        formats.append('xlsx')
+    if importlib.util.find_spec('reportlab') is not None:
+        formats.append('pdf')
+    return formats
+
+def report_period(kind, month):
+    if kind in CURRENT_STATE_KINDS:
+        return f"на {datetime.now().strftime('%d.%m.%Y')}"
+    return f"за {month}"
+
+def month_bounds(month):
+    start = datetime.strptime(month, '%Y-%m').date()
+    end = datetime(start.year + start.month // 12, start.month % 12 + 1, 1).date()
+    return start, end
+
+# ===== ПОСТРОЕНИЕ ОТЧЕТОВ (выполняется в процессе пула) =====
+def _stream(conn, query, params):
+    # Именованный курсор читает результат порциями на стороне сервера, весь отчет в памяти не держится
+    cursor = conn.cursor(name=f'report_{uuid.uuid4().hex}')
+    cursor.itersize = STREAM_BATCH_SIZE
+    cursor.execute(query, params)
+    for row in cursor:
+        yield row
+    cursor.close()
+
+def _archived_rows(archive, dataset, company_id, start, end, columns):
+    if archive is None:
+        return []
+    df = archive.read(dataset, company_id, start, end)
+    if df is None or df.empty:
+        return []
+    return df.reindex(columns=columns).itertuples(index=False, name=None)
+
+def _report_sections(conn, archive, company_id, kind, start, end):
+    # Отчет — список разделов (название, заголовки, строки); строки отдаются генераторами
+    if kind == 'stock_valuation':
+        return [('Оценка запасов', ['Продукт', 'Категория', 'Ед.', 'Остаток', 'Средняя себестоимость', 'Стоимость'],
+                 _stream(conn, '''
+                     SELECT p.name, c.name, u.short_name, p.current_stock, p.avg_cost, p.current_stock * p.avg_cost
+                     FROM products p
+                     LEFT JOIN categories c ON p.category_id = c.id
+                     LEFT JOIN units u ON p.unit_id = u.id
+                     WHERE p.company_id = %s ORDER BY c.name, p.name
+                 ''', (company_id,)))]
+    
+    if kind == 'production_costs':
+        end_inclusive = end - timedelta(days=1)
+        operations = _stream(conn, '''
+            SELECT po.id, po.production_date, po.operation_name, e.name, p.name, po.output_quantity,
+                po.labor_hours, po.output_cost, m.name, pm.quantity_used, pm.cost
+            FROM production_operations po
+            LEFT JOIN employees e ON po.employee_id = e.id
+            LEFT JOIN products p ON po.output_product_id = p.id
+            LEFT JOIN production_materials pm ON pm.production_id = po.id
+            LEFT JOIN products m ON pm.product_id = m.id
+            WHERE po.company_id = %s AND po.production_date >= %s AND po.production_date < %s
+            ORDER BY po.production_date, po.id, pm.id
+        ''', (company_id, start, end))
+        return [('Себестоимость производства',
+                 ['Операция', 'Дата', 'Название', 'Сотрудник', 'Продукт', 'Выпуск', 'Часы', 'Себестоимость',
+                  'Материал', 'Расход материала', 'Стоимость материала'],
+                 _chain(operations, _archived_production(archive, company_id, start, end_inclusive)))]
+    
+    if kind == 'expenses':
+        end_inclusive = end - timedelta(days=1)
+        columns = ['expense_date', 'category', 'description', 'amount']
+        return [
+            ('Расходы по категориям', ['Категория', 'Количество', 'Сумма'], _stream(conn, '''
+                SELECT category, COUNT(*), SUM(amount) FROM expenses
+                WHERE company_id = %s AND expense_date >= %s AND expense_date < %s
+                GROUP BY category ORDER BY SUM(amount) DESC
+            ''', (company_id, start, end))),
+            ('Расходы', ['Дата', 'Категория', 'Описание', 'Сумма'], _chain(_stream(conn, '''
+                SELECT expense_date, category, description, amount FROM expenses
+                WHERE company_id = %s AND expense_date >= %s AND expense_date < %s
+                ORDER BY expense_date, id
+            ''', (company_id, start, end)), _archived_rows(archive, 'expenses', company_id, start, end_inclusive, columns)))
+        ]
+    
+    if kind == 'margins':
+        return [('Рентабельность продукции', ['Продукт', 'Себестоимость', 'Цена продажи', 'Маржа', 'Маржа, %'],
+                 _stream(conn, '''
+                     SELECT name, avg_cost, selling_price, selling_price - avg_cost,
+                         ROUND((selling_price - avg_cost) / selling_price * 100, 2)
+                     FROM products
+                     WHERE company_id = %s AND avg_cost > 0 AND selling_price > 0 ORDER BY name
+                 ''', (company_id,)))]
+    
+    raise ValueError(f"Неизвестный отчет: {kind}")
+
+def _chain(*iterables):
+    for iterable in iterables:
+        yield from iterable
+
+def _archived_production(archive, company_id, start, end):
+    if archive is None:
+        return
+    operations = archive.read('production_operations', company_id, start, end)
+    if operations is None or operations.empty:
+        return
+    materials = archive.read('production_materials', company_id, start, end)
+    if materials is not None and not materials.empty:
+        operations = operations.merge(materials[['production_id', 'product_name', 'quantity_used', 'cost']]
+                                      .rename(columns={'product_name': 'material_name'}),
+                                      left_on='id', right_on='production_id', how='left')
+    operations = operations.reindex(columns=['id', 'production_date', 'operation_name', 'employee_name',
+                                             'product_name', 'output_quantity', 'labor_hours', 'output_cost',
+                                             'material_name', 'quantity_used', 'cost'])
+    yield from operations.itertuples(index=False, name=None)
+
+def _write_xlsx(path, title, sections):
+    from openpyxl import Workbook
+    # Режим write_only пишет строки в файл потоком, не собирая лист в памяти
+    workbook = Workbook(write_only=True)
+    for name, headers, rows in sections:
+        sheet = workbook.create_sheet(name[:31])
+        sheet.append(headers)
+        for row in rows:
+            sheet.append(row)
+    workbook.save(path)
+
+def _pdf_font():
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+    if os.path.exists(PDF_FONT_PATH):
+        if 'ReportFont' not in pdfmetrics.getRegisteredFontNames():
+            pdfmetrics.registerFont(TTFont('ReportFont', PDF_FONT_PATH))
+        return 'ReportFont'
+    return 'Helvetica'
+
+def _write_pdf(path, title, sections):
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4, landscape
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.platypus import PageBreak, Paragraph, SimpleDocTemplate, Table, TableStyle
+    font = _pdf_font()
+    styles = getSampleStyleSheet()
+    for style in styles.byName.values():
+        style.fontName = font
+    table_style = TableStyle([
+        ('FONTNAME', (0, 0), (-1, -1), font),
+        ('FONTSIZE', (0, 0), (-1, -1), 7),
+        ('BACKGROUND', (0, 0), (-1, 0), colors.lightgrey),
+        ('GRID', (0, 0), (-1, -1), 0.25, colors.grey),
+    ])
+    
+    story = [Paragraph(title, styles['Title'])]
+    for index, (name, headers, rows) in enumerate(sections):
+        if index:
+            story.append(PageBreak())
+        story.append(Paragraph(name, styles['Heading2']))
+        # Длинные таблицы режутся на части: верстка одной огромной таблицы растет нелинейно
+        chunk = []
+        tables = 0
+        for row in rows:
+            chunk.append(['' if value is None else str(round(value, 2)) if isinstance(value, float) else str(value)
+                          for value in row])
+            if len(chunk) == PDF_TABLE_ROWS:
+                story.append(Table([headers] + chunk, repeatRows=1, style=table_style))
+                chunk = []
+                tables += 1
+        if chunk or not tables:
+            story.append(Table([headers] + chunk, repeatRows=1, style=table_style))
+    SimpleDocTemplate(path, pagesize=landscape(A4), title=title).build(story)
+
+def run_report(db_url, company_id, kind, month, fmt, path):
+    conn = connect(db_url)
+    try:
+        return build_report(conn, company_id, kind, month, fmt, path)
+    finally:
+        conn.close()
+
+def build_report(conn, company_id, kind, month, fmt, path):
+    start, end = month_bounds(month)
+    title = f"{REPORT_KINDS[kind]} {report_period(kind, month)}"
+    # Отчет читается одним снимком данных
+    conn.set_session(readonly=True, isolation_level='REPEATABLE READ')
+    sections = _report_sections(conn, ColdArchive.from_env(), company_id, kind, start, end)
+    tmp_path = path + '.tmp'
+    if fmt == 'xlsx':
+        _write_xlsx(tmp_path, title, sections)
+    else:
+        _write_pdf(tmp_path, title, sections)
+    os.replace(tmp_path, path)
+    return path
+
+# ===== ОЧЕРЕДЬ ЗАДАНИЙ (процесс приложения) =====
+class ReportJobs:
+    # Задания уходят в пул процессов (spawn — без унаследованных потоков Streamlit), готовые файлы
+    # лежат на диске ttl_seconds. Одна компания держит в очереди не больше max_pending заданий.
+    # Временная база sqlite:// видна только этому процессу, поэтому для нее отчеты строятся в потоках
+    def __init__(self, db, report_dir, max_workers=2, ttl_seconds=86400, max_pending=3):
+        self.db = db
+        self.report_dir = report_dir
+        self.max_workers = max_workers
+        self.ttl_seconds = ttl_seconds
+        self.max_pending = max_pending
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._executor = None
+        os.makedirs(report_dir, exist_ok=True)
+        self._remove_stale_files()
+    
+    @classmethod
+    def from_env(cls, db):
+        return cls(db, os.getenv('REPORT_DIR', os.path.join(tempfile.gettempdir(), 'production_reports')),
+                   int(os.getenv('REPORT_WORKERS', 2)), int(os.getenv('REPORT_TTL_SECONDS', 86400)),
+                   int(os.getenv('REPORT_MAX_PENDING', 3)))
+    
+    def submit(self, company_id, kind, month, fmt):
+        if kind not in REPORT_KINDS:
+            return {"success": False, "message": "Неизвестный отчет"}
+        if fmt not in available_formats():
+            return {"success": False, "message": f"Формат {fmt} недоступен"}
+        self.cleanup()
+        with self._lock:
+            pending = [job for job in self._jobs.values()
+                       if job['company_id'] == company_id and not job['future'].done()]
+            if len(pending) >= self.max_pending:
+                return {"success": False, "message": "Слишком много отчетов в очереди, дождитесь готовых"}
+            if self._executor is None:
+                if self.db.backend.in_memory:
+                    self._executor = ThreadPoolExecutor(self.max_workers, thread_name_prefix='report')
+                else:
+                    self._executor = ProcessPoolExecutor(self.max_workers,
+                                                         mp_context=multiprocessing.get_context('spawn'))
+            
+            job_id = uuid.uuid4().hex
+            company_dir = os.path.join(self.report_dir, str(company_id))
+            os.makedirs(company_dir, exist_ok=True)
+            path = os.path.join(company_dir, f'{job_id}.{fmt}')
+            if self.db.backend.in_memory:
+                future = self._executor.submit(self._run_in_process, company_id, kind, month, fmt, path)
+            else:
+                # Тяжелое чтение — с реплики, если она есть
+                db_url = random.choice(self.db.replica_urls) if self.db.replica_urls else self.db.db_url
+                future = self._executor.submit(run_report, db_url, company_id, kind, month, fmt, path)
+            self._jobs[job_id] = {'id': job_id, 'company_id': company_id, 'kind': kind, 'month': month,
+                                  'period': report_period(kind, month), 'format': fmt, 'path': path,
+                                  'created_at': datetime.now(), 'future': future, 'finished_at': None}
+        future.add_done_callback(lambda _, job_id=job_id: self._finished(job_id))
+        return {"success": True, "job_id": job_id}
+    
+    # Как и отдельный процесс отчета, соединение без таймаута запросов
+    def _run_in_process(self, company_id, kind, month, fmt, path):
+        conn = self.db.get_connection('maintenance')
+        try:
+            return build_report(conn, company_id, kind, month, fmt, path)
+        finally:
+            conn.close()
+    
+    def _finished(self, job_id):
+        with self._lock:
+            if job_id in self._jobs:
+                self._jobs[job_id]['finished_at'] = time.monotonic()
+    
+    def jobs(self, company_id):
+        self.cleanup()
+        with self._lock:
+            jobs = [job for job in self._jobs.values() if job['company_id'] == company_id]
+        return [self._describe(job) for job in sorted(jobs, key=lambda job: job['created_at'], reverse=True)]
+    
+    def _describe(self, job):
+        future = job['future']
+        if not future.done():
+            status, error = ('running' if future.running() else 'queued'), None
+        elif future.exception() is not None:
+            status, error = 'failed', str(future.exception())
+        else:
+            status, error = 'done', None
+        stamp = job['created_at'].strftime('%Y-%m-%d') if job['kind'] in CURRENT_STATE_KINDS else job['month']
+        return {'id': job['id'], 'kind': job['kind'], 'title': REPORT_KINDS[job['kind']], 'month': job['month'],
+                'period': job['period'], 'format': job['format'], 'status': status, 'error': error, 'created_at': job['created_at'],
+                'path': job['path'] if status == 'done' else None,
+                'file_name': f"{job['kind']}_{stamp}.{job['format']}"}
+    
+    def cleanup(self):
+        now = time.monotonic()
+        with self._lock:
+            expired = [job_id for job_id, job in self._jobs.items()
+                       if job['finished_at'] is not None and now - job['finished_at'] > self.ttl_seconds]
+            for job_id in expired:
+                job = self._jobs.pop(job_id)
+                for path in (job['path'], job['path'] + '.tmp'):
+                    if os.path.exists(path):
+                        os.remove(path)
+    
+    def _remove_stale_files(self):
+        # Файлы от прошлых запусков приложения: заданий для них уже нет
+        cutoff = time.time() - self.ttl_seconds
+        for root, _, files in os.walk(self.report_dir):
+            for name in files:
+                path = os.path.join(root, name)
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+    
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
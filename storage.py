@@ -0,0 +1,391 @@
+import functools
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+import weakref
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import numpy as np
+import pandas as pd
+
+try:
+    import psycopg2
+    import psycopg2.errors
+    import psycopg2.extras
+except ImportError:  # встроенной SQLite драйвер Postgres не нужен
+    psycopg2 = None
+
+if psycopg2 is not None:
+    from db_pool import ConnectionPool, execute_prepared as _execute_prepared_pg
+
+# Сколько параметров SQLite принимает в одном запросе (SQLITE_MAX_VARIABLE_NUMBER с запасом)
+SQLITE_MAX_VARIABLES = 30000
+
+def open_backend(url, pool_min=1, pool_max=10, statement_timeout_ms=None, write_reserve=0):
+    # Хранилище выбирается по схеме DATABASE_URL: sqlite:///относительный.db, sqlite:////абсолютный.db,
+    # sqlite:// — временная база процесса. Все остальное — строка подключения Postgres
+    if url and url.startswith('sqlite:'):
+        return SQLiteBackend(_sqlite_path(url), pool_max, statement_timeout_ms)
+    if psycopg2 is None:
+        raise RuntimeError("Для Postgres установите psycopg2-binary или укажите DATABASE_URL=sqlite:///...")
+    return PostgresBackend(url, pool_min, pool_max, statement_timeout_ms, write_reserve)
+
+def connect(url):
+    # Отдельное соединение вне пула (фоновые процессы отчетов)
+    if url and url.startswith('sqlite:'):
+        return SQLiteConnection(_sqlite_connect(_sqlite_path(url)))
+    return psycopg2.connect(url)
+
+def _sqlite_path(url):
+    path = url[len('sqlite:'):]
+    path = path[3:] if path.startswith('///') else path.lstrip('/')
+    return path or ':memory:'
+
+def execute_prepared(cursor, name, query, params=()):
+    # В SQLite разобранные запросы и так кешируются соединением, отдельный PREPARE не нужен
+    if isinstance(cursor, SQLiteCursor):
+        return cursor.execute(query, params)
+    return _execute_prepared_pg(cursor, name, query, params)
+
+def execute_values(cursor, sql, argslist, template=None, page_size=100, fetch=False):
+    # То же, что psycopg2.extras.execute_values: VALUES %s раскрывается в пачку строк
+    if not isinstance(cursor, SQLiteCursor):
+        return psycopg2.extras.execute_values(cursor, sql, argslist, template=template, page_size=page_size,
+                                              fetch=fetch)
+    rows = [tuple(row) for row in argslist]
+    results = []
+    if rows:
+        template = template or '(' + ', '.join(['%s'] * len(rows[0])) + ')'
+        per_page = max(min(page_size, SQLITE_MAX_VARIABLES // max(template.count('%s'), 1)), 1)
+        for start in range(0, len(rows), per_page):
+            page = rows[start:start + per_page]
+            cursor.execute(sql.replace('%s', ', '.join([template] * len(page)), 1),
+                           [value for row in page for value in row])
+            if fetch:
+                results.extend(cursor.fetchall())
+    return results if fetch else None
+
+# ===== POSTGRES =====
+class PostgresBackend:
+    dialect = 'postgres'
+    features = frozenset({'partitioning', 'replicas', 'copy', 'plpgsql', 'advisory_locks'})
+    in_memory = False
+    
+    def __init__(self, url, pool_min=1, pool_max=10, statement_timeout_ms=None, write_reserve=0):
+        self.url = url
+        self.pool_max = pool_max
+        self.statement_timeout_ms = statement_timeout_ms
+        self.unique_violation = psycopg2.errors.UniqueViolation
+        self.connection_error = psycopg2.OperationalError
+        self._pool = ConnectionPool(url, pool_min, pool_max, statement_timeout_ms=statement_timeout_ms,
+                                    write_reserve=write_reserve)
+        self._replica_pools = {}
+        self._lock = threading.Lock()
+    
+    def supports(self, feature):
+        return feature in self.features
+    
+    # close() у полученного соединения возвращает его в пул. read=True — чтение с основной базы:
+    # оно не занимает соединения, оставленные под записи
+    def connect(self, statement_timeout_ms=None, read=False):
+        return self._pool.getconn(statement_timeout_ms, read)
+    
+    def connect_replica(self, url, statement_timeout_ms=None):
+        with self._lock:
+            if url not in self._replica_pools:
+                self._replica_pools[url] = ConnectionPool(url, 0, self.pool_max,
+                                                          statement_timeout_ms=self.statement_timeout_ms)
+            replica_pool = self._replica_pools[url]
+        return replica_pool.getconn(statement_timeout_ms)
+    
+    def is_timeout(self, error):
+        # Ошибка может прийти обернутой (pandas оборачивает ошибки драйвера в DatabaseError)
+        while error is not None:
+            if isinstance(error, psycopg2.errors.QueryCanceled):
+                return True
+            error = error.__cause__ or error.__context__
+        return False
+
+# ===== SQLITE =====
+class SQLiteBackend:
+    # Встроенная база в файле в режиме WAL: читатели не ждут писателя, запросы идут без сети.
+    # Запись сериализуется (BEGIN IMMEDIATE), поэтому бэкенд рассчитан на одну площадку и тесты
+    dialect = 'sqlite'
+    features = frozenset()
+    
+    def __init__(self, path, pool_max=10, statement_timeout_ms=None):
+        # sqlite:// видна только этому процессу. Общая база в памяти (cache=shared) не подходит:
+        # ее блокировки таблиц не ждут busy_timeout, и параллельные потоки получают "table is locked".
+        # Поэтому база лежит во временном файле в режиме WAL и удаляется вместе с бэкендом
+        self.in_memory = path == ':memory:'
+        if self.in_memory:
+            fd, path = tempfile.mkstemp(prefix='production_', suffix='.db')
+            os.close(fd)
+            weakref.finalize(self, _remove_database, path)
+        self.path = path
+        self.pool_max = pool_max
+        self.statement_timeout_ms = statement_timeout_ms
+        self.unique_violation = sqlite3.IntegrityError
+        self.connection_error = sqlite3.OperationalError
+        self._idle = []
+        self._lock = threading.Lock()
+    
+    def supports(self, feature):
+        return feature in self.features
+    
+    # Число соединений SQLite не ограничено, а писатель в WAL не ждет читателей: резерв под записи не нужен
+    def connect(self, statement_timeout_ms=None, read=False):
+        with self._lock:
+            conn = self._idle.pop() if self._idle else None
+        if statement_timeout_ms is None:
+            statement_timeout_ms = self.statement_timeout_ms
+        return SQLiteConnection(conn or _sqlite_connect(self.path), self, statement_timeout_ms)
+    
+    def connect_replica(self, url, statement_timeout_ms=None):
+        return self.connect(statement_timeout_ms)
+    
+    def is_timeout(self, error):
+        while error is not None:
+            if isinstance(error, sqlite3.OperationalError) and str(error) == 'interrupted':
+                return True
+            error = error.__cause__ or error.__context__
+        return False
+    
+    def _release(self, conn):
+        with self._lock:
+            if len(self._idle) < self.pool_max:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+def _remove_database(path):
+    for file_path in (path, path + '-wal', path + '-shm'):
+        try:
+            os.remove(file_path)
+        except OSError:
+            pass
+
+def _sqlite_connect(path):
+    conn = sqlite3.connect(path, timeout=float(os.getenv('SQLITE_BUSY_TIMEOUT', 30)), isolation_level=None,
+                           check_same_thread=False, uri=path.startswith('file:'),
+                           detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA foreign_keys=ON')
+    conn.create_function('date_trunc', 2, _date_trunc, deterministic=True)
+    # Встроенные lower/upper SQLite понимают только латиницу
+    conn.create_function('lower', 1, lambda value: value.lower() if isinstance(value, str) else value, deterministic=True)
+    conn.create_function('upper', 1, lambda value: value.upper() if isinstance(value, str) else value, deterministic=True)
+    return conn
+
+def _date_trunc(period, value):
+    if value is None:
+        return None
+    day = date.fromisoformat(str(value)[:10])
+    if period == 'week':
+        day -= timedelta(days=day.weekday())
+    elif period == 'month':
+        day = day.replace(day=1)
+    elif period == 'quarter':
+        day = day.replace(month=(day.month - 1) // 3 * 3 + 1, day=1)
+    elif period == 'year':
+        day = day.replace(month=1, day=1)
+    return day.isoformat()
+
+sqlite3.register_adapter(Decimal, float)
+sqlite3.register_adapter(np.int64, int)
+sqlite3.register_adapter(np.int32, int)
+sqlite3.register_adapter(np.float64, float)
+sqlite3.register_adapter(np.bool_, bool)
+sqlite3.register_adapter(date, date.isoformat)
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(' '))
+sqlite3.register_adapter(pd.Timestamp, lambda value: value.to_pydatetime().isoformat(' '))
+sqlite3.register_converter('DATE', lambda value: date.fromisoformat(value.decode()[:10]))
+sqlite3.register_converter('TIMESTAMP', lambda value: datetime.fromisoformat(value.decode()))
+
+class SQLiteConnection:
+    # Соединение с интерфейсом psycopg2: транзакция открывается первой записью (или FOR UPDATE)
+    # и держится до commit()/rollback(). Чтения до нее идут в автокоммите — как READ COMMITTED
+    def __init__(self, conn, backend=None, statement_timeout_ms=None):
+        self._conn = conn
+        self._backend = backend
+        self._snapshot = False
+        self.statement_timeout_ms = statement_timeout_ms
+        self.closed = 0
+    
+    def cursor(self, name=None):
+        # Именованный (серверный) курсор Postgres здесь — обычный курсор: SQLite и так отдает строки по мере чтения
+        return SQLiteCursor(self)
+    
+    def set_session(self, readonly=None, isolation_level=None, **kwargs):
+        if readonly is not None:
+            self._conn.execute(f'PRAGMA query_only={int(bool(readonly))}')
+        # REPEATABLE READ и SERIALIZABLE: все чтения одним снимком, транзакция с первого запроса
+        self._snapshot = str(isolation_level).upper() in ('REPEATABLE READ', 'SERIALIZABLE')
+    
+    # Срок последнего запроса не должен прервать фиксацию
+    def commit(self):
+        self._conn.set_progress_handler(None, 0)
+        if self._conn.in_transaction:
+            self._conn.execute('COMMIT')
+    
+    def rollback(self):
+        self._conn.set_progress_handler(None, 0)
+        if self._conn.in_transaction:
+            self._conn.execute('ROLLBACK')
+    
+    def close(self):
+        if self.closed:
+            return
+        self.closed = 1
+        conn, self._conn = self._conn, None
+        try:
+            conn.set_progress_handler(None, 0)
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            conn.execute('PRAGMA query_only=0')
+        except sqlite3.Error:
+            conn.close()
+            return
+        if self._backend is not None:
+            self._backend._release(conn)
+        else:
+            conn.close()
+    
+    def __del__(self):
+        if self.__dict__.get('_conn') is not None:
+            self.close()
+
+_WRITE = re.compile(r'^\s*(INSERT|UPDATE|DELETE|CREATE|ALTER|DROP|REPLACE)\b', re.IGNORECASE)
+_CTE_WRITE = re.compile(r'^\s*WITH\b.*\b(INSERT\s+INTO|UPDATE\s+\w+|DELETE\s+FROM)\b', re.IGNORECASE | re.DOTALL)
+_FOR_UPDATE = re.compile(r'\s+FOR\s+UPDATE(\s+OF\s+\w+(\s*,\s*\w+)*)?', re.IGNORECASE)
+
+class SQLiteCursor:
+    def __init__(self, connection):
+        self.connection = connection
+        self._cursor = connection._conn.cursor()
+        self.itersize = 2000
+    
+    def execute(self, sql, params=None):
+        conn = self.connection._conn
+        if not conn.in_transaction:
+            if _WRITE.match(sql) or _CTE_WRITE.match(sql) or _FOR_UPDATE.search(sql):
+                # Писатель сразу берет блокировку записи, а не повышает ее посреди транзакции
+                conn.execute('BEGIN IMMEDIATE')
+            elif self.connection._snapshot:
+                conn.execute('BEGIN')
+        sql, params = translate(sql, params)
+        self._arm_timeout()
+        try:
+            self._cursor.execute(sql, params)
+        except sqlite3.OperationalError as e:
+            # ADD COLUMN IF NOT EXISTS: в SQLite условия нет, повтор дает duplicate column
+            if not (_ADD_COLUMN.search(sql) and 'duplicate column name' in str(e)):
+                raise
+        return self
+    
+    def executemany(self, sql, seq_of_params):
+        rows = list(seq_of_params)
+        if not rows:
+            return self
+        conn = self.connection._conn
+        if not conn.in_transaction:
+            conn.execute('BEGIN IMMEDIATE')
+        translated, _ = translate(sql, rows[0])
+        self._arm_timeout()
+        self._cursor.executemany(translated, [tuple(row) for row in rows])
+        return self
+    
+    def _arm_timeout(self):
+        # Аналог statement_timeout: обработчик прогресса прерывает запрос после срока ("interrupted").
+        # Срок отсчитывается от execute и покрывает чтение строк следующими fetch
+        timeout_ms = self.connection.statement_timeout_ms
+        if not timeout_ms:
+            return
+        deadline = time.monotonic() + timeout_ms / 1000
+        self.connection._conn.set_progress_handler(lambda: time.monotonic() > deadline, 10000)
+    
+    def fetchone(self):
+        return self._cursor.fetchone()
+    
+    def fetchmany(self, size=None):
+        return self._cursor.fetchmany(size or self.itersize)
+    
+    def fetchall(self):
+        return self._cursor.fetchall()
+    
+    def __iter__(self):
+        return iter(self._cursor)
+    
+    @property
+    def description(self):
+        return self._cursor.description
+    
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+    
+    def close(self):
+        self._cursor.close()
+
+# ===== ПЕРЕВОД SQL =====
+# Запросы приложения пишутся на диалекте Postgres; для SQLite они переводятся на лету
+_ADD_COLUMN = re.compile(r'\bADD\s+COLUMN\b', re.IGNORECASE)
+_CAST = re.compile(r'::\s*[a-z_]+(\s*\(\s*\d+(\s*,\s*\d+)?\s*\))?(\[\])?', re.IGNORECASE)
+_VALUES_ALIAS = re.compile(r'\(\s*VALUES\s+(.+?)\)\s+AS\s+(\w+)\s*\(([\w\s,]+)\)', re.IGNORECASE | re.DOTALL)
+_REWRITES = [
+    (_FOR_UPDATE, ''),
+    (re.compile(r'\bSERIAL\s+PRIMARY\s+KEY\b', re.IGNORECASE), 'INTEGER PRIMARY KEY AUTOINCREMENT'),
+    (re.compile(r'\b(BIG)?SERIAL\b', re.IGNORECASE), 'INTEGER'),
+    # DECIMAL в SQLite хранится как целое, если дробной части нет, и деление становится целочисленным
+    (re.compile(r'\b(DECIMAL|NUMERIC)\s*\(\s*\d+\s*,\s*\d+\s*\)', re.IGNORECASE), 'REAL'),
+    (re.compile(r'\bADD\s+COLUMN\s+IF\s+NOT\s+EXISTS\b', re.IGNORECASE), 'ADD COLUMN'),
+    (re.compile(r'\bON\s+COMMIT\s+DROP\b', re.IGNORECASE), ''),
+    (re.compile(r'\bIS\s+DISTINCT\s+FROM\b', re.IGNORECASE), 'IS NOT'),
+    (re.compile(r'\bGREATEST\s*\(', re.IGNORECASE), 'MAX('),
+    (re.compile(r'\bLEAST\s*\(', re.IGNORECASE), 'MIN('),
+    (re.compile(r'\bUPDATE\s+(\w+)\s+(?!SET\b)(\w+)\s+SET\b', re.IGNORECASE), r'UPDATE \1 AS \2 SET'),
+]
+_PLACEHOLDER = re.compile(r'=\s*ANY\s*\(\s*(?:%s|%\((\w+)\)s)\s*\)|%\((\w+)\)s|%s|%%')
+
+@functools.lru_cache(maxsize=1024)
+def _translate_text(sql):
+    text = _CAST.sub('', sql)
+    for pattern, replacement in _REWRITES:
+        text = pattern.sub(replacement, text)
+    return _VALUES_ALIAS.sub(_values_alias, text)
+
+def translate(sql, params=None):
+    text = _translate_text(sql)
+    if params is None:
+        return text, ()
+    
+    values = []
+    positional = iter(params) if not isinstance(params, dict) else None
+    
+    def take(name):
+        return params[name] if name else next(positional)
+    
+    def replace(match):
+        token = match.group(0)
+        if token == '%%':
+            return '%'
+        if token.startswith('='):
+            # = ANY(массив) -> IN (?, ?, ...); пустой массив ничего не находит, как и в Postgres
+            items = list(take(match.group(1)))
+            values.extend(items)
+            return 'IN (' + ', '.join(['?'] * len(items)) + ')'
+        values.append(take(match.group(2)))
+        return '?'
+    
+    return _PLACEHOLDER.sub(replace, text), values
+
+def _values_alias(match):
+    # (VALUES ...) AS v(a, b) -> (SELECT column1 AS a, column2 AS b FROM (VALUES ...)) AS v
+    columns = [column.strip() for column in match.group(3).split(',')]
+    select = ', '.join(f'column{i} AS {column}' for i, column in enumerate(columns, 1))
+    return f'(SELECT {select} FROM (VALUES {match.group(1)})) AS {match.group(2)}'
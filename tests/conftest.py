@@ -0,0 +1,32 @@
+import os
+import sys
+
+import pytest
+
+# Модули приложения лежат в корне репозитория, без пакета
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def db(monkeypatch, tmp_path):
+    # Вся база в памяти; очередь записи, фоновое обновление обзора, реплики, архив и уведомления выключены
+    pytest.importorskip('bcrypt')
+    from database import ProductionDB
+    for name in ('WRITE_QUEUE_ENABLED', 'DATABASE_REPLICA_URLS', 'DB_PARTITION_BY_MONTH', 'ARCHIVE_DIR',
+                 'ALERT_WEBHOOK_URL', 'ALERT_FILE'):
+        monkeypatch.delenv(name, raising=False)
+    monkeypatch.setenv('DASHBOARD_REFRESH_SECONDS', '0')
+    monkeypatch.setenv('REPORT_DIR', str(tmp_path))
+    db = ProductionDB('sqlite://')
+    yield db
+    db.reports.shutdown()
+
+@pytest.fixture
+def company(db):
+    # Компания с сырьем на складе, изделием без рецептуры и сотрудником
+    company_id = db.register_user('Пекарня', 'baker', 'secret')['company_id']
+    flour = db.add_product(company_id, {'name': 'Мука', 'category_id': 1, 'unit_id': 2, 'min_stock': 10})
+    bread = db.add_product(company_id, {'name': 'Хлеб', 'category_id': 3, 'unit_id': 1})
+    employee = db.add_employee(company_id, {'name': 'Иван', 'hourly_rate': 300})
+    db.add_stock_movement(company_id, {'product_id': flour, 'movement_type': 'in', 'quantity': 100,
+                                       'price_per_unit': 50, 'total_cost': 5000})
+    return company_id, flour, bread, employee
@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+
+from charts import downsample, lttb, minmax, split_budget, target_points
+
+def test_lttb_keeps_ends_and_peak():
+    x = np.arange(1000, dtype=float)
+    y = np.zeros(1000)
+    y[537] = 100
+    selected = lttb(x, y, 50)
+    assert len(selected) == 50
+    assert selected[0] == 0 and selected[-1] == 999
+    assert 537 in selected
+    assert np.all(np.diff(selected) > 0)
+
+def test_lttb_short_series_is_untouched():
+    x = np.arange(10, dtype=float)
+    assert lttb(x, x, 20).tolist() == list(range(10))
+    assert lttb(x, x, 2).tolist() == list(range(10))
+
+def test_minmax_keeps_extremes_of_each_bucket():
+    rng = np.random.default_rng(0)
+    y = rng.normal(size=1000)
+    y[100], y[900] = 50, -50
+    selected = minmax(np.arange(1000, dtype=float), y, 40)
+    assert len(selected) <= 40
+    assert 100 in selected and 900 in selected
+    assert np.all(np.diff(selected) > 0)
+
+def test_minmax_short_series_is_untouched():
+    x = np.arange(5, dtype=float)
+    assert minmax(x, x, 10).tolist() == list(range(5))
+
+def test_downsample_splits_budget_between_groups():
+    dates = pd.date_range('2024-01-01', periods=500, freq='D')
+    df = pd.concat([
+        pd.DataFrame({'movement_date': dates, 'quantity': np.arange(500.0), 'movement_type': 'in'}),
+        pd.DataFrame({'movement_date': dates, 'quantity': -np.arange(500.0), 'movement_type': 'out'}),
+    ], ignore_index=True)
+    result = downsample(df, 'movement_date', 'quantity', group='movement_type', n_out=100)
+    assert result.groupby('movement_type').size().to_dict() == {'in': 50, 'out': 50}
+    assert downsample(df.head(10), 'movement_date', 'quantity', n_out=100).equals(df.head(10))
+
+def test_budget_is_shared_by_many_series():
+    # 40 товаров на одном графике: общий бюджет не растет с числом рядов
+    dates = pd.date_range('2024-01-01', periods=300, freq='D')
+    df = pd.concat([pd.DataFrame({'movement_date': dates, 'quantity': np.sin(np.arange(300.0) + i), 'product_id': i})
+                    for i in range(40)], ignore_index=True)
+    for method in ('lttb', 'minmax'):
+        result = downsample(df, 'movement_date', 'quantity', n_out=100, group='product_id', method=method)
+        assert len(result) <= 100
+        assert result['product_id'].nunique() == 40
+
+def test_split_budget_gives_short_series_all_points():
+    assert split_budget([5, 1000, 1000], 105).tolist() == [5, 50, 50]
+    assert split_budget([10, 10], 100).tolist() == [10, 10]
+    assert split_budget([100] * 5, 3).tolist() == [1] * 5
+
+def test_target_points_follows_chart_width():
+    assert target_points(600) < target_points(1200)
+    assert target_points(1) == 3
@@ -0,0 +1,86 @@
+import threading
+
+import pytest
+
+def _stock(db, company_id):
+    return db.get_products(company_id).set_index('id')['current_stock'].to_dict()
+
+def test_login(db):
+    assert db.register_user('A', 'user', 'pw')['success']
+    assert not db.register_user('B', 'user', 'pw')['success']
+    assert db.login_user('user', 'pw')['success']
+    assert not db.login_user('user', 'wrong')['success']
+    assert not db.login_user('nobody', 'pw')['success']
+
+def test_production_flow(db, company):
+    company_id, flour, bread, employee = company
+    assert db.set_recipe(company_id, bread, [{'component_id': flour, 'quantity': 0.5}]) == \
+        {"success": True, "components": 1}
+    assert db.get_cost_rollup(company_id).unit_cost(bread) == pytest.approx(25)
+    
+    result = db.produce_from_recipe(company_id, bread, 20, employee_id=employee, labor_hours=3)
+    assert result['success']
+    assert result['output_cost'] == pytest.approx(500)
+    assert _stock(db, company_id) == {flour: 90, bread: 20}
+    
+    labor = db.get_labor_report(company_id)
+    assert labor['labor_hours'].sum() == 3
+    assert labor['labor_cost'].sum() == pytest.approx(900)
+    
+    # На 300 буханок нужно 150 кг муки: остаток 90 при запасе 10 — докупить 70
+    requirements = db.get_material_requirements(company_id, [(bread, 300)]).set_index('id')
+    assert requirements.loc[flour, 'gross_requirement'] == 150
+    assert requirements.loc[flour, 'net_requirement'] == 70
+    assert requirements.loc[flour, 'shortage']
+    
+    deleted = db.delete_production_operation(company_id, result['production_id'])
+    assert deleted['operations_deleted'] == 1
+    assert _stock(db, company_id) == {flour: 100, bread: 0}
+
+def test_companies_are_isolated(db, company):
+    company_id, flour, bread, employee = company
+    other_id = db.register_user('Чужая', 'other', 'pw')['company_id']
+    other_product = db.add_product(other_id, {'name': 'Сахар', 'category_id': 1, 'unit_id': 2})
+    
+    assert db.get_products(other_id)['id'].tolist() == [other_product]
+    assert not db.set_recipe(company_id, bread, [{'component_id': other_product, 'quantity': 1}])['success']
+    with pytest.raises(ValueError):
+        db.add_stock_movement(company_id, {'product_id': other_product, 'movement_type': 'in', 'quantity': 1})
+    
+    db.set_recipe(company_id, bread, [{'component_id': flour, 'quantity': 0.5}])
+    production_id = db.produce_from_recipe(company_id, bread, 10, employee_id=employee)['production_id']
+    assert db.delete_production_operations(other_id, [production_id])['operations_deleted'] == 0
+    assert _stock(db, company_id) == {flour: 95, bread: 10}
+
+def test_concurrent_writers_and_readers(db, company):
+    # sqlite:// обслуживает очередь записи, фоновые обновления и отчеты из разных потоков
+    company_id, flour, _, _ = company
+    errors = []
+    stop = threading.Event()
+    
+    def writer():
+        for _ in range(100):
+            try:
+                db.add_stock_movement(company_id, {'product_id': flour, 'movement_type': 'in', 'quantity': 1})
+            except Exception as e:
+                errors.append(e)
+    
+    def reader():
+        while not stop.is_set():
+            try:
+                db.get_products(company_id)
+            except Exception as e:
+                errors.append(e)
+    
+    writers = [threading.Thread(target=writer) for _ in range(2)]
+    readers = [threading.Thread(target=reader) for _ in range(2)]
+    for thread in writers + readers:
+        thread.start()
+    for thread in writers:
+        thread.join()
+    stop.set()
+    for thread in readers:
+        thread.join()
+    
+    assert errors == []
+    assert _stock(db, company_id)[flour] == 300
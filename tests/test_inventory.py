@@ -0,0 +1,44 @@
+import pandas as pd
+import pytest
+
+from inventory import count_differences
+
+STOCK = pd.DataFrame({'id': [1, 2, 3], 'current_stock': [10.0, 5.0, 0.0], 'avg_cost': [2.0, 3.0, 4.0]})
+
+def test_surplus_and_shortage():
+    counts = pd.DataFrame({'product_id': [1, 2], 'counted_quantity': [12, 4.5]})
+    diff, unknown = count_differences(STOCK, counts)
+    diff = diff.set_index('product_id')
+    assert unknown == []
+    assert diff.loc[1, ['difference', 'movement_type', 'quantity', 'total_cost']].tolist() == [2.0, 'in', 2.0, 4.0]
+    assert diff.loc[2, ['difference', 'movement_type', 'quantity', 'total_cost']].tolist() == [-0.5, 'out', 0.5, 1.5]
+    # Товар 3 не пересчитывали — он не трогается
+    assert 3 not in diff.index
+
+def test_rows_of_one_product_are_summed():
+    counts = pd.DataFrame({'product_id': ['1', '1'], 'counted_quantity': ['4', '6']})
+    diff, _ = count_differences(STOCK, counts)
+    assert diff['counted_quantity'].tolist() == [10.0]
+    assert diff['difference'].tolist() == [0.0]
+
+def test_unknown_products_are_reported():
+    counts = pd.DataFrame({'product_id': [1, 99], 'counted_quantity': [10, 1]})
+    diff, unknown = count_differences(STOCK, counts)
+    assert unknown == [99]
+    assert diff['product_id'].tolist() == [1]
+
+@pytest.mark.parametrize('quantity', ['abc', None, -1])
+def test_invalid_counts_are_rejected(quantity):
+    counts = pd.DataFrame({'product_id': [1], 'counted_quantity': [quantity]})
+    with pytest.raises(ValueError):
+        count_differences(STOCK, counts)
+
+def test_inventory_reconciliation(db, company):
+    company_id, flour, bread, employee = company
+    counts = pd.DataFrame({'product_id': [flour, bread, 999], 'counted_quantity': [95, 2, 1]})
+    result = db.reconcile_inventory(company_id, counts, employee_id=employee)
+    assert result['success']
+    assert (result['adjusted'], result['surplus'], result['shortage']) == (2, 1, 1)
+    assert result['unknown'] == [999]
+    assert result['shortage_value'] == pytest.approx(250)
+    assert db.get_products(company_id).set_index('id')['current_stock'].to_dict() == {flour: 95, bread: 2}
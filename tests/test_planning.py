@@ -0,0 +1,65 @@
+import pandas as pd
+import pytest
+
+from planning import material_requirements
+from recipes import RecipeCycleError
+
+def _products(stock):
+    # stock: id -> (остаток, страховой запас)
+    return pd.DataFrame({
+        'id': list(stock),
+        'name': [f'P{product_id}' for product_id in stock],
+        'unit_name': 'шт',
+        'category_name': 'Сырье',
+        'current_stock': [current for current, _ in stock.values()],
+        'min_stock': [minimum for _, minimum in stock.values()],
+    })
+
+def _recipes(*edges):
+    return pd.DataFrame(edges, columns=['product_id', 'component_id', 'quantity'])
+
+def _plan(**quantities):
+    return pd.DataFrame({'product_id': [int(k[1:]) for k in quantities], 'quantity': list(quantities.values())})
+
+def test_multilevel_netting():
+    # Хлеб (1) <- тесто (2) x1 <- мука (3) x0.5 и соль (4) x0.1
+    products = _products({1: (0, 0), 2: (4, 0), 3: (10, 2), 4: (0, 1)})
+    recipes = _recipes((1, 2, 1.0), (2, 3, 0.5), (2, 4, 0.1))
+    result = material_requirements(products, recipes, _plan(p1=10)).set_index('id')
+    
+    assert result.loc[1, 'to_produce'] == 10
+    assert result.loc[2, 'gross_requirement'] == 10
+    assert result.loc[2, 'net_requirement'] == 6
+    assert result.loc[2, 'to_produce'] == 6
+    # Муки нужно 3, остаток сверх запаса 8 — докупать не нужно
+    assert result.loc[3, 'gross_requirement'] == pytest.approx(3)
+    assert result.loc[3, 'net_requirement'] == 0
+    assert not result.loc[3, 'shortage']
+    # Соли нужно 0.6 плюс запас 1 при нулевом остатке
+    assert result.loc[4, 'net_requirement'] == pytest.approx(1.6)
+    assert result.loc[4, 'shortage']
+    assert list(result.index[:1]) == [4]
+    assert result.loc[[1, 2, 3, 4], 'level'].tolist() == [0, 1, 2, 2]
+
+def test_shared_component_is_netted_once():
+    # Компонент 3 нужен и изделию 1, и изделию 2: потребности складываются до нетто-расчета
+    products = _products({1: (0, 0), 2: (0, 0), 3: (5, 0)})
+    recipes = _recipes((1, 3, 1.0), (2, 3, 2.0))
+    result = material_requirements(products, recipes, _plan(p1=2, p2=3)).set_index('id')
+    assert result.loc[3, 'gross_requirement'] == 8
+    assert result.loc[3, 'net_requirement'] == 3
+
+def test_products_without_demand_are_skipped():
+    products = _products({1: (0, 0), 2: (0, 0), 3: (0, 0)})
+    result = material_requirements(products, _recipes((1, 2, 1.0)), _plan(p1=1))
+    assert sorted(result['id']) == [1, 2]
+
+def test_cycle_is_rejected():
+    products = _products({1: (0, 0), 2: (0, 0)})
+    with pytest.raises(RecipeCycleError):
+        material_requirements(products, _recipes((1, 2, 1.0), (2, 1, 1.0)), _plan(p1=1))
+
+def test_unknown_plan_product_is_rejected():
+    products = _products({1: (0, 0)})
+    with pytest.raises(ValueError):
+        material_requirements(products, _recipes(), _plan(p9=1))
@@ -0,0 +1,82 @@
+import threading
+
+import pytest
+
+from recipes import CostRollup, RecipeCycleError
+
+def _rollup():
+    # Хлеб (1) <- тесто (2) x1.2 <- мука (3) x0.5, вода (4) x0.3
+    return CostRollup([(1, 0), (2, 0), (3, 40), (4, 1)], [(1, 2, 1.2), (2, 3, 0.5), (2, 4, 0.3)])
+
+def test_unit_cost_rolls_up_levels():
+    rollup = _rollup()
+    assert rollup.unit_cost(2) == pytest.approx(20.3)
+    assert rollup.unit_cost(1) == pytest.approx(24.36)
+    assert rollup.unit_cost(3) == 40
+    assert rollup.all_costs()[1] == pytest.approx(24.36)
+
+def test_update_avg_cost_invalidates_parents():
+    rollup = _rollup()
+    rollup.unit_cost(1)
+    rollup.update_avg_cost(3, 50)
+    assert rollup.unit_cost(2) == pytest.approx(25.3)
+    assert rollup.unit_cost(1) == pytest.approx(30.36)
+
+def test_explode_is_one_level():
+    assert _rollup().explode(1, 10) == [(2, 12.0)]
+    assert _rollup().explode(3, 10) == []
+
+def test_cycle_is_detected():
+    rollup = CostRollup([], [(1, 2, 1), (2, 3, 1), (3, 1, 1)])
+    with pytest.raises(RecipeCycleError):
+        rollup.unit_cost(1)
+
+def test_invalidation_is_not_lost_under_concurrency():
+    rollup = _rollup()
+    stop = threading.Event()
+    
+    def reader():
+        while not stop.is_set():
+            rollup.unit_cost(1)
+    
+    threads = [threading.Thread(target=reader) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    try:
+        for price in range(41, 241):
+            rollup.update_avg_cost(3, price)
+    finally:
+        stop.set()
+        for thread in threads:
+            thread.join()
+    assert rollup.unit_cost(1) == pytest.approx(1.2 * (0.5 * 240 + 0.3))
+
+def test_set_recipe_rejects_cycle(db, company):
+    company_id, flour, bread, _ = company
+    assert db.set_recipe(company_id, bread, [{'component_id': flour, 'quantity': 1}])['success']
+    assert not db.set_recipe(company_id, flour, [{'component_id': bread, 'quantity': 1}])['success']
+    assert not db.get_cost_rollup(company_id).has_recipe(flour)
+
+def test_produce_reports_missing_component(db, company):
+    company_id, flour, bread, _ = company
+    db.set_recipe(company_id, bread, [{'component_id': flour, 'quantity': 0.5}])
+    db.get_cost_rollup(company_id)
+    # Компонент удален в обход кеша рецептур
+    conn = db.get_connection()
+    cursor = conn.cursor()
+    cursor.execute('DELETE FROM recipe_items WHERE company_id = %s', (company_id,))
+    cursor.execute('DELETE FROM stock_movements WHERE product_id = %s', (flour,))
+    cursor.execute('DELETE FROM products WHERE id = %s', (flour,))
+    conn.commit()
+    conn.close()
+    
+    result = db.produce_from_recipe(company_id, bread, 1)
+    assert result == {"success": False, "message": f"Товары не найдены: #{flour}"}
+    assert not db.get_cost_rollup(company_id).has_recipe(bread)
+
+def test_recipe_is_scoped_to_company(db, company):
+    company_id, flour, bread, _ = company
+    db.set_recipe(company_id, bread, [{'component_id': flour, 'quantity': 0.5}])
+    other_id = db.register_user('Чужая', 'other', 'pw')['company_id']
+    assert db.get_recipe(company_id, bread)['component_id'].tolist() == [flour]
+    assert db.get_recipe(other_id, bread).empty
@@ -0,0 +1,54 @@
+import pytest
+
+from storage import translate
+
+def test_values_alias_becomes_subquery():
+    sql, params = translate('''
+        UPDATE products p SET avg_cost = v.avg_cost
+        FROM (VALUES (%s, %s)) AS v(id, avg_cost)
+        WHERE p.id = v.id
+    ''', (1, 2.5))
+    assert 'UPDATE products AS p SET' in sql
+    assert '(SELECT column1 AS id, column2 AS avg_cost FROM (VALUES (?, ?))) AS v' in sql
+    assert params == [1, 2.5]
+
+def test_casts_are_dropped():
+    sql, params = translate('SELECT movement_date::date, quantity::numeric(12,2), ids::int[] FROM t')
+    assert sql == 'SELECT movement_date, quantity, ids FROM t'
+    assert params == ()
+
+def test_decimal_columns_become_real():
+    sql, _ = translate('CREATE TABLE t (id SERIAL PRIMARY KEY, amount DECIMAL(12,2))')
+    assert sql == 'CREATE TABLE t (id INTEGER PRIMARY KEY AUTOINCREMENT, amount REAL)'
+
+def test_positional_placeholders():
+    sql, params = translate('SELECT * FROM t WHERE a = %s AND b LIKE %s', (1, 'x%'))
+    assert sql == 'SELECT * FROM t WHERE a = ? AND b LIKE ?'
+    assert params == [1, 'x%']
+
+def test_named_placeholders_repeat():
+    sql, params = translate('SELECT * FROM t WHERE a = %(a)s AND b > %(b)s OR c = %(a)s', {'a': 1, 'b': 2})
+    assert sql == 'SELECT * FROM t WHERE a = ? AND b > ? OR c = ?'
+    assert params == [1, 2, 1]
+
+def test_percent_escape():
+    sql, params = translate("SELECT * FROM t WHERE name LIKE 'a%%' AND id = %s", (3,))
+    assert sql == "SELECT * FROM t WHERE name LIKE 'a%' AND id = ?"
+    assert params == [3]
+
+@pytest.mark.parametrize('ids', [[1, 2, 3], []])
+def test_any_array_expands_to_in(ids):
+    sql, params = translate('SELECT * FROM t WHERE company_id = %s AND id = ANY(%s)', (7, ids))
+    assert sql == 'SELECT * FROM t WHERE company_id = ? AND id IN (' + ', '.join(['?'] * len(ids)) + ')'
+    assert params == [7] + ids
+
+def test_any_named_array():
+    sql, params = translate('SELECT * FROM t WHERE id = ANY(%(ids)s)', {'ids': (4, 5)})
+    assert sql == 'SELECT * FROM t WHERE id IN (?, ?)'
+    assert params == [4, 5]
+
+def test_for_update_is_removed():
+    sql, params = translate('SELECT id FROM products WHERE id = ANY(%s) ORDER BY id FOR UPDATE', ([1],))
+    assert 'FOR UPDATE' not in sql
+    assert sql.strip() == 'SELECT id FROM products WHERE id IN (?) ORDER BY id'
+    assert params == [1]
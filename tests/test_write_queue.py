@@ -0,0 +1,111 @@
+import pytest
+
+from write_queue import GroupCommitQueue
+
+@pytest.fixture
+def companies(db):
+    first = db.register_user('A', 'a', 'pw')['company_id']
+    second = db.register_user('B', 'b', 'pw')['company_id']
+    return {
+        first: db.add_product(first, {'name': 'Мука', 'category_id': 1, 'unit_id': 2}),
+        second: db.add_product(second, {'name': 'Сахар', 'category_id': 1, 'unit_id': 2}),
+    }
+
+def _queue(db, batches):
+    # Длинный интервал: пачку закрывает stop(), так что все отправленное попадает в одну пачку
+    queue = GroupCommitQueue(db, flush_interval_ms=5000)
+    write = queue._write
+    
+    def recording_write(batch):
+        batches.append(len(batch))
+        return write(batch)
+    
+    queue._write = recording_write
+    return queue
+
+def _movement_count(db, company_id):
+    conn = db.get_connection()
+    cursor = conn.cursor()
+    cursor.execute('SELECT COUNT(*) FROM stock_movements WHERE company_id = %s', (company_id,))
+    count = cursor.fetchone()[0]
+    conn.close()
+    return count
+
+def test_batch_is_committed_once(db, companies):
+    (company_id, product_id), (other_id, other_product) = companies.items()
+    batches = []
+    queue = _queue(db, batches)
+    futures = [queue.submit_movement(company_id, {'product_id': product_id, 'movement_type': 'in',
+                                                  'quantity': 10, 'price_per_unit': price})
+               for price in (1, 2, 3)]
+    futures.append(queue.submit_movement(other_id, {'product_id': other_product, 'movement_type': 'in', 'quantity': 4}))
+    futures.append(queue.submit_expense(company_id, {'category': 'Аренда', 'amount': 100}))
+    queue.stop()
+    
+    assert batches == [5]
+    assert all(isinstance(future.result(), int) for future in futures)
+    product = db.get_products(company_id).iloc[0]
+    assert product['current_stock'] == 30
+    assert product['avg_cost'] == pytest.approx(2)
+    assert db.get_products(other_id).iloc[0]['current_stock'] == 4
+    assert len(db.get_expenses(company_id)) == 1
+
+def test_failed_item_does_not_fail_batch(db, companies):
+    (company_id, product_id), (_, other_product) = companies.items()
+    batches = []
+    queue = _queue(db, batches)
+    good = queue.submit_movement(company_id, {'product_id': product_id, 'movement_type': 'in', 'quantity': 5})
+    # Товар другой компании: пачка откатывается и повторяется по одной записи
+    foreign = queue.submit_movement(company_id, {'product_id': other_product, 'movement_type': 'in', 'quantity': 5})
+    expense = queue.submit_expense(company_id, {'category': 'Аренда', 'amount': 100})
+    queue.stop()
+    
+    assert batches == [3, 1, 1, 1]
+    assert isinstance(good.result(), int)
+    assert isinstance(expense.result(), int)
+    with pytest.raises(ValueError):
+        foreign.result()
+    assert _movement_count(db, company_id) == 1
+    assert db.get_products(company_id).iloc[0]['current_stock'] == 5
+
+def test_hook_failure_does_not_repeat_writes(db, companies):
+    (company_id, product_id), _ = companies.items()
+    calls = []
+    
+    def failing_hook(*args):
+        calls.append(args)
+        raise RuntimeError('hook')
+    
+    db._notify_alerts = failing_hook
+    db._mark_write = failing_hook
+    batches = []
+    queue = _queue(db, batches)
+    futures = [queue.submit_movement(company_id, {'product_id': product_id, 'movement_type': 'in', 'quantity': 1})
+               for _ in range(3)]
+    queue.stop()
+    
+    assert batches == [3]
+    assert len({future.result() for future in futures}) == 3
+    assert len(calls) == 2
+    assert _movement_count(db, company_id) == 3
+    assert db.get_products(company_id).iloc[0]['current_stock'] == 3
+
+def test_write_is_marked_before_results(db, companies):
+    # Сразу после result() чтение должно идти с основной базы, а не с отстающей реплики
+    (company_id, product_id), _ = companies.items()
+    futures = []
+    seen = []
+    mark_write = db._mark_write
+    
+    def recording_mark_write(*company_ids):
+        seen.append([future.done() for future in futures])
+        mark_write(*company_ids)
+    
+    db._mark_write = recording_mark_write
+    queue = _queue(db, [])
+    futures.extend(queue.submit_movement(company_id, {'product_id': product_id, 'movement_type': 'in', 'quantity': 1})
+                   for _ in range(2))
+    queue.stop()
+    
+    assert seen == [[False, False]]
+    assert db._recently_written(company_id)
@@ -0,0 +1,21 @@
+import importlib
+
+# Раздел -> модуль страницы. Модуль импортируется при первом заходе на страницу, дальше
+# берется из sys.modules: перезапуск скрипта не переимпортирует страницы и их зависимости
+PAGES = {
+    "📊 Обзор": 'overview',
+    "📦 Склад": 'warehouse',
+    "🏭 Производство": 'production',
+    "💰 Расходы": 'expenses',
+    "📈 Аналитика": 'analytics',
+    "⚙️ Настройки": 'settings',
+}
+
+# Разделы, которые видит только оператор площадки
+OPERATOR_PAGES = {
+    "🛰️ Все компании": 'operator',
+}
+
+def render(page, db, company_id, refresh_every=None):
+    module = PAGES.get(page) or OPERATOR_PAGES[page]
+    importlib.import_module(f'{__name__}.{module}').render(db, company_id, refresh_every)
@@ -0,0 +1,164 @@
+import streamlit as st
+import pandas as pd
+import plotly.express as px
+from datetime import datetime, timedelta
+from charts import downsample, target_points
+from reports import REPORT_KINDS, available_formats
+from admission import QueryRejected
+
+# Графики динамики растянуты на всю ширину широкой раскладки (layout="wide")
+FULL_WIDTH_CHART_PX = 1200
+
+# ========== СТРАНИЦА: АНАЛИТИКА ==========
+def render(db, company_id, refresh_every=None):
+    st.header("📈 Аналитика и отчеты")
+    col1, col2 = st.columns(2)
+    with col1:
+        start_date = st.date_input("Период с", value=datetime.now().date() - timedelta(days=30), key="analytics_start")
+    with col2:
+        end_date = st.date_input("Период по", value=datetime.now().date(), key="analytics_end")
+    
+    # Отчет по труду загружается один раз с группировкой из селектора ниже: итоги по сотрудникам
+    # от группировки не зависят
+    labor_period = st.session_state.get('labor_period', 'month')
+    try:
+        movement_series = db.get_movement_series(company_id, start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d'))
+        labor_df = db.get_labor_report(company_id, start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d'),
+                                       period=labor_period)
+        expenses_df = db.get_expenses(company_id, start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d'))
+    except QueryRejected as e:
+        st.warning(f"⚠️ {e}")
+        return
+    products_df = db.get_products(company_id)
+    
+    st.subheader("📊 Динамика движения товаров")
+    if not movement_series.empty:
+        # На график уходит не больше точек, чем помещается по ширине, независимо от длины периода
+        movements_by_date = downsample(movement_series, 'movement_date', 'quantity', group='movement_type',
+                                       n_out=target_points(FULL_WIDTH_CHART_PX))
+        movements_by_date['Тип'] = movements_by_date['movement_type'].map({'in': '➕ Приход', 'out': '➖ Расход'})
+        fig = px.line(movements_by_date, x='movement_date', y='quantity', color='Тип',
+                      markers=len(movements_by_date) <= 200)
+        st.plotly_chart(fig, use_container_width=True)
+        if len(movements_by_date) < len(movement_series):
+            st.caption(f"Показано {len(movements_by_date)} из {len(movement_series)} точек")
+        
+        with st.expander("🔍 Детализация по продукту"):
+            col1, col2 = st.columns(2)
+            with col1:
+                drill_product = st.selectbox("Продукт", options=products_df['id'].tolist(), key="drill_product",
+                    format_func=lambda x: products_df[products_df['id'] == x]['name'].values[0])
+            with col2:
+                drill_range = st.slider("Окно", min_value=start_date, max_value=max(end_date, start_date + timedelta(days=1)),
+                                        value=(max(start_date, end_date - timedelta(days=30)), end_date), key="drill_range")
+            # Полное разрешение запрашивается только для выбранного окна
+            try:
+                product_series = db.get_movement_series(company_id, drill_range[0].strftime('%Y-%m-%d'),
+                                                        drill_range[1].strftime('%Y-%m-%d'), product_id=drill_product)
+            except QueryRejected as e:
+                st.warning(f"⚠️ {e}")
+                product_series = None
+            if product_series is not None and not product_series.empty:
+                product_series = downsample(product_series, 'movement_date', 'quantity', group='movement_type',
+                                            n_out=target_points(FULL_WIDTH_CHART_PX), method='minmax')
+                product_series['Тип'] = product_series['movement_type'].map({'in': '➕ Приход', 'out': '➖ Расход'})
+                fig = px.line(product_series, x='movement_date', y='quantity', color='Тип',
+                              markers=len(product_series) <= 200, hover_data=['movements'])
+                st.plotly_chart(fig, use_container_width=True)
+            elif product_series is not None:
+                st.info("Движений продукта в выбранном окне нет")
+    else:
+        st.info("Нет данных о движении товаров")
+    
+    col1, col2 = st.columns(2)
+    with col1:
+        st.subheader("🏭 Производительность")
+        if not labor_df.empty:
+            employee_productivity = labor_df.groupby(['employee_name', 'unit_name'])['output_quantity'].sum().reset_index()
+            fig = px.bar(employee_productivity, x='output_quantity', y='employee_name', color='unit_name', orientation='h',
+                        labels={'output_quantity': 'Выработка', 'employee_name': 'Сотрудник', 'unit_name': 'Ед.'})
+            st.plotly_chart(fig, use_container_width=True)
+    with col2:
+        st.subheader("💰 Структура расходов")
+        if not expenses_df.empty:
+            expense_by_category = expenses_df.groupby('category')['amount'].sum().reset_index()
+            fig = px.pie(expense_by_category, values='amount', names='category')
+            st.plotly_chart(fig, use_container_width=True)
+    
+    st.subheader("👷 Трудозатраты и себестоимость")
+    st.selectbox("Группировка", options=['day', 'week', 'month', 'quarter', 'year'], index=2,
+        format_func=lambda x: {'day': 'По дням', 'week': 'По неделям', 'month': 'По месяцам',
+                               'quarter': 'По кварталам', 'year': 'По годам'}[x], key="labor_period")
+    if not labor_df.empty:
+        st.dataframe(labor_df[['period', 'employee_name', 'unit_name', 'operations', 'output_quantity', 'labor_hours',
+                                      'output_per_hour', 'labor_cost', 'labor_cost_per_unit', 'cost_per_unit',
+                                      'labor_cost_share', 'output_change', 'output_trend']],
+                    hide_index=True, use_container_width=True,
+                    column_config={
+                        'labor_cost_share': st.column_config.ProgressColumn("Доля труда", min_value=0, max_value=1, format="%.2f"),
+                        'output_per_hour': st.column_config.NumberColumn("Выработка/час", format="%.2f"),
+                        'labor_cost_per_unit': st.column_config.NumberColumn("Труд ₽/ед", format="%.2f"),
+                        'cost_per_unit': st.column_config.NumberColumn("Себестоимость ₽/ед", format="%.2f"),
+                        'output_trend': st.column_config.NumberColumn("Тренд (3 периода)", format="%.2f")
+                    })
+    else:
+        st.info("Производственных операций за выбранный период нет")
+    
+    st.subheader("💵 Рентабельность продукции")
+    if not products_df.empty:
+        products_with_margin = products_df[(products_df['avg_cost'] > 0) & (products_df['selling_price'] > 0)].copy()
+        if not products_with_margin.empty:
+            products_with_margin['margin'] = products_with_margin['selling_price'] - products_with_margin['avg_cost']
+            products_with_margin['margin_percent'] = (products_with_margin['margin'] / products_with_margin['selling_price'] * 100).round(2)
+            st.dataframe(products_with_margin[['name', 'avg_cost', 'selling_price', 'margin', 'margin_percent']],
+                        hide_index=True, use_container_width=True)
+    
+    st.markdown("---")
+    st.subheader("📥 Отчеты")
+    formats = available_formats()
+    if formats:
+        with st.form("report_form"):
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                report_kind = st.selectbox("Отчет", options=list(REPORT_KINDS), format_func=lambda x: REPORT_KINDS[x])
+            with col2:
+                this_month = datetime.now().date().replace(day=1)
+                months = [(this_month - pd.DateOffset(months=i)).strftime('%Y-%m') for i in range(24)]
+                report_month = st.selectbox("Месяц", options=months)
+            with col3:
+                report_format = st.selectbox("Формат", options=formats, format_func=lambda x: {'xlsx': 'Excel', 'pdf': 'PDF'}[x])
+            st.caption("Оценка запасов и рентабельность строятся по текущим остаткам и ценам, месяц к ним не применяется")
+            if st.form_submit_button("📄 Сформировать", use_container_width=True):
+                result = db.reports.submit(company_id, report_kind, report_month, report_format)
+                if result["success"]:
+                    st.success("✅ Отчет поставлен в очередь")
+                else:
+                    st.error(f"❌ {result['message']}")
+        
+        status_labels = {'queued': '⏳ В очереди', 'running': '⚙️ Формируется', 'done': '✅ Готов', 'failed': '❌ Ошибка'}
+        has_pending = any(job['status'] in ('queued', 'running') for job in db.reports.jobs(company_id))
+        
+        # Пока есть незавершенные отчеты, список опрашивается сам, не перерисовывая страницу
+        @st.fragment(run_every=2 if has_pending else None)
+        def report_jobs():
+            jobs = db.reports.jobs(company_id)
+            for job in jobs:
+                col_name, col_status, col_action = st.columns([3, 1, 1])
+                with col_name:
+                    st.markdown(f"**{job['title']}** {job['period']} ({job['format']})")
+                    st.caption(job['created_at'].strftime('%d.%m.%Y %H:%M:%S'))
+                with col_status:
+                    st.markdown(status_labels[job['status']])
+                    if job['error']:
+                        st.caption(job['error'])
+                with col_action:
+                    if job['status'] == 'done':
+                        with open(job['path'], 'rb') as report_file:
+                            st.download_button("⬇️ Скачать", report_file.read(), file_name=job['file_name'],
+                                               key=f"download_{job['id']}")
+            if has_pending and not any(job['status'] in ('queued', 'running') for job in jobs):
+                st.rerun()
+        
+        report_jobs()
+    else:
+        st.info("Для отчетов установите openpyxl или reportlab")
@@ -0,0 +1,19 @@
+import streamlit as st
+
+from live_tables import LiveTable
+
+# Живые таблицы: DataFrame хранится в сессии, при перерисовке дочитываются только изменения
+def live_table(name, **options):
+    key = f"live_{name}_{st.session_state.company_id}"
+    if key not in st.session_state:
+        st.session_state[key] = LiveTable(**options)
+    return st.session_state[key].get()
+
+# Справочники общие для всех компаний и меняются только при инициализации базы
+@st.cache_data(ttl=3600)
+def get_units(_db):
+    return _db.get_units()
+
+@st.cache_data(ttl=3600)
+def get_categories(_db):
+    return _db.get_categories()
@@ -0,0 +1,60 @@
+import streamlit as st
+import plotly.express as px
+from datetime import datetime, timedelta
+from admission import QueryRejected
+
+# ========== СТРАНИЦА: РАСХОДЫ ==========
+def render(db, company_id, refresh_every=None):
+    st.header("💰 Учет расходов")
+    tab1, tab2 = st.tabs(["➕ Добавить расход", "📋 История расходов"])
+    
+    with tab1:
+        with st.form("expense_form"):
+            col1, col2 = st.columns(2)
+            with col1:
+                expense_category = st.selectbox("Категория расхода*",
+                    options=["Зарплаты", "Аренда", "Электроэнергия", "Транспорт", "Связь", "Ремонт", "Налоги", "Маркетинг", "Офис", "Другое"])
+                amount = st.number_input("Сумма (₽)*", min_value=0.0, value=0.0, step=10.0)
+            with col2:
+                expense_date = st.date_input("Дата расхода", value=datetime.now())
+                description = st.text_area("Описание")
+            
+            if st.form_submit_button("💾 Добавить расход", use_container_width=True):
+                if amount <= 0:
+                    st.error("Укажите сумму расхода")
+                else:
+                    expense_data = {'category': expense_category, 'description': description,
+                                   'amount': amount, 'expense_date': expense_date.strftime('%Y-%m-%d')}
+                    db.submit_expense(company_id, expense_data).result()
+                    st.success("✅ Расход добавлен!")
+                    st.rerun()
+    
+    with tab2:
+        col1, col2 = st.columns(2)
+        with col1:
+            start_date = st.date_input("С даты", value=datetime.now().date() - timedelta(days=30), key="expense_start")
+        with col2:
+            end_date = st.date_input("По дату", value=datetime.now().date(), key="expense_end")
+        
+        try:
+            expenses_df = db.get_expenses(company_id, start_date.strftime('%Y-%m-%d'), end_date.strftime('%Y-%m-%d'))
+        except QueryRejected as e:
+            st.warning(f"⚠️ {e}")
+            expenses_df = None
+        
+        if expenses_df is not None and not expenses_df.empty:
+            st.dataframe(expenses_df[['expense_date', 'category', 'description', 'amount']],
+                        hide_index=True, use_container_width=True)
+            
+            col1, col2 = st.columns(2)
+            with col1:
+                category_expenses = expenses_df.groupby('category')['amount'].sum().reset_index()
+                fig = px.bar(category_expenses, x='amount', y='category', orientation='h',
+                           labels={'amount': 'Сумма (₽)', 'category': 'Категория'}, color='amount')
+                st.plotly_chart(fig, use_container_width=True)
+            with col2:
+                st.metric("Всего расходов", f"{expenses_df['amount'].sum():,.2f} ₽")
+                st.metric("Средний расход", f"{expenses_df['amount'].mean():,.2f} ₽")
+                st.metric("Максимальный расход", f"{expenses_df['amount'].max():,.2f} ₽")
+        elif expenses_df is not None:
+            st.info("Расходов за выбранный период нет")
@@ -0,0 +1,71 @@
+import streamlit as st
+import pandas as pd
+import plotly.express as px
+from admission import QueryRejected
+
+# ========== СТРАНИЦА: ВСЕ КОМПАНИИ (оператор) ==========
+def render(db, company_id, refresh_every=None):
+    st.header("🛰️ Все компании")
+    if not st.session_state.get('is_operator'):
+        st.error("Раздел доступен только оператору")
+        return
+    
+    col1, col2 = st.columns([4, 1])
+    with col2:
+        force = st.button("🔄 Пересобрать", use_container_width=True)
+    try:
+        fleet = db.get_fleet_overview(force=force)
+    except QueryRejected as e:
+        st.warning(f"⚠️ {e}")
+        return
+    companies_df = fleet['companies']
+    with col1:
+        st.caption(f"🕒 Полная сборка в {fleet['built_at'].strftime('%H:%M:%S')}, "
+                   f"с тех пор пересчитано компаний: {fleet['refreshed']}")
+    
+    if companies_df.empty:
+        st.info("Компаний пока нет")
+        return
+    
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        st.metric("Компаний", len(companies_df))
+    with col2:
+        st.metric("Стоимость запасов", f"{companies_df['stock_value'].sum():,.2f} ₽")
+    with col3:
+        st.metric("Расходы за месяц", f"{companies_df['expenses_month'].sum():,.2f} ₽")
+    with col4:
+        st.metric("Производств за месяц", int(companies_df['production_count'].sum()))
+    
+    st.markdown("---")
+    search = st.text_input("🔍 Компания", placeholder="Часть названия")
+    shown = companies_df
+    if search:
+        shown = shown[shown['company_name'].str.contains(search, case=False, regex=False)]
+    st.dataframe(shown.sort_values('stock_value', ascending=False), hide_index=True, use_container_width=True,
+                 column_config={
+                     'company_id': st.column_config.NumberColumn("ID"),
+                     'company_name': st.column_config.TextColumn("Компания"),
+                     'products': st.column_config.NumberColumn("Позиций"),
+                     'stock_value': st.column_config.NumberColumn("Запасы, ₽", format="%.2f"),
+                     'low_stock': st.column_config.NumberColumn("Низкие остатки"),
+                     'expenses_month': st.column_config.NumberColumn("Расходы за месяц, ₽", format="%.2f"),
+                     'production_count': st.column_config.NumberColumn("Производств"),
+                     'output_cost': st.column_config.NumberColumn("Себестоимость выпуска, ₽", format="%.2f")
+                 })
+    
+    st.subheader("📊 Крупнейшие по запасам")
+    top = companies_df.nlargest(15, 'stock_value')
+    fig = px.bar(top, x='stock_value', y='company_name', orientation='h',
+                 labels={'stock_value': 'Запасы (₽)', 'company_name': 'Компания'})
+    fig.update_layout(yaxis={'categoryorder': 'total ascending'})
+    st.plotly_chart(fig, use_container_width=True)
+    
+    with st.expander("🚦 Допуск тяжелых запросов"):
+        # Счетчики решений с запуска процесса: класс.решение — количество
+        admission_stats = db.get_admission_stats()
+        if admission_stats:
+            st.dataframe(pd.DataFrame(list(admission_stats.items()), columns=['Решение', 'Запросов']),
+                         hide_index=True, use_container_width=True)
+        else:
+            st.caption("Запросов за период пока не было")
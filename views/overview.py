@@ -0,0 +1,99 @@
+import streamlit as st
+import pandas as pd
+import numpy as np
+from datetime import datetime, timedelta
+import time
+from views.common import live_table
+
+# ========== СТРАНИЦА: ОБЗОР ==========
+def render(db, company_id, refresh_every=None):
+    st.header("📊 Общий обзор")
+    
+    overview = db.get_overview(company_id)
+    products_df = overview['products']
+    snapshot_age = time.monotonic() - overview['built_monotonic']
+    st.caption(f"🕒 Данные на {overview['built_at'].strftime('%H:%M:%S')} ({snapshot_age:.0f} с назад)")
+    
+    col1, col2, col3, col4 = st.columns(4)
+    
+    with col1:
+        st.metric("Позиций на складе", len(products_df))
+    
+    with col2:
+        st.metric("Стоимость запасов", f"{overview['total_value']:,.2f} ₽")
+    
+    with col3:
+        st.metric("Расходы за месяц", f"{overview['expenses_month']:,.2f} ₽")
+    
+    with col4:
+        st.metric("Производств за месяц", overview['production_count'])
+    
+    st.markdown("---")
+    
+    col1, col2 = st.columns(2)
+    
+    with col1:
+        st.subheader("📦 Текущие запасы")
+        if not products_df.empty:
+            stock_data = products_df[['name', 'current_stock', 'unit_name', 'category_name']].copy()
+            stock_data = stock_data[stock_data['current_stock'] > 0]
+            if not stock_data.empty:
+                st.dataframe(stock_data, hide_index=True, use_container_width=True)
+            else:
+                st.info("Склад пуст")
+        else:
+            st.info("Товары не добавлены")
+    
+    with col2:
+        st.subheader("⚠️ Низкие остатки")
+        if not products_df.empty:
+            low_stock = overview['low_stock']
+            if not low_stock.empty:
+                st.dataframe(low_stock[['product_name', 'current_stock', 'min_stock', 'unit_name']], 
+                           hide_index=True, use_container_width=True)
+            else:
+                st.success("✅ Все товары в норме")
+        else:
+            st.info("Товары не добавлены")
+    
+    st.markdown("---")
+    st.subheader("⏳ Скоро закончатся")
+    
+    if not products_df.empty:
+        forecast_df = overview['forecast']
+        running_out = forecast_df[np.isfinite(forecast_df['days_to_stockout'])].head(10)
+        if not running_out.empty:
+            st.dataframe(running_out[['name', 'current_stock', 'unit_name', 'daily_rate', 'days_to_stockout',
+                                      'stockout_date', 'reorder_quantity']],
+                        hide_index=True, use_container_width=True,
+                        column_config={
+                            'daily_rate': st.column_config.NumberColumn("Расход в день", format="%.2f"),
+                            'days_to_stockout': st.column_config.NumberColumn("Дней до нуля", format="%.1f"),
+                            'stockout_date': st.column_config.DateColumn("Закончится"),
+                            'reorder_quantity': st.column_config.NumberColumn("Рекомендуемый заказ", format="%.2f")
+                        })
+        else:
+            st.info("Расхода за последние 90 дней нет")
+    else:
+        st.info("Товары не добавлены")
+    
+    st.markdown("---")
+    st.subheader("📋 Последние движения (неделя)")
+    
+    @st.fragment(run_every=refresh_every)
+    def recent_movements():
+        week_ago = datetime.now().date() - timedelta(days=7)
+        movements_week = live_table('movements_week',
+            load_all=lambda: db.get_stock_movements(company_id, week_ago.strftime('%Y-%m-%d')),
+            load_since=lambda last_id: db.get_stock_movements_since(company_id, last_id, week_ago.strftime('%Y-%m-%d')),
+            watermark_column='id', sort_by=['movement_date', 'id'], ascending=False, overlap=100,
+            keep=lambda df: pd.to_datetime(df['movement_date']) >= pd.Timestamp(datetime.now().date() - timedelta(days=7)))
+        if not movements_week.empty:
+            movements_display = movements_week[['movement_date', 'product_name', 'movement_type', 
+                                               'quantity', 'unit_name', 'employee_name']].head(10)
+            movements_display['movement_type'] = movements_display['movement_type'].map({'in': '➕ Приход', 'out': '➖ Расход'})
+            st.dataframe(movements_display, hide_index=True, use_container_width=True)
+        else:
+            st.info("Движений за последнюю неделю нет")
+    
+    recent_movements()
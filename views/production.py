@@ -0,0 +1,328 @@
+import streamlit as st
+import pandas as pd
+from datetime import datetime, timedelta
+import time
+from admission import QueryRejected
+
+# ========== СТРАНИЦА: ПРОИЗВОДСТВО ==========
+def render(db, company_id, refresh_every=None):
+    st.header("🏭 Производственный учет")
+    
+    tab1, tab2, tab3, tab4 = st.tabs(["➕ Новая операция", "📋 История производства", "📐 Рецептуры", "📋 Планирование"])
+    
+    with tab1:
+        st.subheader("➕ Добавить производственную операцию")
+        products_df = db.get_products(company_id)
+        employees_df = db.get_employees(company_id)
+        
+        if products_df.empty or employees_df.empty:
+            st.warning("⚠️ Сначала добавьте продукты и сотрудников")
+        else:
+            col1, col2 = st.columns(2)
+            with col1:
+                operation_name = st.text_input("Название операции*", placeholder="Распиловка бревен")
+                production_date = st.date_input("Дата производства", value=datetime.now())
+            with col2:
+                employee_id = st.selectbox("Сотрудник*", options=employees_df['id'].tolist(),
+                    format_func=lambda x: employees_df[employees_df['id']==x]['name'].values[0])
+                additional_costs = st.number_input("Дополнительные расходы (₽)", min_value=0.0, value=0.0, step=10.0)
+                labor_hours = st.number_input("Отработано часов", min_value=0.0, value=0.0, step=0.5)
+            
+            st.markdown("---")
+            st.markdown("#### 📦 Использованные материалы")
+            
+            if 'materials_count' not in st.session_state:
+                st.session_state.materials_count = 1
+            
+            materials_used = []
+            materials_valid = True
+            
+            for i in range(st.session_state.materials_count):
+                st.markdown(f"**Материал {i+1}:**")
+                col1, col2, col3 = st.columns([3, 2, 1])
+                
+                with col1:
+                    material_id = st.selectbox(f"Продукт", options=products_df['id'].tolist(),
+                        format_func=lambda x: f"{products_df[products_df['id']==x]['name'].values[0]} (остаток: {products_df[products_df['id']==x]['current_stock'].values[0]:.2f})",
+                        key=f"material_id_{i}")
+                
+                with col2:
+                    selected_material = products_df[products_df['id']==material_id].iloc[0]
+                    max_qty = selected_material['current_stock']
+                    
+                    if max_qty <= 0:
+                        st.error(f"Нет в наличии")
+                        materials_valid = False
+                        material_qty = 0
+                    else:
+                        material_qty = st.number_input(f"Количество (макс: {max_qty:.2f})",
+                            min_value=0.0, max_value=float(max_qty), value=min(1.0, float(max_qty)), step=0.1, key=f"material_qty_{i}")
+                
+                with col3:
+                    st.markdown("&nbsp;")
+                    st.markdown(f"*{selected_material['unit_name']}*")
+                
+                material_cost = material_qty * selected_material['avg_cost']
+                st.caption(f"Стоимость материала: {material_cost:.2f} ₽")
+                materials_used.append({'product_id': material_id, 'quantity_used': material_qty, 'cost': material_cost})
+            
+            col1, col2 = st.columns(2)
+            with col1:
+                if st.button("➕ Добавить еще материал"):
+                    st.session_state.materials_count += 1
+                    st.rerun()
+            with col2:
+                if st.session_state.materials_count > 1:
+                    if st.button("➖ Удалить последний"):
+                        st.session_state.materials_count -= 1
+                        st.rerun()
+            
+            st.markdown("---")
+            st.markdown("#### 📤 Результат производства")
+            
+            col1, col2 = st.columns(2)
+            with col1:
+                output_product_id = st.selectbox("Готовая продукция*", options=products_df['id'].tolist(),
+                    format_func=lambda x: f"{products_df[products_df['id']==x]['name'].values[0]} ({products_df[products_df['id']==x]['unit_name'].values[0]})")
+            with col2:
+                output_quantity = st.number_input("Количество произведено*", min_value=0.0, value=1.0, step=0.1)
+            
+            notes = st.text_area("Примечание")
+            
+            total_materials_cost = sum([m['cost'] for m in materials_used])
+            total_cost = total_materials_cost + additional_costs
+            cost_per_unit = total_cost / output_quantity if output_quantity > 0 else 0
+            
+            st.markdown("---")
+            col1, col2, col3, col4 = st.columns(4)
+            with col1:
+                st.metric("Материалы", f"{total_materials_cost:.2f} ₽")
+            with col2:
+                st.metric("Доп. расходы", f"{additional_costs:.2f} ₽")
+            with col3:
+                st.metric("Итого", f"{total_cost:.2f} ₽")
+            with col4:
+                st.metric("Себестоимость/ед", f"{cost_per_unit:.2f} ₽")
+            
+            if st.button("🏭 Создать производственную операцию", use_container_width=True, type="primary"):
+                if not operation_name:
+                    st.error("Укажите название операции")
+                elif not materials_valid:
+                    st.error("Недостаточно материалов на складе")
+                elif output_quantity <= 0:
+                    st.error("Укажите количество произведенной продукции")
+                else:
+                    production_data = {
+                        'operation_name': operation_name, 'employee_id': employee_id,
+                        'output_product_id': output_product_id, 'output_quantity': output_quantity,
+                        'output_cost': additional_costs, 'production_date': production_date.strftime('%Y-%m-%d'),
+                        'labor_hours': labor_hours, 'notes': notes
+                    }
+                    try:
+                        db.add_production_operation(company_id, production_data, materials_used)
+                        st.success("🎉 **ПРОИЗВОДСТВЕННАЯ ОПЕРАЦИЯ УСПЕШНО СОЗДАНА!**")
+                        st.balloons()
+                        output_unit = products_df[products_df['id']==output_product_id]['unit_name'].values[0]
+                        st.info(f"**Произведено:** {output_quantity:.2f} {output_unit}, **Себестоимость:** {cost_per_unit:.2f} ₽/ед")
+                        st.session_state.materials_count = 1
+                        time.sleep(2)
+                        st.rerun()
+                    except Exception as e:
+                        st.error(f"Ошибка: {str(e)}")
+    
+    with tab2:
+        st.subheader("📋 История производственных операций")
+        col1, col2 = st.columns(2)
+        with col1:
+            start_date = st.date_input("С даты", value=datetime.now().date() - timedelta(days=30), key="prod_start")
+        with col2:
+            end_date = st.date_input("По дату", value=datetime.now().date(), key="prod_end")
+        
+        try:
+            production_df = db.get_production_operations(company_id, start_date.strftime('%Y-%m-%d'),
+                                                         end_date.strftime('%Y-%m-%d'))
+        except QueryRejected as e:
+            st.warning(f"⚠️ {e}")
+            production_df = None
+        
+        if production_df is not None and not production_df.empty:
+            production_df['cost_per_unit'] = production_df['output_cost'] / production_df['output_quantity']
+            
+            col1, col2 = st.columns([4, 1])
+            with col1:
+                selected_ids = st.multiselect("Выбрать операции для удаления",
+                    options=production_df['id'].tolist(),
+                    format_func=lambda x: f"{production_df[production_df['id']==x]['production_date'].values[0]} — {production_df[production_df['id']==x]['operation_name'].values[0]}",
+                    key="prod_delete_selected")
+            with col2:
+                st.markdown("&nbsp;")
+                if st.button("🗑️ Удалить выбранные", disabled=not selected_ids, use_container_width=True):
+                    result = db.delete_production_operations(company_id, selected_ids)
+                    if result["success"]:
+                        st.session_state.pop("prod_delete_selected", None)
+                        st.success(f"✅ Удалено операций: {result['operations_deleted']}")
+                        st.info(f"Материалов возвращено: {result['materials_returned']}, списано: {result['output_removed']:.2f}")
+                        st.rerun()
+                    else:
+                        st.error(result['message'])
+            st.markdown("---")
+            
+            for idx, row in production_df.iterrows():
+                col1, col2, col3, col4, col5 = st.columns([2, 2, 2, 2, 1])
+                with col1:
+                    st.markdown(f"**{row['production_date']}**")
+                    st.caption(f"{row['operation_name']}")
+                with col2:
+                    st.text(f"👷 {row['employee_name']}")
+                with col3:
+                    st.text(f"📦 {row['output_product_name']}")
+                    st.caption(f"{row['output_quantity']:.2f} {row['output_unit']}")
+                with col4:
+                    st.text(f"💰 {row['output_cost']:.2f} ₽")
+                    st.caption(f"{row['cost_per_unit']:.2f} ₽/ед")
+                with col5:
+                    if st.button("🗑️", key=f"del_{row['id']}", help="Удалить"):
+                        result = db.delete_production_operation(company_id, row['id'])
+                        if result["success"]:
+                            st.success("✅ Операция удалена!")
+                            st.info(f"Материалов возвращено: {result['materials_returned']}, списано: {result['output_removed']:.2f}")
+                            time.sleep(2)
+                            st.rerun()
+                        else:
+                            st.error(result['message'])
+                st.markdown("---")
+            
+            col1, col2, col3 = st.columns(3)
+            with col1:
+                st.metric("Всего операций", len(production_df))
+            with col2:
+                st.metric("Произведено единиц", f"{production_df['output_quantity'].sum():.2f}")
+            with col3:
+                st.metric("Общие расходы", f"{production_df['output_cost'].sum():.2f} ₽")
+        elif production_df is not None:
+            st.info("Производственных операций за выбранный период нет")
+    
+    with tab3:
+        st.subheader("📐 Рецептуры")
+        products_df = db.get_products(company_id)
+        employees_df = db.get_employees(company_id)
+        
+        if products_df.empty:
+            st.warning("⚠️ Сначала добавьте продукты в разделе 'Настройки'")
+        else:
+            product_labels = {row['id']: f"{row['name']} ({row['unit_name']})" for _, row in products_df.iterrows()}
+            label_to_id = {label: pid for pid, label in product_labels.items()}
+            
+            recipe_product_id = st.selectbox("Продукт", options=products_df['id'].tolist(),
+                format_func=lambda x: product_labels[x], key="recipe_product")
+            recipe_df = db.get_recipe(company_id, recipe_product_id)
+            editor_df = pd.DataFrame({
+                'Компонент': [product_labels.get(x) for x in recipe_df['component_id']],
+                'Количество на единицу': recipe_df['quantity'].astype(float)
+            })
+            edited_df = st.data_editor(editor_df, num_rows="dynamic", hide_index=True, use_container_width=True,
+                column_config={
+                    'Компонент': st.column_config.SelectboxColumn(
+                        options=[label for pid, label in product_labels.items() if pid != recipe_product_id], required=True),
+                    'Количество на единицу': st.column_config.NumberColumn(min_value=0.0, step=0.001, format="%.3f", required=True)
+                }, key=f"recipe_editor_{recipe_product_id}")
+            
+            rollup = db.get_cost_rollup(company_id)
+            col1, col2 = st.columns([1, 3])
+            with col1:
+                if st.button("💾 Сохранить рецептуру", use_container_width=True):
+                    components = [{'component_id': label_to_id[row['Компонент']], 'quantity': row['Количество на единицу']}
+                                  for _, row in edited_df.dropna().iterrows()]
+                    result = db.set_recipe(company_id, recipe_product_id, components)
+                    if result["success"]:
+                        st.success(f"✅ Рецептура сохранена, компонентов: {result['components']}")
+                        st.rerun()
+                    else:
+                        st.error(result['message'])
+            with col2:
+                if rollup.has_recipe(recipe_product_id):
+                    st.metric("Себестоимость по рецептуре", f"{rollup.unit_cost(recipe_product_id):.2f} ₽/ед")
+            
+            st.markdown("---")
+            st.markdown("#### 🏭 Производство по рецептуре")
+            recipe_costs = db.get_recipe_costs(company_id)
+            
+            if recipe_costs.empty:
+                st.info("Рецептуры не заданы")
+            else:
+                st.dataframe(recipe_costs[['name', 'category_name', 'unit_name', 'avg_cost', 'rollup_cost']],
+                            hide_index=True, use_container_width=True)
+                
+                with st.form("recipe_production_form"):
+                    col1, col2 = st.columns(2)
+                    with col1:
+                        output_product_id = st.selectbox("Продукт*", options=recipe_costs['id'].tolist(),
+                            format_func=lambda x: product_labels[x])
+                        output_quantity = st.number_input("Количество*", min_value=0.0, value=1.0, step=0.1)
+                        additional_costs = st.number_input("Дополнительные расходы (₽)", min_value=0.0, value=0.0,
+                            step=10.0, key="recipe_additional_costs")
+                    with col2:
+                        if not employees_df.empty:
+                            employee_id = st.selectbox("Сотрудник",
+                                options=[None] + employees_df['id'].tolist(),
+                                format_func=lambda x: "Не указан" if x is None else employees_df[employees_df['id']==x]['name'].values[0],
+                                key="recipe_employee")
+                        else:
+                            employee_id = None
+                        production_date = st.date_input("Дата производства", value=datetime.now(), key="recipe_date")
+                        labor_hours = st.number_input("Отработано часов", min_value=0.0, value=0.0, step=0.5,
+                            key="recipe_labor_hours")
+                    
+                    if st.form_submit_button("🏭 Произвести", use_container_width=True, type="primary"):
+                        if output_quantity <= 0:
+                            st.error("Укажите количество произведенной продукции")
+                        else:
+                            result = db.produce_from_recipe(company_id, output_product_id, output_quantity, employee_id,
+                                production_date.strftime('%Y-%m-%d'), additional_costs=additional_costs,
+                                labor_hours=labor_hours)
+                            if result["success"]:
+                                st.success(f"🎉 Операция создана, себестоимость: {result['output_cost']:.2f} ₽")
+                                st.rerun()
+                            else:
+                                st.error(result['message'])
+    
+    with tab4:
+        st.subheader("📋 Потребность в материалах по плану")
+        products_df = db.get_products(company_id)
+        
+        if products_df.empty:
+            st.warning("⚠️ Сначала добавьте продукты в разделе 'Настройки'")
+        else:
+            product_labels = {row['id']: f"{row['name']} ({row['unit_name']})" for _, row in products_df.iterrows()}
+            label_to_id = {label: pid for pid, label in product_labels.items()}
+            
+            plan_df = st.data_editor(pd.DataFrame({'Продукт': pd.Series(dtype=str), 'Количество': pd.Series(dtype=float)}),
+                num_rows="dynamic", hide_index=True, use_container_width=True,
+                column_config={
+                    'Продукт': st.column_config.SelectboxColumn(options=list(product_labels.values()), required=True),
+                    'Количество': st.column_config.NumberColumn(min_value=0.0, step=1.0, required=True)
+                }, key="mrp_plan")
+            
+            if st.button("🧮 Рассчитать потребность", type="primary"):
+                plan = [{'product_id': label_to_id[row['Продукт']], 'quantity': row['Количество']}
+                        for _, row in plan_df.dropna().iterrows()]
+                if not plan:
+                    st.error("Добавьте хотя бы одну строку плана")
+                else:
+                    try:
+                        requirements = db.get_material_requirements(company_id, plan)
+                    except ValueError as e:
+                        st.error(str(e))
+                    else:
+                        shortages = requirements[requirements['shortage']]
+                        if shortages.empty:
+                            st.success("✅ Материалов достаточно для выполнения плана")
+                        else:
+                            st.error(f"⚠️ Не хватает материалов: {len(shortages)}")
+                            st.dataframe(shortages[['name', 'unit_name', 'gross_requirement', 'current_stock',
+                                                    'min_stock', 'net_requirement']],
+                                        hide_index=True, use_container_width=True)
+                        with st.expander("Полная потребность"):
+                            st.dataframe(requirements[['name', 'category_name', 'unit_name', 'level', 'gross_requirement',
+                                                       'current_stock', 'net_requirement', 'to_produce']],
+                                        hide_index=True, use_container_width=True)
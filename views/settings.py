@@ -0,0 +1,110 @@
+import streamlit as st
+import pandas as pd
+from views.common import get_units, get_categories
+
+# ========== СТРАНИЦА: НАСТРОЙКИ ==========
+def render(db, company_id, refresh_every=None):
+    st.header("⚙️ Настройки системы")
+    tab1, tab2, tab3, tab4 = st.tabs(["📦 Продукты", "👷 Сотрудники", "📋 Категории", "🔄 Синхронизация"])
+    
+    with tab1:
+        col1, col2 = st.columns([3, 2])
+        with col1:
+            products_df = db.get_products(company_id)
+            if not products_df.empty:
+                # После загрузки каталога продуктов могут быть тысячи — таблица вместо карточек
+                st.dataframe(products_df[['external_code', 'name', 'category_name', 'unit_name', 'current_stock',
+                                          'selling_price']], hide_index=True, use_container_width=True)
+            else:
+                st.info("Продукты не добавлены")
+        
+        with col2:
+            with st.form("add_product_form"):
+                name = st.text_input("Название*")
+                categories_df = get_categories(db)
+                category_id = st.selectbox("Категория*", options=categories_df['id'].tolist(),
+                    format_func=lambda x: categories_df[categories_df['id']==x]['name'].values[0])
+                units_df = get_units(db)
+                unit_id = st.selectbox("Единица*", options=units_df['id'].tolist(),
+                    format_func=lambda x: f"{units_df[units_df['id']==x]['name'].values[0]} ({units_df[units_df['id']==x]['short_name'].values[0]})")
+                description = st.text_area("Описание")
+                min_stock = st.number_input("Минимальный остаток", min_value=0.0, value=0.0, step=1.0)
+                selling_price = st.number_input("Цена продажи (₽)", min_value=0.0, value=0.0, step=0.01)
+                
+                if st.form_submit_button("➕ Добавить", use_container_width=True):
+                    if not name:
+                        st.error("Укажите название")
+                    else:
+                        product_data = {'name': name, 'category_id': category_id, 'unit_id': unit_id,
+                                       'description': description, 'min_stock': min_stock,
+                                       'current_stock': 0, 'avg_cost': 0, 'selling_price': selling_price}
+                        db.add_product(company_id, product_data)
+                        st.success(f"✅ Продукт '{name}' добавлен!")
+                        st.rerun()
+    
+    with tab2:
+        col1, col2 = st.columns([3, 2])
+        with col1:
+            employees_df = db.get_employees(company_id)
+            if not employees_df.empty:
+                for _, row in employees_df.iterrows():
+                    st.markdown(f"**{row['name']}** — {row['position']}")
+                    st.caption(f"Ставка: {row['hourly_rate']:.2f} ₽/час")
+                    st.markdown("---")
+            else:
+                st.info("Сотрудники не добавлены")
+        
+        with col2:
+            with st.form("add_employee_form"):
+                emp_name = st.text_input("ФИО*")
+                position = st.text_input("Должность")
+                hourly_rate = st.number_input("Ставка (₽/час)", min_value=0.0, value=0.0, step=0.5)
+                
+                if st.form_submit_button("➕ Добавить", use_container_width=True):
+                    if not emp_name:
+                        st.error("Укажите ФИО")
+                    else:
+                        employee_data = {'name': emp_name, 'position': position, 'hourly_rate': hourly_rate}
+                        db.add_employee(company_id, employee_data)
+                        st.success(f"✅ Сотрудник '{emp_name}' добавлен!")
+                        st.rerun()
+    
+    with tab3:
+        categories_df = get_categories(db)
+        st.markdown("**Текущие категории:**")
+        for _, cat in categories_df.iterrows():
+            st.write(f"**{cat['name']}** — {cat['type']}")
+    
+    with tab4:
+        st.subheader("🔄 Загрузка и синхронизация каталога")
+        st.caption("Строки сопоставляются по external_code: новые коды добавляются, изменившиеся обновляются, "
+                   "остальные не трогаются. Категория и единица указываются названием.")
+        col1, col2 = st.columns(2)
+        with col1:
+            products_file = st.file_uploader("Продукты: external_code, name, category, unit, description, "
+                                             "min_stock, selling_price", type=['csv', 'xlsx'], key="sync_products")
+        with col2:
+            employees_file = st.file_uploader("Сотрудники: external_code, name, position, hourly_rate",
+                                              type=['csv', 'xlsx'], key="sync_employees")
+        
+        def read_catalog(uploaded):
+            if uploaded is None:
+                return None
+            # Коды читаются строками, чтобы 0012 не превратился в 12
+            if uploaded.name.endswith('.csv'):
+                return pd.read_csv(uploaded, dtype={'external_code': str})
+            return pd.read_excel(uploaded, dtype={'external_code': str})
+        
+        if st.button("🔄 Синхронизировать", use_container_width=True, disabled=products_file is None and employees_file is None):
+            result = db.sync_catalog(company_id, read_catalog(products_file), read_catalog(employees_file))
+            if result["success"]:
+                labels = {'products': "Продукты", 'employees': "Сотрудники"}
+                for kind, label in labels.items():
+                    if kind in result:
+                        counts = result[kind]
+                        st.success(f"✅ {label}: добавлено {counts['inserted']}, обновлено {counts['updated']}, "
+                                   f"без изменений {counts['unchanged']}")
+                        if counts['rejected'] or counts['duplicates']:
+                            st.warning(f"⚠️ {label}: отклонено {counts['rejected']}, повторов кода {counts['duplicates']}")
+            else:
+                st.error(f"❌ {result['message']}")
@@ -0,0 +1,228 @@
+import streamlit as st
+import pandas as pd
+import numpy as np
+from datetime import datetime, timedelta
+import time
+from views.common import live_table
+
+# ========== СТРАНИЦА: СКЛАД ==========
+def render(db, company_id, refresh_every=None):
+    st.header("📦 Управление складом")
+    
+    tab1, tab2, tab3, tab4 = st.tabs(["📋 Остатки", "➕ Приход", "➖ Расход", "📝 Инвентаризация"])
+    
+    with tab1:
+        st.subheader("📋 Текущие остатки на складе")
+        
+        @st.fragment(run_every=refresh_every)
+        def stock_table():
+            products_df = live_table('products', load_all=lambda: db.get_products(company_id),
+                load_since=lambda since: db.get_products_changed_since(company_id, since),
+                watermark_column='updated_date', sort_by='name', overlap=timedelta(seconds=5))
+            
+            if not products_df.empty:
+                col1, col2 = st.columns(2)
+                with col1:
+                    categories = ['Все'] + products_df['category_name'].unique().tolist()
+                    selected_category = st.selectbox("Фильтр по категории:", categories)
+                with col2:
+                    show_zero = st.checkbox("Показать товары с нулевым остатком", value=True)
+                
+                filtered_df = products_df.copy()
+                if selected_category != 'Все':
+                    filtered_df = filtered_df[filtered_df['category_name'] == selected_category]
+                if not show_zero:
+                    filtered_df = filtered_df[filtered_df['current_stock'] > 0]
+                
+                filtered_df['stock_value'] = filtered_df['current_stock'] * filtered_df['avg_cost']
+                st.dataframe(filtered_df[['name', 'category_name', 'current_stock', 'unit_name', 
+                           'avg_cost', 'stock_value', 'min_stock']], hide_index=True, use_container_width=True)
+                
+                total_value = filtered_df['stock_value'].sum()
+                st.markdown(f"**Общая стоимость запасов:** {total_value:,.2f} ₽")
+            else:
+                st.info("Товары не добавлены. Перейдите в раздел 'Настройки'.")
+        
+        stock_table()
+    
+    with tab2:
+        st.subheader("➕ Оприходование товара")
+        products_df = db.get_products(company_id)
+        employees_df = db.get_employees(company_id)
+        
+        if products_df.empty:
+            st.warning("⚠️ Сначала добавьте продукты в разделе 'Настройки'")
+        else:
+            with st.form("income_form"):
+                col1, col2 = st.columns(2)
+                
+                with col1:
+                    product_id = st.selectbox("Выберите продукт*", options=products_df['id'].tolist(),
+                        format_func=lambda x: f"{products_df[products_df['id']==x]['name'].values[0]} ({products_df[products_df['id']==x]['unit_name'].values[0]})")
+                    quantity = st.number_input("Количество*", min_value=0.0, value=1.0, step=0.1)
+                    price_per_unit = st.number_input("Цена за единицу (₽)*", min_value=0.0, value=0.0, step=0.01)
+                
+                with col2:
+                    movement_date = st.date_input("Дата прихода", value=datetime.now())
+                    if not employees_df.empty:
+                        employee_id = st.selectbox("Ответственный сотрудник",
+                            options=[None] + employees_df['id'].tolist(),
+                            format_func=lambda x: "Не указан" if x is None else employees_df[employees_df['id']==x]['name'].values[0])
+                    else:
+                        employee_id = None
+                        st.info("Сотрудники не добавлены")
+                    notes = st.text_area("Примечание", placeholder="Например: Закупка у поставщика")
+                
+                total_cost = quantity * price_per_unit
+                st.markdown(f"**Итоговая стоимость:** {total_cost:.2f} ₽")
+                
+                submitted = st.form_submit_button("💾 Оприходовать", use_container_width=True)
+                
+                if submitted:
+                    if price_per_unit <= 0:
+                        st.error("Укажите цену за единицу")
+                    elif quantity <= 0:
+                        st.error("Укажите количество")
+                    else:
+                        movement_data = {
+                            'product_id': product_id, 'movement_type': 'in', 'quantity': quantity,
+                            'price_per_unit': price_per_unit, 'total_cost': total_cost,
+                            'employee_id': employee_id, 'notes': notes,
+                            'movement_date': movement_date.strftime('%Y-%m-%d')
+                        }
+                        db.submit_stock_movement(company_id, movement_data).result()
+                        st.success(f"✅ Товар успешно оприходован!")
+                        st.rerun()
+    
+    with tab3:
+        st.subheader("➖ Списание товара")
+        products_df = db.get_products(company_id)
+        employees_df = db.get_employees(company_id)
+        products_with_stock = products_df[products_df['current_stock'] > 0]
+        
+        if products_with_stock.empty:
+            st.warning("⚠️ Нет товаров для списания")
+        else:
+            product_id = st.selectbox("Выберите продукт для списания*",
+                options=products_with_stock['id'].tolist(),
+                format_func=lambda x: f"{products_with_stock[products_with_stock['id']==x]['name'].values[0]} (остаток: {products_with_stock[products_with_stock['id']==x]['current_stock'].values[0]:.2f} {products_with_stock[products_with_stock['id']==x]['unit_name'].values[0]})",
+                key="outcome_product_select")
+            
+            selected_product = products_with_stock[products_with_stock['id']==product_id].iloc[0]
+            max_quantity = selected_product['current_stock']
+            st.info(f"📦 Доступно на складе: **{max_quantity:.2f} {selected_product['unit_name']}**")
+            
+            with st.form("outcome_form"):
+                col1, col2 = st.columns(2)
+                
+                with col1:
+                    quantity = st.number_input(f"Количество для списания*", min_value=0.0,
+                        value=min(1.0, float(max_quantity)), step=0.1, help=f"Максимум: {max_quantity:.2f}")
+                    movement_date = st.date_input("Дата списания", value=datetime.now(), key="outcome_date")
+                
+                with col2:
+                    if not employees_df.empty:
+                        employee_id = st.selectbox("Ответственный сотрудник",
+                            options=[None] + employees_df['id'].tolist(),
+                            format_func=lambda x: "Не указан" if x is None else employees_df[employees_df['id']==x]['name'].values[0],
+                            key="outcome_employee")
+                    else:
+                        employee_id = None
+                    notes = st.text_area("Примечание", placeholder="Например: Продажа, списание брака", key="outcome_notes")
+                
+                submitted = st.form_submit_button("➖ Списать", use_container_width=True)
+                
+                if submitted:
+                    if quantity <= 0:
+                        st.error("Укажите количество больше 0")
+                    elif quantity > max_quantity:
+                        st.error(f"❌ Недостаточно товара! Доступно: {max_quantity:.2f}")
+                    else:
+                        movement_data = {
+                            'product_id': product_id, 'movement_type': 'out', 'quantity': quantity,
+                            'employee_id': employee_id, 'notes': notes,
+                            'movement_date': movement_date.strftime('%Y-%m-%d')
+                        }
+                        db.submit_stock_movement(company_id, movement_data).result()
+                        st.success(f"✅ Товар списан! Осталось: {max_quantity - quantity:.2f}")
+                        st.rerun()
+    
+    
+    with tab4:
+        st.subheader("📝 Инвентаризация")
+        products_df = db.get_products(company_id)
+        employees_df = db.get_employees(company_id)
+        
+        if products_df.empty:
+            st.warning("⚠️ Сначала добавьте продукты в разделе 'Настройки'")
+        else:
+            template = products_df[['id', 'name', 'unit_name', 'current_stock']].assign(counted_quantity=np.nan)
+            st.download_button("⬇️ Шаблон пересчета (CSV)", template.to_csv(index=False).encode('utf-8-sig'),
+                               file_name="inventory_count.csv", mime="text/csv")
+            
+            count_source = st.radio("Фактические остатки", ["Загрузить файл", "Ввести вручную"], horizontal=True)
+            counts_df = None
+            if count_source == "Загрузить файл":
+                uploaded = st.file_uploader("Файл пересчета (CSV или Excel): колонки id или name и counted_quantity",
+                                            type=['csv', 'xlsx'])
+                if uploaded is not None:
+                    counts_df = pd.read_csv(uploaded) if uploaded.name.endswith('.csv') else pd.read_excel(uploaded)
+                    if 'id' not in counts_df.columns and 'name' in counts_df.columns:
+                        counts_df = counts_df.merge(products_df[['id', 'name']], on='name', how='left')
+                    if 'id' not in counts_df.columns or 'counted_quantity' not in counts_df.columns:
+                        st.error("❌ В файле нужны колонки id (или name) и counted_quantity")
+                        counts_df = None
+                    else:
+                        not_found = counts_df['id'].isna() & counts_df['counted_quantity'].notna()
+                        if not_found.any():
+                            st.warning(f"⚠️ Не найдено в каталоге: {not_found.sum()} строк")
+                        counts_df = counts_df[counts_df['id'].notna()]
+            else:
+                edited = st.data_editor(template, hide_index=True, use_container_width=True,
+                                        disabled=['id', 'name', 'unit_name', 'current_stock'], key="inventory_editor",
+                                        column_config={'counted_quantity': st.column_config.NumberColumn("Факт", min_value=0.0)})
+                counts_df = edited
+            
+            if counts_df is not None:
+                counts_df = counts_df[counts_df['counted_quantity'].notna()].rename(columns={'id': 'product_id'})
+            
+            if counts_df is not None and not counts_df.empty:
+                try:
+                    differences, unknown = db.preview_inventory_count(company_id, counts_df)
+                except ValueError as e:
+                    st.error(f"❌ {e}")
+                else:
+                    adjustments = differences[differences['difference'] != 0].merge(
+                        products_df[['id', 'name', 'unit_name']], left_on='product_id', right_on='id')
+                    col1, col2, col3, col4 = st.columns(4)
+                    with col1:
+                        st.metric("Пересчитано позиций", len(differences))
+                    with col2:
+                        st.metric("Расхождений", len(adjustments))
+                    with col3:
+                        st.metric("Излишки", f"{adjustments.loc[adjustments['difference'] > 0, 'total_cost'].sum():,.2f} ₽")
+                    with col4:
+                        st.metric("Недостачи", f"{adjustments.loc[adjustments['difference'] < 0, 'total_cost'].sum():,.2f} ₽")
+                    if unknown:
+                        st.warning(f"⚠️ Не найдено в каталоге: {len(unknown)} позиций")
+                    
+                    if not adjustments.empty:
+                        st.dataframe(adjustments[['name', 'unit_name', 'current_stock', 'counted_quantity', 'difference',
+                                                  'total_cost']], hide_index=True, use_container_width=True)
+                        col1, col2 = st.columns(2)
+                        with col1:
+                            count_date = st.date_input("Дата инвентаризации", value=datetime.now(), key="inventory_date")
+                        with col2:
+                            employee_id = st.selectbox("Ответственный сотрудник",
+                                options=[None] + employees_df['id'].tolist(),
+                                format_func=lambda x: "Не указан" if x is None else employees_df[employees_df['id']==x]['name'].values[0],
+                                key="inventory_employee")
+                        if st.button("✅ Провести инвентаризацию", use_container_width=True):
+                            result = db.reconcile_inventory(company_id, counts_df, employee_id,
+                                                            count_date.strftime('%Y-%m-%d'))
+                            st.success(f"✅ Проведено корректировок: {result['adjusted']} "
+                                       f"(излишков {result['surplus']}, недостач {result['shortage']})")
+                            time.sleep(1)
+                            st.rerun()
+                    else:
+                        st.success("✅ Расхождений нет")
@@ -0,0 +1,176 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+
+from storage import execute_values
+
+_STOP = object()
+
+class GroupCommitQueue:
+    # Буферизованная запись: движения и расходы копятся в очереди и фиксируются пачками
+    # одной транзакцией, каждый вызов получает Future с id записи или ошибкой
+    def __init__(self, db, flush_interval_ms=5, max_batch=500):
+        self.db = db
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_batch = max_batch
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='group-commit-writer', daemon=True)
+        self._thread.start()
+    
+    @classmethod
+    def from_env(cls, db):
+        if os.getenv('WRITE_QUEUE_ENABLED', '').lower() not in ('1', 'true', 'yes'):
+            return None
+        return cls(db, float(os.getenv('WRITE_QUEUE_FLUSH_MS', 5)), int(os.getenv('WRITE_QUEUE_MAX_BATCH', 500)))
+    
+    def submit_movement(self, company_id, movement_data):
+        return self._submit('movement', company_id, movement_data)
+    
+    def submit_expense(self, company_id, expense_data):
+        return self._submit('expense', company_id, expense_data)
+    
+    def _submit(self, kind, company_id, data):
+        future = Future()
+        self._queue.put((kind, company_id, data, future))
+        return future
+    
+    def stop(self, timeout=None):
+        self._queue.put(_STOP)
+        self._thread.join(timeout)
+    
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+            batch = [item]
+            stopping = False
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+            self._flush(batch)
+            if stopping:
+                return
+    
+    def _flush(self, batch):
+        try:
+            ids, committed = self._write(batch)
+        except Exception as e:
+            # Одна ошибочная запись не должна ронять всю пачку: повторяем по одной
+            if len(batch) == 1:
+                batch[0][3].set_exception(e)
+            else:
+                for item in batch:
+                    self._flush([item])
+            return
+        # Метки записи ставятся до выдачи результатов: вызывающий сразу после result() читает
+        # с основной базы и видит свое движение
+        self._after_commit(*committed)
+        for item, row_id in zip(batch, ids):
+            item[3].set_result(row_id)
+    
+    def _after_commit(self, company_ids, avg_costs, alerts):
+        # Пачка уже зафиксирована: сбой кешей или уведомлений не должен приводить к повтору записи
+        for hook in (lambda: self.db._mark_write(*company_ids), lambda: self.db._avg_cost_changed(avg_costs),
+                     lambda: self.db._notify_alerts(alerts)):
+            try:
+                hook()
+            except Exception:
+                pass
+    
+    def _write(self, batch):
+        today = datetime.now().date()
+        movements = [(i, company_id, data) for i, (kind, company_id, data, _) in enumerate(batch) if kind == 'movement']
+        expenses = [(i, company_id, data) for i, (kind, company_id, data, _) in enumerate(batch) if kind == 'expense']
+        for _, _, data in movements:
+            self.db.ensure_partitions(data.get('movement_date'))
+        
+        ids = [None] * len(batch)
+        avg_costs = {}
+        alerts = []
+        conn = self.db.get_connection()
+        cursor = conn.cursor()
+        try:
+            if movements:
+                rows = execute_values(cursor, '''
+                    INSERT INTO stock_movements (company_id, product_id, movement_type, quantity, price_per_unit,
+                        total_cost, employee_id, notes, movement_date)
+                    VALUES %s RETURNING id
+                ''', [(company_id, data['product_id'], data['movement_type'], data['quantity'],
+                       data.get('price_per_unit', 0), data.get('total_cost', 0), data.get('employee_id'),
+                       data.get('notes', ''), data.get('movement_date', today))
+                      for _, company_id, data in movements], fetch=True, page_size=len(movements))
+                for (i, _, _), row in zip(movements, rows):
+                    ids[i] = row[0]
+                product_ids, avg_costs = self._apply_stock(cursor, [(company_id, data)
+                                                                    for _, company_id, data in movements])
+                alerts = self.db._sync_stock_alerts(cursor, product_ids)
+            
+            if expenses:
+                rows = execute_values(cursor, '''
+                    INSERT INTO expenses (company_id, category, description, amount, expense_date)
+                    VALUES %s RETURNING id
+                ''', [(company_id, data['category'], data.get('description', ''), data['amount'],
+                       data.get('expense_date', today))
+                      for _, company_id, data in expenses], fetch=True, page_size=len(expenses))
+                for (i, _, _), row in zip(expenses, rows):
+                    ids[i] = row[0]
+            
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+        return ids, ({company_id for _, company_id, _, _ in batch}, avg_costs, alerts)
+    
+    def _apply_stock(self, cursor, movements):
+        # Остаток и средняя себестоимость считаются по каждому товару один раз на пачку,
+        # в том же порядке, в каком движения пришли бы через add_stock_movement
+        product_ids = sorted({int(data['product_id']) for _, data in movements})
+        cursor.execute('''
+            SELECT id, company_id, current_stock, avg_cost FROM products WHERE id = ANY(%s) ORDER BY id FOR UPDATE
+        ''', (product_ids,))
+        owners = {}
+        state = {}
+        for product_id, owner_id, current_stock, avg_cost in cursor.fetchall():
+            owners[product_id] = owner_id
+            state[product_id] = [float(current_stock or 0), float(avg_cost or 0)]
+        original_costs = {product_id: avg_cost for product_id, (_, avg_cost) in state.items()}
+        
+        for company_id, data in movements:
+            # Чужой или несуществующий товар роняет пачку, и при повторе по одной ошибку получит только это движение
+            if owners.get(int(data['product_id'])) != int(company_id):
+                raise ValueError(f"Товар #{data['product_id']} не найден")
+            product = state[int(data['product_id'])]
+            quantity = float(data['quantity'])
+            if data['movement_type'] == 'in':
+                new_stock = product[0] + quantity
+                price = float(data.get('price_per_unit', 0) or 0)
+                if price > 0:
+                    old_value = product[0] * product[1]
+                    product[1] = (old_value + quantity * price) / new_stock if new_stock > 0 else 0
+                product[0] = new_stock
+            else:
+                product[0] -= quantity
+        
+        execute_values(cursor, '''
+            UPDATE products p SET current_stock = v.current_stock, avg_cost = v.avg_cost
+            FROM (VALUES %s) AS v(id, current_stock, avg_cost)
+            WHERE p.id = v.id
+        ''', [(product_id, stock, avg_cost) for product_id, (stock, avg_cost) in state.items()])
+        return product_ids, {product_id: avg_cost for product_id, (_, avg_cost) in state.items()
+                             if avg_cost != original_costs[product_id]}